@@ -1,14 +1,11 @@
+import startup_timing
 import customtkinter as ctk
 import threading
-import subprocess
+import queue
 import os
 import shutil
 import glob
 import json
-import time
-import re
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
 from datetime import datetime
 from typing import Optional, Dict, Any, List
 from tkinter import filedialog, PhotoImage, messagebox
@@ -16,8 +13,51 @@ from pathlib import Path
 import configparser
 import sys
 
+from track_pool import (
+    CANCELLED,
+    DEFAULT_CONCURRENCY,
+    DONE,
+    DOWNLOADING,
+    MAX_CONCURRENCY,
+    TrackDownloadPool,
+    TrackTask,
+    clamp_concurrency,
+)
+from ytdlp_engine import (
+    AUDIO_FORMATS,
+    AUDIO_MP3,
+    DEFAULT_FRAGMENTS,
+    ENGINE_AUTO,
+    ENGINE_CHOICES,
+    MAX_FRAGMENTS,
+    DownloadResult,
+    VideoOptions,
+    create_engine,
+    inprocess_available,
+    parse_fragments,
+)
+from job_scheduler import (
+    ACTIVE,
+    PRIORITY_BULK,
+    PRIORITY_INTERACTIVE,
+    QUEUED,
+    Job,
+    JobScheduler,
+)
+from spotify_fetch import (
+    ARTIST_DISCOGRAPHY,
+    ARTIST_TOP_TRACKS,
+    parse_source_urls,
+)
+from tool_probe import tool_version
+from throttle import parse_rate
+from stage_metrics import MetricsServer, StageMetrics, parse_port
+from converter import Converter
 
 CONFIG_FILE = "spotify_converter.cfg"
+LOG_FLUSH_MS = 50
+LOG_MAX_LINES = 2000
+LOG_BATCH_SIZE = 500
 DEFAULT_CONFIG = {
     "Spotify": {"client_id": "", "client_secret": ""},
     "Settings": {
@@ -25,6 +65,21 @@ DEFAULT_CONFIG = {
         "theme": "dark",
         "color_theme": "blue",
         "download_type": "music",
+        "concurrency": str(DEFAULT_CONCURRENCY),
+        "engine": ENGINE_AUTO,
+        "sync_playlists": "true",
+        "archive_removed": "false",
+        "pipeline": "true",
+        "audio_format": AUDIO_MP3,
+        "bandwidth_limit": "0",
+        "adaptive_concurrency": "false",
+        "artist_tracks": ARTIST_DISCOGRAPHY,
+        "metrics_port": "0",
+        "shared_store": "true",
+        "fragments": str(DEFAULT_FRAGMENTS),
+        "external_downloader": "",
+        "external_downloader_args": "",
+        "parallel_streams": "true",
     },
 }
 
@@ -44,16 +99,34 @@ class SpotifyToYouTubeConverter(ctk.CTk):
         self.spotify_client_id = self.config["Spotify"]["client_id"]
         self.spotify_client_secret = self.config["Spotify"]["client_secret"]
         self.spotify = None
+        self.engine = create_engine(
+            self.config["Settings"].get("engine", ENGINE_AUTO),
+            self.get_audio_format(),
+            self.get_bandwidth_limit(),
+            self.get_video_options(),
+        )
+        # Covers every download of the session, it is what the metrics
+        # endpoint serves.
+        self.metrics = StageMetrics(keep_tracks=False)
+        self.metrics_server: Optional[MetricsServer] = None
+
+        # Worker threads only ever enqueue log entries; the Tk thread drains
+        # them in batches so the event loop is never flooded.
+        self.log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        self.progress_marks: Dict[str, str] = {}
+        self.progress_mark_count = 0
+
+        # Single downloads and playlist conversions run side by side and
+        # share the configured number of download slots.
+        self.scheduler = JobScheduler(self.get_concurrency())
+        self.job_rows: Dict[int, Any] = {}
+        self.jobs_version = -1
+        self.setup_lock = threading.Lock()
 
         self.setup_ui()
+        self.after(LOG_FLUSH_MS, self.flush_logs)
 
-        if self.spotify_client_id and self.spotify_client_secret:
-            self.initialize_spotify_client()
-
-        self.download_thread: Optional[threading.Thread] = None
-        self.current_process: Optional[subprocess.Popen] = None
         self.active_downloads: Dict[str, Any] = {}
-        self.stop_requested = False
 
     def load_config(self) -> configparser.ConfigParser:
 
@@ -101,7 +174,7 @@ class SpotifyToYouTubeConverter(ctk.CTk):
         self.resizable(True, True)
 
         self.grid_columnconfigure(0, weight=1)
-        self.grid_rowconfigure(3, weight=1)
+        self.grid_rowconfigure(4, weight=1)
 
         self.tabview = ctk.CTkTabview(self)
         self.tabview.grid(row=0, column=0, padx=20, pady=(20, 0), sticky="nsew")
@@ -113,8 +186,15 @@ class SpotifyToYouTubeConverter(ctk.CTk):
 
         self.setup_spotify_playlist_tab()
 
+        self.jobs_frame = ctk.CTkScrollableFrame(self, height=70, label_text="Jobs")
+        self.jobs_frame.grid(row=1, column=0, padx=20, pady=(10, 0), sticky="ew")
+        self.no_jobs_label = ctk.CTkLabel(
+            self.jobs_frame, text="No queued or active downloads", text_color="gray"
+        )
+        self.no_jobs_label.pack(anchor="w")
+
         self.progress_box = ctk.CTkTextbox(self, wrap="word")
-        self.progress_box.grid(row=1, column=0, padx=20, pady=(10, 0), sticky="nsew")
+        self.progress_box.grid(row=2, column=0, padx=20, pady=(10, 0), sticky="nsew")
 
         self.progress_box.insert("end", "Spotify to YouTube Music Converter     \n")
 
@@ -127,6 +207,7 @@ class SpotifyToYouTubeConverter(ctk.CTk):
                 "end", "⚠️ Warning: Spotify API credentials not configured\n"
             )
 
+        self.progress_box.insert("end", f"Download engine: {self.engine.name}\n")
         self.progress_box.insert("end", "\n")
         self.progress_box.configure(state="disabled")
 
@@ -138,10 +219,10 @@ class SpotifyToYouTubeConverter(ctk.CTk):
         self.progress_box.tag_config("log_important", foreground="#f1c40f")
 
         self.status_bar = ctk.CTkLabel(self, text="Ready", anchor="w")
-        self.status_bar.grid(row=2, column=0, padx=20, pady=(0, 20), sticky="ew")
+        self.status_bar.grid(row=3, column=0, padx=20, pady=(0, 20), sticky="ew")
 
         self.button_frame = ctk.CTkFrame(self)
-        self.button_frame.grid(row=3, column=0, padx=20, pady=(0, 20), sticky="ew")
+        self.button_frame.grid(row=4, column=0, padx=20, pady=(0, 20), sticky="ew")
 
         self.stop_button = ctk.CTkButton(
             self.button_frame,
@@ -194,7 +275,7 @@ class SpotifyToYouTubeConverter(ctk.CTk):
         )
         ctk.CTkRadioButton(
             self.options_frame,
-            text="🎵 Music (MP3)",
+            text=f"🎵 Music ({self.get_audio_format().upper()})",
             variable=self.download_type,
             value="music",
             command=self.save_download_type,
@@ -235,7 +316,7 @@ class SpotifyToYouTubeConverter(ctk.CTk):
 
         self.playlist_entry = ctk.CTkEntry(
             self.playlist_frame,
-            placeholder_text="Enter Spotify Playlist URL",
+            placeholder_text="Enter Spotify playlist, album or artist URLs",
             height=35,
         )
         self.playlist_entry.pack(side="left", fill="x", expand=True, padx=(0, 10))
@@ -312,6 +393,36 @@ class SpotifyToYouTubeConverter(ctk.CTk):
 
     def log(self, message: str, level: str = "info"):
 
+        self.log_queue.put(("line", None, message, level))
+
+    def log_progress(self, key: str, message: str, done: bool = False):
+
+        self.log_queue.put(("progress", key, message, "info"))
+        if done:
+            self.log_queue.put(("end", key, None, None))
+
+    def flush_logs(self):
+
+        entries = []
+        try:
+            while len(entries) < LOG_BATCH_SIZE:
+                entries.append(self.log_queue.get_nowait())
+        except queue.Empty:
+            pass
+
+        try:
+            if entries:
+                self.write_log_entries(entries)
+            self.refresh_jobs()
+        finally:
+            self.after(LOG_FLUSH_MS, self.flush_logs)
+
+    def write_log_entries(self, entries: List[Any]):
+
+        # Only the newest progress tick of each track in a batch is drawn.
+        latest = {
+            entry[1]: i for i, entry in enumerate(entries) if entry[0] == "progress"
+        }
         timestamp = datetime.now().strftime("%H:%M:%S")
         level_icons = {
             "info": "ℹ️",
@@ -320,20 +431,120 @@ class SpotifyToYouTubeConverter(ctk.CTk):
             "error": "❌",
             "debug": "🐛",
         }
-
-        icon = level_icons.get(level, "ℹ️")
-        tag = f"log_{level}"
+        status = None
 
         self.progress_box.configure(state="normal")
-        self.progress_box.insert("end", f"[{timestamp}] {icon} {message}\n", tag)
+        for i, (kind, key, message, level) in enumerate(entries):
+            if kind == "source":
+                self.write_source(message)
+                continue
+            if kind == "end":
+                mark = self.progress_marks.pop(key, None)
+                if mark:
+                    self.progress_box.mark_unset(mark)
+                continue
+            if kind == "progress" and latest[key] != i:
+                continue
+
+            icon = level_icons.get(level, "ℹ️")
+            line = f"[{timestamp}] {icon} {message}"
+            mark = self.progress_marks.get(key) if kind == "progress" else None
+
+            if mark:
+                self.progress_box.delete(mark, f"{mark} lineend")
+                self.progress_box.insert(mark, line, f"log_{level}")
+                continue
+
+            if kind == "progress":
+                self.progress_mark_count += 1
+                mark = f"progress_{self.progress_mark_count}"
+                self.progress_box.mark_set(mark, "end-1c")
+                self.progress_box.mark_gravity(mark, "left")
+                self.progress_marks[key] = mark
+            self.progress_box.insert("end", f"{line}\n", f"log_{level}")
+
+            if level in ("success", "error", "warning"):
+                status = message
+
+        self.trim_logs()
         self.progress_box.see("end")
         self.progress_box.configure(state="disabled")
 
-        if level in ("success", "error", "warning"):
-            self.status_bar.configure(text=message)
+        if status is not None:
+            self.status_bar.configure(text=status)
+
+    def refresh_jobs(self):
+
+        if self.scheduler.version == self.jobs_version:
+            return
+        self.jobs_version = self.scheduler.version
+
+        jobs = self.scheduler.jobs()
+        numbers = {job.number for job in jobs}
+        for number in list(self.job_rows):
+            if number not in numbers:
+                self.job_rows.pop(number)[0].destroy()
+
+        for job in jobs:
+            row = self.job_rows.get(job.number)
+            if row is None:
+                frame = ctk.CTkFrame(self.jobs_frame, fg_color="transparent")
+                frame.pack(fill="x")
+                label = ctk.CTkLabel(frame, anchor="w")
+                label.pack(side="left", fill="x", expand=True)
+                ctk.CTkButton(
+                    frame,
+                    text="✖",
+                    width=30,
+                    fg_color="#e74c3c",
+                    hover_color="#c0392b",
+                    command=lambda job=job: self.cancel_job(job),
+                ).pack(side="right")
+                row = self.job_rows[job.number] = (frame, label)
+            row[1].configure(text=self.describe_job(job))
+
+        if jobs:
+            self.no_jobs_label.pack_forget()
+        else:
+            self.no_jobs_label.pack(anchor="w")
+        self.stop_button.configure(state="normal" if jobs else "disabled")
+
+    def describe_job(self, job: Job) -> str:
+
+        if job.cancelled:
+            status = "⏹ cancelling"
+        elif job.state == ACTIVE:
+            status = f"▶ {job.active} downloading"
+        elif job.state == QUEUED:
+            status = "⏳ queued"
+        else:
+            status = job.state
+        return f"#{job.number}  {job.label}  ({status})"
+
+    def cancel_job(self, job: Job):
+
+        if not job.cancelled:
+            self.log(f"Cancelling job #{job.number}: {job.label}", "warning")
+            self.scheduler.cancel(job)
+
+    def trim_logs(self):
+
+        excess = int(self.progress_box.index("end-1c").split(".")[0]) - LOG_MAX_LINES
+        if excess <= 0:
+            return
+
+        for key, mark in list(self.progress_marks.items()):
+            if int(self.progress_box.index(mark).split(".")[0]) <= excess:
+                self.progress_box.mark_unset(mark)
+                del self.progress_marks[key]
+        self.progress_box.delete("1.0", f"{excess + 1}.0")
 
     def clear_logs(self):
 
+        for mark in self.progress_marks.values():
+            self.progress_box.mark_unset(mark)
+        self.progress_marks.clear()
+
         self.progress_box.configure(state="normal")
         self.progress_box.delete("1.0", "end")
         self.progress_box.insert("end", "Spotify to YouTube Music Converter     \n")
@@ -351,7 +562,7 @@ class SpotifyToYouTubeConverter(ctk.CTk):
 
         self.settings_window = ctk.CTkToplevel(self)
         self.settings_window.title("Settings")
-        self.settings_window.geometry("500x400")
+        self.settings_window.geometry("500x1040")
         self.settings_window.resizable(False, False)
         self.settings_window.attributes("-topmost", True)
         self.settings_window.protocol("WM_DELETE_WINDOW", self.on_settings_close)
@@ -405,6 +616,146 @@ class SpotifyToYouTubeConverter(ctk.CTk):
         )
         color_theme_menu.pack(fill="x", pady=(0, 10))
 
+        performance_frame = ctk.CTkFrame(self.settings_window)
+        performance_frame.pack(pady=10, padx=20, fill="x")
+
+        ctk.CTkLabel(
+            performance_frame,
+            text="⚡ Performance",
+            font=ctk.CTkFont(size=14, weight="bold"),
+        ).pack(pady=(0, 10))
+
+        ctk.CTkLabel(performance_frame, text="Parallel playlist downloads:").pack(
+            anchor="w"
+        )
+        self.concurrency_var = ctk.StringVar(value=str(self.get_concurrency()))
+        concurrency_menu = ctk.CTkOptionMenu(
+            performance_frame,
+            values=[str(n) for n in range(1, MAX_CONCURRENCY + 1)],
+            variable=self.concurrency_var,
+        )
+        concurrency_menu.pack(fill="x", pady=(0, 10))
+
+        ctk.CTkLabel(performance_frame, text="Download engine:").pack(anchor="w")
+        self.engine_var = ctk.StringVar(
+            value=self.config["Settings"].get("engine", ENGINE_AUTO)
+        )
+        engine_menu = ctk.CTkOptionMenu(
+            performance_frame,
+            values=ENGINE_CHOICES,
+            variable=self.engine_var,
+        )
+        engine_menu.pack(fill="x", pady=(0, 10))
+
+        ctk.CTkLabel(
+            performance_frame, text="Audio format (non-mp3 formats skip re-encoding):"
+        ).pack(anchor="w")
+        self.audio_format_var = ctk.StringVar(value=self.get_audio_format())
+        audio_format_menu = ctk.CTkOptionMenu(
+            performance_frame,
+            values=AUDIO_FORMATS,
+            variable=self.audio_format_var,
+        )
+        audio_format_menu.pack(fill="x", pady=(0, 10))
+
+        ctk.CTkLabel(
+            performance_frame, text="Bandwidth limit (e.g. 2M, 500K, 0 = unlimited):"
+        ).pack(anchor="w")
+        self.bandwidth_entry = ctk.CTkEntry(performance_frame)
+        self.bandwidth_entry.pack(fill="x", pady=(0, 10))
+        self.bandwidth_entry.insert(
+            0, self.config["Settings"].get("bandwidth_limit", "0")
+        )
+
+        self.adaptive_var = ctk.BooleanVar(
+            value=self.config["Settings"].getboolean(
+                "adaptive_concurrency", fallback=False
+            )
+        )
+        ctk.CTkCheckBox(
+            performance_frame,
+            text="Adjust parallel downloads to the measured throughput",
+            variable=self.adaptive_var,
+        ).pack(anchor="w", pady=(0, 10))
+
+        ctk.CTkLabel(
+            performance_frame,
+            text="Video fragments at once / external downloader (e.g. aria2c):",
+        ).pack(anchor="w")
+        video_row = ctk.CTkFrame(performance_frame, fg_color="transparent")
+        video_row.pack(fill="x", pady=(0, 5))
+        self.fragments_var = ctk.StringVar(
+            value=str(parse_fragments(self.config["Settings"].get("fragments")))
+        )
+        ctk.CTkOptionMenu(
+            video_row,
+            values=[str(n) for n in range(1, MAX_FRAGMENTS + 1)],
+            variable=self.fragments_var,
+            width=80,
+        ).pack(side="left", padx=(0, 10))
+        self.downloader_entry = ctk.CTkEntry(
+            video_row, placeholder_text="built-in downloader"
+        )
+        self.downloader_entry.pack(side="left", fill="x", expand=True)
+        downloader = self.config["Settings"].get("external_downloader", "")
+        if downloader:
+            self.downloader_entry.insert(0, downloader)
+
+        self.parallel_streams_var = ctk.BooleanVar(
+            value=self.config["Settings"].getboolean("parallel_streams", fallback=True)
+        )
+        ctk.CTkCheckBox(
+            performance_frame,
+            text="Download video and audio streams at the same time",
+            variable=self.parallel_streams_var,
+        ).pack(anchor="w", pady=(0, 10))
+
+        sync_frame = ctk.CTkFrame(self.settings_window)
+        sync_frame.pack(pady=10, padx=20, fill="x")
+
+        ctk.CTkLabel(
+            sync_frame,
+            text="🔄 Playlist Sync",
+            font=ctk.CTkFont(size=14, weight="bold"),
+        ).pack(pady=(0, 10))
+
+        self.sync_var = ctk.BooleanVar(
+            value=self.config["Settings"].getboolean("sync_playlists", fallback=True)
+        )
+        ctk.CTkCheckBox(
+            sync_frame,
+            text="Skip playlists unchanged since the last sync",
+            variable=self.sync_var,
+        ).pack(anchor="w", pady=(0, 5))
+
+        self.archive_var = ctk.BooleanVar(
+            value=self.config["Settings"].getboolean("archive_removed", fallback=False)
+        )
+        ctk.CTkCheckBox(
+            sync_frame,
+            text="Move tracks removed from a playlist to _archive",
+            variable=self.archive_var,
+        ).pack(anchor="w", pady=(0, 5))
+
+        self.shared_store_var = ctk.BooleanVar(
+            value=self.config["Settings"].getboolean("shared_store", fallback=True)
+        )
+        ctk.CTkCheckBox(
+            sync_frame,
+            text="Download each track once and link it into every playlist",
+            variable=self.shared_store_var,
+        ).pack(anchor="w", pady=(0, 10))
+
+        ctk.CTkLabel(sync_frame, text="Artist URLs download:").pack(anchor="w")
+        self.artist_tracks_var = ctk.StringVar(
+            value=self.config["Settings"].get("artist_tracks", ARTIST_DISCOGRAPHY)
+        )
+        ctk.CTkOptionMenu(
+            sync_frame,
+            values=[ARTIST_DISCOGRAPHY, ARTIST_TOP_TRACKS],
+            variable=self.artist_tracks_var,
+        ).pack(fill="x", pady=(0, 10))
+
         save_btn = ctk.CTkButton(
             self.settings_window,
             text="💾 Save Settings",
@@ -434,6 +785,10 @@ class SpotifyToYouTubeConverter(ctk.CTk):
         client_secret = self.client_secret_entry.get().strip()
         theme = self.theme_var.get()
         color_theme = self.color_theme_var.get()
+        concurrency = clamp_concurrency(self.concurrency_var.get())
+        engine = self.engine_var.get()
+        audio_format = self.audio_format_var.get()
+        bandwidth_limit = self.bandwidth_entry.get().strip() or "0"
 
         if not client_id or not client_secret:
             messagebox.showerror(
@@ -445,6 +800,26 @@ class SpotifyToYouTubeConverter(ctk.CTk):
         self.config["Spotify"]["client_secret"] = client_secret
         self.config["Settings"]["theme"] = theme
         self.config["Settings"]["color_theme"] = color_theme
+        self.config["Settings"]["concurrency"] = str(concurrency)
+        self.config["Settings"]["engine"] = engine
+        self.config["Settings"]["audio_format"] = audio_format
+        self.config["Settings"]["bandwidth_limit"] = bandwidth_limit
+        self.config["Settings"]["adaptive_concurrency"] = str(
+            self.adaptive_var.get()
+        ).lower()
+        self.config["Settings"]["fragments"] = self.fragments_var.get()
+        self.config["Settings"][
+            "external_downloader"
+        ] = self.downloader_entry.get().strip()
+        self.config["Settings"]["parallel_streams"] = str(
+            self.parallel_streams_var.get()
+        ).lower()
+        self.config["Settings"]["sync_playlists"] = str(self.sync_var.get()).lower()
+        self.config["Settings"]["archive_removed"] = str(self.archive_var.get()).lower()
+        self.config["Settings"]["shared_store"] = str(
+            self.shared_store_var.get()
+        ).lower()
+        self.config["Settings"]["artist_tracks"] = self.artist_tracks_var.get()
 
         if self.save_config():
 
@@ -454,6 +829,15 @@ class SpotifyToYouTubeConverter(ctk.CTk):
             ctk.set_appearance_mode(theme)
             ctk.set_default_color_theme(color_theme)
 
+            self.engine = create_engine(
+                engine,
+                audio_format,
+                self.get_bandwidth_limit(),
+                self.get_video_options(),
+            )
+            self.scheduler.set_slots(concurrency)
+            self.log(f"Download engine: {self.engine.name}", "info")
+
             self.initialize_spotify_client()
 
             self.log("Settings saved and applied successfully", "success")
@@ -461,367 +845,224 @@ class SpotifyToYouTubeConverter(ctk.CTk):
         else:
             messagebox.showerror("Error", "Failed to save settings!")
 
+    def get_audio_format(self) -> str:
+
+        audio_format = self.config["Settings"].get("audio_format", AUDIO_MP3)
+        return audio_format if audio_format in AUDIO_FORMATS else AUDIO_MP3
+
+    def get_video_options(self) -> VideoOptions:
+
+        settings = self.config["Settings"]
+        return VideoOptions(
+            parse_fragments(settings.get("fragments")),
+            settings.get("external_downloader", ""),
+            settings.get("external_downloader_args", ""),
+            settings.getboolean("parallel_streams", fallback=True),
+        )
+
+    def get_bandwidth_limit(self) -> float:
+
+        return parse_rate(self.config["Settings"].get("bandwidth_limit"))
+
+    def get_concurrency(self) -> int:
+
+        return clamp_concurrency(
+            self.config["Settings"].get("concurrency", DEFAULT_CONCURRENCY)
+        )
+
+    def start_metrics_server(self):
+
+        port = parse_port(self.config["Settings"].get("metrics_port"))
+        if self.metrics_server is not None or not port:
+            return
+        try:
+            self.metrics_server = MetricsServer(self.metrics, port)
+            self.log(f"Serving metrics at {self.metrics_server.url}", "info")
+        except OSError as e:
+            self.log(f"Metrics endpoint unavailable: {str(e)}", "warning")
+
     def initialize_spotify_client(self):
 
+        from spotify_client import create_spotify_client
+
         try:
             if not self.spotify_client_id or not self.spotify_client_secret:
                 self.log("Spotify credentials not configured", "warning")
                 return
 
-            auth_manager = SpotifyClientCredentials(
-                client_id=self.spotify_client_id,
-                client_secret=self.spotify_client_secret,
+            self.spotify = create_spotify_client(
+                self.spotify_client_id, self.spotify_client_secret, CONFIG_FILE
             )
-            self.spotify = spotipy.Spotify(auth_manager=auth_manager)
             self.log("Spotify client initialized successfully", "success")
         except Exception as e:
             self.log(f"Failed to initialize Spotify client: {str(e)}", "error")
             self.spotify = None
 
-    def start_single_download(self):
+    def start_single_download(self) -> Optional[Job]:
 
         url = self.url_entry.get().strip()
         if not url:
             self.log("Please enter a valid URL.", "error")
-            return
-
-        if self.download_thread and self.download_thread.is_alive():
-            self.log("A download is already in progress.", "warning")
-            return
-
-        self.download_button.configure(state="disabled")
-        self.stop_button.configure(state="normal")
-
-        self.download_thread = threading.Thread(
-            target=self.download_single, args=(url,), daemon=True
+            return None
+
+        download_type = self.download_type.get()
+        output_path = self.output_path.get()
+        return self.scheduler.submit(
+            f"{download_type.capitalize()}: {url}",
+            lambda job: self.download_single(job, url, download_type, output_path),
+            PRIORITY_INTERACTIVE,
         )
-        self.download_thread.start()
 
-    def start_playlist_conversion(self):
+    def start_playlist_conversion(self) -> Optional[Job]:
 
         playlist_url = self.playlist_entry.get().strip()
         if not playlist_url:
-            self.log("Please enter a valid Spotify playlist URL.", "error")
-            return
+            self.log("Please enter a Spotify playlist, album or artist URL.", "error")
+            return None
 
-        if not self.spotify:
+        if not (self.spotify_client_id and self.spotify_client_secret):
             self.log(
                 "Spotify client not initialized. Please check your API credentials in Settings.",
                 "error",
             )
-            return
-
-        if self.download_thread and self.download_thread.is_alive():
-            self.log("A download is already in progress.", "warning")
-            return
+            return None
 
-        self.convert_button.configure(state="disabled")
-        self.stop_button.configure(state="normal")
-
-        self.download_thread = threading.Thread(
-            target=self.convert_spotify_playlist, args=(playlist_url,), daemon=True
+        return self.scheduler.submit(
+            f"Spotify: {playlist_url}",
+            lambda job: self.convert_spotify_urls(job, playlist_url),
+            PRIORITY_BULK,
         )
-        self.download_thread.start()
 
-    def download_single(self, url: str):
+    def download_single(
+        self, job: Job, url: str, download_type: str, output_path: str
+    ) -> bool:
 
         try:
-            download_type = self.download_type.get()
-            output_path = self.output_path.get()
-
             if not os.path.exists(output_path):
-                os.makedirs(output_path)
+                os.makedirs(output_path, exist_ok=True)
                 self.log(f"Created output directory: {output_path}", "info")
 
-            output_template = os.path.join(output_path, "%(title)s.%(ext)s")
-
-            command = [
-                "yt-dlp",
-                "--newline",
-                "--progress-template",
-                "json",
-                "--no-playlist",
-                "-o",
-                output_template,
-            ]
-
-            if download_type == "music":
-                command.extend(
-                    [
-                        "-x",
-                        "--audio-format",
-                        "mp3",
-                        "--audio-quality",
-                        "192K",
-                        "--embed-thumbnail",
-                        "--add-metadata",
-                        "--embed-metadata",
-                        "--metadata-from-title",
-                        "%(artist)s - %(title)s",
-                        "--prefer-ffmpeg",
-                    ]
-                )
-            else:
-                command.extend(
-                    [
-                        "-f",
-                        "bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best",
-                        "--merge-output-format",
-                        "mp4",
-                    ]
+            is_video = download_type != "music"
+
+            def download(task: TrackTask, pool: TrackDownloadPool) -> DownloadResult:
+                pool.set_state(task, DOWNLOADING)
+                return self.engine.download(
+                    task.query,
+                    task.output_path,
+                    is_video=is_video,
+                    on_line=self.parse_progress,
+                    on_progress=self.handle_progress_data,
+                    pool=pool,
                 )
 
-            command.append(url)
-
-            self.current_process = subprocess.Popen(
-                command,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                bufsize=1,
-                universal_newlines=True,
-                encoding="utf-8",
-                errors="replace",
+            pool = TrackDownloadPool(
+                download,
+                concurrency=1,
+                metrics=self.metrics,
+                gate=job,
             )
+            job.attach(pool)
+            results = pool.run([TrackTask(1, url, output_path)])
 
-            for line in self.current_process.stdout:
-                self.parse_progress(line.strip())
-
-            return_code = self.current_process.wait()
-
-            if return_code == 0:
+            if results[0].state == DONE:
                 self.log("Download completed successfully", "success")
-                if download_type == "music":
+                if download_type == "music" and self.get_audio_format() == AUDIO_MP3:
                     self.post_process_mp3s(output_path)
+            elif results[0].state == CANCELLED:
+                self.log("Download cancelled", "warning")
             else:
-                self.log(f"Download failed with return code {return_code}", "error")
+                self.log(
+                    f"Download failed: {results[0].error or 'yt-dlp reported an error'}",
+                    "error",
+                )
+
+            return results[0].state == DONE
 
         except Exception as e:
             self.log(f"Error during download: {str(e)}", "error")
-        finally:
-            self.current_process = None
-            self.after(0, lambda: self.download_button.configure(state="normal"))
-            self.after(0, lambda: self.convert_button.configure(state="normal"))
-            self.after(0, lambda: self.stop_button.configure(state="disabled"))
-
-    def extract_spotify_playlist_id(self, url: str) -> Optional[str]:
-
-        patterns = [
-            r"open\.spotify\.com/playlist/([a-zA-Z0-9]+)",
-            r"spotify:playlist:([a-zA-Z0-9]+)",
-        ]
-
-        for pattern in patterns:
-            match = re.search(pattern, url)
-            if match:
-                return match.group(1)
-
-        return None
-
-    def convert_spotify_playlist(self, playlist_url: str):
+            return False
 
-        try:
-            self.stop_requested = False
+    def convert_spotify_urls(self, job: Job, text: str):
 
-            playlist_id = self.extract_spotify_playlist_id(playlist_url)
-            if not playlist_id:
-                self.log("Invalid Spotify playlist URL", "error")
-                return
+        sources = parse_source_urls(text)
+        if not sources:
+            self.log("Invalid Spotify playlist, album or artist URL", "error")
+            return False
 
+        # Jobs may start together, the shared clients are set up only once.
+        with self.setup_lock:
+            if self.spotify is None:
+                self.initialize_spotify_client()
+                if self.spotify is None:
+                    return False
+            self.start_metrics_server()
+
+        converter = Converter(
+            self.engine,
+            self.config["Settings"],
+            self.spotify,
+            log=self.log,
+            on_line=self.parse_progress,
+            on_progress=self.handle_progress_data,
+            on_event=lambda name, fields: self.show_source(job, name, fields),
+            on_pool=job.attach,
+            metrics=self.metrics,
+            gate=job,
+        )
+        for kind, source_id in sources:
+            if job.cancelled:
+                break
             try:
-
-                playlist = self.spotify.playlist(playlist_id)
-            except spotipy.SpotifyException as e:
-                if e.http_status == 404:
-                    self.log(
-                        "Playlist not found. It may be private or deleted.", "error"
-                    )
-                elif e.http_status == 403:
-                    self.log(
-                        "Access denied. Check your Spotify API credentials.", "error"
-                    )
-                else:
-                    self.log(f"Spotify API error: {str(e)}", "error")
-                return
+                self.convert_spotify_source(job, converter, kind, source_id)
             except Exception as e:
-                self.log(f"Error accessing playlist: {str(e)}", "error")
-                return
+                self.log(f"Error during {kind} conversion: {str(e)}", "error")
 
-            playlist = self.spotify.playlist(playlist_id)
-            playlist_name = playlist.get("name", "Unknown Playlist")
-            owner = playlist.get("owner", {}).get("display_name", "Unknown")
-            total_tracks = playlist.get("tracks", {}).get("total", 0)
+    def convert_spotify_source(
+        self, job: Job, converter: Converter, kind: str, source_id: str
+    ):
 
-            self.after(
-                0,
-                lambda: self.playlist_name_label.configure(
-                    text=f"📋 Playlist: {playlist_name}"
-                ),
-            )
-            self.after(0, lambda: self.owner_label.configure(text=f"👤 Owner: {owner}"))
-            self.after(
-                0,
-                lambda: self.track_count_label.configure(
-                    text=f"🎵 Tracks: {total_tracks}"
-                ),
-            )
+        import spotipy
 
-            self.log(f"Converting playlist: {playlist_name}", "info")
-            self.log(f"Owner: {owner}", "info")
-            self.log(f"Total tracks: {total_tracks}", "info")
-
-            output_path = os.path.join(
-                self.output_path.get(), self.sanitize_filename(playlist_name)
-            )
-            if not os.path.exists(output_path):
-                os.makedirs(output_path)
-                self.log(f"Created playlist directory: {output_path}", "info")
-
-            results = self.spotify.playlist_tracks(playlist_id)
-            tracks = results.get("items", [])
-
-            while results.get("next"):
-                results = self.spotify.next(results)
-                tracks.extend(results.get("items", []))
-
-            success_count = 0
-
-            for i, item in enumerate(tracks, 1):
-                if self.stop_requested:
-                    self.log(
-                        f"\nDownload stopped by user after {success_count} tracks",
-                        "warning",
-                    )
-                    break
-
-                track = item.get("track", {})
-                if not track:
-                    continue
-
-                track_name = track.get("name", "Unknown Track")
-                artists = ", ".join(
-                    [artist["name"] for artist in track.get("artists", [])]
-                )
-
-                self.log(
-                    f"\nDownloading track {i}/{len(tracks)}: {artists} - {track_name}",
-                    "info",
-                )
-
-                expected_filename = f"{artists} - {track_name}.mp3"
-                expected_path = os.path.join(
-                    output_path, self.sanitize_filename(expected_filename)
-                )
-                if os.path.exists(expected_path):
-                    self.log(
-                        f"Track already exists, skipping: {expected_filename}", "info"
-                    )
-                    success_count += 1
-                    continue
-
-                if self.download_from_search(f"{artists} {track_name}", output_path):
-                    success_count += 1
-
-            if success_count == len(tracks):
+        try:
+            result = converter.convert_source(kind, source_id, self.output_path.get())
+        except spotipy.SpotifyException as e:
+            if e.http_status == 404:
                 self.log(
-                    f"\n🎉 Playlist conversion complete: {success_count} tracks downloaded",
-                    "success",
+                    f"{kind.capitalize()} not found. It may be private or deleted.",
+                    "error",
                 )
+            elif e.http_status == 403:
+                self.log("Access denied. Check your Spotify API credentials.", "error")
             else:
-                self.log(
-                    f"\n⚠️ Partial conversion: {success_count} of {len(tracks)} tracks downloaded",
-                    "warning",
-                )
-
-        except Exception as e:
-            self.log(f"Error during playlist conversion: {str(e)}", "error")
-        finally:
-            self.stop_requested = False
-            self.current_process = None
-            self.after(0, lambda: self.convert_button.configure(state="normal"))
-            self.after(0, lambda: self.stop_button.configure(state="disabled"))
-
-    def download_from_search(self, search_query: str, output_path: str) -> bool:
+                self.log(f"Spotify API error: {str(e)}", "error")
+            return
 
-        try:
-            output_template = os.path.join(output_path, "%(title)s.%(ext)s")
-
-            command = [
-                "yt-dlp",
-                "--newline",
-                "--progress-template",
-                "json",
-                "--no-playlist",
-                "-x",
-                "--audio-format",
-                "mp3",
-                "--audio-quality",
-                "192K",
-                "--embed-thumbnail",
-                "--add-metadata",
-                "--embed-metadata",
-                "--parse-metadata",
-                "title:%(artist)s - %(title)s",
-                "--prefer-ffmpeg",
-                "-o",
-                output_template,
-                f"ytsearch1:{search_query} official audio",
-            ]
-
-            self.log(f"Searching for: {search_query}", "debug")
-            self.log(f"Executing command: {' '.join(command)}", "debug")
-
-            self.current_process = subprocess.Popen(
-                command,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                bufsize=1,
-                universal_newlines=True,
-                encoding="utf-8",
-                errors="replace",
+        if result.cancelled:
+            self.log(
+                f"Download stopped by user after {result.downloaded} tracks",
+                "warning",
             )
 
-            for line in self.current_process.stdout:
-                self.parse_progress(line.strip())
-
-            return_code = self.current_process.wait()
+    def show_source(self, job: Job, name: str, fields: Dict[str, Any]):
 
-            if return_code == 0:
-                self.log("Track downloaded successfully", "success")
-                return True
-            else:
-                self.log(
-                    f"Track download failed with return code {return_code}", "error"
-                )
-                return False
-
-        except Exception as e:
-            self.log(f"Error during track download: {str(e)}", "error")
-            return False
+        if name != "source":
+            return
+        self.scheduler.rename(job, f"{fields['kind'].capitalize()}: {fields['name']}")
+        # Drawn by flush_logs on the UI thread, like the log lines.
+        self.log_queue.put(("source", None, fields, None))
 
-    def sanitize_filename(self, filename: str) -> str:
+    def write_source(self, fields: Dict[str, Any]):
 
-        return re.sub(r'[\\/*?:"<>|]', "_", filename)
+        kind = fields["kind"].capitalize()
+        self.playlist_name_label.configure(text=f"📋 {kind}: {fields['name']}")
+        self.owner_label.configure(text=f"👤 Owner: {fields['owner']}")
+        self.track_count_label.configure(text=f"🎵 Tracks: {fields['total']}")
 
     def stop_download(self):
 
-        self.stop_requested = True
-        if self.current_process:
-            self.log("Stopping download process...", "warning")
-            try:
-                self.current_process.terminate()
-                time.sleep(1)
-                if self.current_process.poll() is None:
-                    self.current_process.kill()
-                self.log("Download stopped by user", "warning")
-            except Exception as e:
-                self.log(f"Error stopping process: {str(e)}", "error")
-            finally:
-                self.current_process = None
-                self.after(0, lambda: self.download_button.configure(state="normal"))
-                self.after(0, lambda: self.convert_button.configure(state="normal"))
-                self.after(0, lambda: self.stop_button.configure(state="disabled"))
+        if self.scheduler.jobs():
+            self.log("Stopping all queued and active downloads...", "warning")
+            self.scheduler.cancel_all()
 
     def parse_progress(self, line: str):
 
@@ -841,7 +1082,7 @@ class SpotifyToYouTubeConverter(ctk.CTk):
                 self.log(line, "error")
             elif "WARNING" in line:
                 self.log(line, "warning")
-            elif "Downloading" in line or "Merging" in line:
+            elif "Downloading" in line or "Merging" in line or " stream: " in line:
                 self.log(line, "info")
             else:
                 self.log(line, "debug")
@@ -854,20 +1095,24 @@ class SpotifyToYouTubeConverter(ctk.CTk):
         if "status" in data:
             status = data["status"]
 
+            # Ticks for the same file are coalesced into one updating line.
+            key = data.get("filename") or threading.current_thread().name
+
             if status == "downloading":
                 progress = data.get("progress", {})
                 percent = progress.get("percent", 0)
                 speed = progress.get("speed", "N/A")
                 eta = progress.get("eta", "N/A")
 
-                self.log(
-                    f"Downloading: {percent:.1f}% complete | "
+                self.log_progress(
+                    key,
+                    f"Downloading {os.path.basename(key)}: {percent:.1f}% complete | "
                     f"Speed: {self.format_speed(speed)} | "
                     f"ETA: {self.format_eta(eta)}",
-                    "info",
                 )
 
             elif status == "finished":
+                self.log_progress(key, f"Downloaded {os.path.basename(key)}", done=True)
                 self.log("Post-processing complete", "success")
 
             elif status == "error":
@@ -923,14 +1168,16 @@ class SpotifyToYouTubeConverter(ctk.CTk):
 
 if __name__ == "__main__":
 
-    try:
-        subprocess.run(["yt-dlp", "--version"], check=True, capture_output=True)
-    except (subprocess.CalledProcessError, FileNotFoundError):
+    startup_timing.mark("imports")
+    if not inprocess_available() and tool_version("yt-dlp") is None:
         messagebox.showerror(
             "Error",
             "yt-dlp is not installed or not in PATH. Please install it first.",
         )
         sys.exit(1)
+    startup_timing.mark("tool probe")
 
     app = SpotifyToYouTubeConverter()
+    startup_timing.mark("window")
+    app.after_idle(lambda: startup_timing.report("GuiForPc"))
     app.mainloop()
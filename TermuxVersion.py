@@ -1,21 +1,45 @@
+import startup_timing
 import os
-import re
 import sys
 import json
 import time
 import glob
 import configparser
-import subprocess
+import importlib.util
 from pathlib import Path
 
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
+from track_pool import DEFAULT_CONCURRENCY, clamp_concurrency
+from ytdlp_engine import (
+    AUDIO_MP3, DEFAULT_FRAGMENTS, ENGINE_AUTO, VideoOptions, create_engine, inprocess_available, parse_fragments, search_target,
+)
+from spotify_fetch import ARTIST_DISCOGRAPHY, parse_source_urls
+from throttle import parse_rate
+from tool_probe import tool_version
+from stage_metrics import MetricsServer, StageMetrics, parse_port
+from converter import Converter
 
 
 CONFIG_FILE = "spotify_converter.cfg"
 DEFAULT_CONFIG = {
     "Spotify": {"client_id": "", "client_secret": ""},
-    "Settings": {"output_path": str(Path.home() / "downloads")},
+    "Settings": {
+        "output_path": str(Path.home() / "downloads"),
+        "concurrency": str(DEFAULT_CONCURRENCY),
+        "engine": ENGINE_AUTO,
+        "sync_playlists": "true",
+        "archive_removed": "false",
+        "pipeline": "true",
+        "audio_format": AUDIO_MP3,
+        "bandwidth_limit": "0",
+        "adaptive_concurrency": "false",
+        "artist_tracks": ARTIST_DISCOGRAPHY,
+        "metrics_port": "0",
+        "shared_store": "true",
+        "fragments": str(DEFAULT_FRAGMENTS),
+        "external_downloader": "",
+        "external_downloader_args": "",
+        "parallel_streams": "true",
+    },
 }
 
 
@@ -51,10 +75,6 @@ def save_config(config):
         config.write(f)
 
 
-def sanitize_filename(name):
-    return re.sub(r'[\\/*?:"<>|]', "_", name)
-
-
 def initialize_spotify_client(config):
     try:
         cid = config["Spotify"]["client_id"]
@@ -62,76 +82,56 @@ def initialize_spotify_client(config):
         if not cid or not secret:
             log("Spotify API credentials not set. Configure them first.", "error")
             return None
-        auth = SpotifyClientCredentials(client_id=cid, client_secret=secret)
-        return spotipy.Spotify(auth_manager=auth)
+        # Loaded on first use, spotipy and requests are slow to import.
+        from spotify_client import create_spotify_client
+
+        return create_spotify_client(cid, secret, CONFIG_FILE)
     except Exception as e:
         log(f"Spotify client error: {e}", "error")
         return None
 
 
-def download_youtube(query, output_path, is_video=False):
-    output_template = os.path.join(output_path, "%(title)s.%(ext)s")
-    command = [
-        "yt-dlp", "--newline", "--progress-template", "json", "--no-playlist",
-        "-o", output_template
-    ]
+def print_progress(data):
+    progress = data.get("progress", {})
+    if data.get("status") == "downloading":
+        print(f"    {progress.get('percent', 0):5.1f}%  {os.path.basename(data.get('filename') or '')}")
 
-    if is_video:
-        command += ["-f", "bestvideo[ext=mp4]+bestaudio[ext=m4a]/best", "--merge-output-format", "mp4"]
-        command.append(query)
-    else:
-        command += [
-            "-x", "--audio-format", "mp3", "--audio-quality", "192K",
-            "--embed-thumbnail", "--add-metadata", "--embed-metadata",
-            "--prefer-ffmpeg",
-        ]
-        command.append(f"ytsearch1:{query} official audio")
-
-    log(f"Running: {' '.join(command)}", "info")
-    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
-    for line in process.stdout:
-        print(line.strip())
-    return process.wait() == 0
-
-
-def convert_spotify_playlist(spotify, url, output_dir):
-    playlist_id = re.search(r"(?:playlist/|playlist:)([a-zA-Z0-9]+)", url)
-    if not playlist_id:
-        log("Invalid Spotify playlist URL", "error")
+
+def download_youtube(engine, query, output_path, is_video=False):
+    target = query if is_video or query.startswith("http") else search_target(query)
+    return engine.download(target, output_path, is_video, on_line=print, on_progress=print_progress)
+
+
+def create_converter(engine, config, spotify=None, metrics=None):
+    return Converter(engine, config["Settings"], spotify, log=log, on_line=print, on_progress=print_progress, metrics=metrics)
+
+
+def convert_spotify_urls(converter, text):
+    sources = parse_source_urls(text)
+    if not sources:
+        log("No Spotify playlist, album or artist URL found", "error")
         return
 
     try:
-        playlist = spotify.playlist(playlist_id.group(1))
-        name = sanitize_filename(playlist["name"])
-        full_path = os.path.join(output_dir, name)
-        os.makedirs(full_path, exist_ok=True)
-
-        log(f"Playlist: {name}")
-        tracks = playlist["tracks"]["items"]
-        while playlist["tracks"]["next"]:
-            playlist["tracks"] = spotify.next(playlist["tracks"])
-            tracks += playlist["tracks"]["items"]
-
-        for i, item in enumerate(tracks, 1):
-            track = item["track"]
-            title = track["name"]
-            artist = ", ".join([a["name"] for a in track["artists"]])
-            query = f"{artist} - {title}"
-
-            filename = os.path.join(full_path, sanitize_filename(f"{query}.mp3"))
-            if os.path.exists(filename):
-                log(f"[{i}] Skipping (already exists): {query}")
-                continue
+        for kind, source_id in sources:
+            try:
+                converter.convert_source(kind, source_id)
+            except Exception as e:
+                log(f"Error converting {kind} {source_id}: {e}", "error")
+    except KeyboardInterrupt:
+        log("Download stopped by user", "warning")
+
 
-            log(f"[{i}] Downloading: {query}")
-            success = download_youtube(query, full_path)
-            if not success:
-                log(f"Failed: {query}", "warning")
+def retry_failed_tracks(converter, folder):
+    try:
+        converter.retry_failed(folder)
+    except KeyboardInterrupt:
+        log("Download stopped by user", "warning")
     except Exception as e:
-        log(f"Error converting playlist: {e}", "error")
+        log(f"Error retrying failed tracks: {e}", "error")
 
 
-def download_single():
+def download_single(engine):
     url = input("Enter YouTube URL: ").strip()
     if not url.startswith("http"):
         log("Invalid URL", "error")
@@ -143,30 +143,55 @@ def download_single():
     output_path = config["Settings"]["output_path"]
     os.makedirs(output_path, exist_ok=True)
 
-    download_youtube(url, output_path, is_video)
+    result = download_youtube(engine, url, output_path, is_video)
+    if result:
+        log(f"Downloaded: {os.path.basename(result.filepath or url)}", "success")
+    else:
+        log(f"Download failed: {result.error or 'yt-dlp reported a failure'}", "error")
 
 
 def menu():
     config = load_config()
+    engine = create_engine(
+        config["Settings"].get("engine", ENGINE_AUTO), config["Settings"].get("audio_format", AUDIO_MP3),
+        parse_rate(config["Settings"].get("bandwidth_limit")),
+        VideoOptions(
+            parse_fragments(config["Settings"].get("fragments")), config["Settings"].get("external_downloader", ""),
+            config["Settings"].get("external_downloader_args", ""),
+            config["Settings"].getboolean("parallel_streams", fallback=True),
+        ),
+    )
+    log(f"Download engine: {engine.name} ({engine.audio_format})")
+    startup_timing.report("TermuxVersion")
+
+    # Covers the whole session, it is what the metrics endpoint serves.
+    metrics = StageMetrics(keep_tracks=False)
+    port = parse_port(config["Settings"].get("metrics_port"))
+    if port:
+        try:
+            log(f"Serving metrics at {MetricsServer(metrics, port).url}")
+        except OSError as e:
+            log(f"Metrics endpoint unavailable: {e}", "warning")
     while True:
         print("\n====== Spotify ↔ YouTube Converter ======")
-        print("1. Convert Spotify Playlist")
+        print("1. Convert Spotify Playlist, Album or Artist")
         print("2. Download Single YouTube Video or Music")
         print("3. Configure Spotify API")
         print("4. Set Output Directory")
-        print("5. Exit")
-        choice = input("Choose an option (1-5): ").strip()
+        print("5. Set Parallel Downloads")
+        print("6. Retry Failed Tracks")
+        print("7. Exit")
+        choice = input("Choose an option (1-7): ").strip()
 
         if choice == "1":
             spotify = initialize_spotify_client(config)
             if not spotify:
                 continue
-            url = input("Enter Spotify Playlist URL: ").strip()
-            output_path = config["Settings"]["output_path"]
-            convert_spotify_playlist(spotify, url, output_path)
+            urls = input("Enter Spotify URL(s), separated by spaces: ").strip()
+            convert_spotify_urls(create_converter(engine, config, spotify, metrics), urls)
 
         elif choice == "2":
-            download_single()
+            download_single(engine)
 
         elif choice == "3":
             cid = input("Enter Spotify Client ID: ").strip()
@@ -189,6 +214,16 @@ def menu():
             log(f"Output path set to {path}", "success")
 
         elif choice == "5":
+            value = input(f"Parallel downloads (1-16) [{config['Settings']['concurrency']}]: ").strip()
+            config["Settings"]["concurrency"] = str(clamp_concurrency(value or config["Settings"]["concurrency"]))
+            save_config(config)
+            log(f"Parallel downloads set to {config['Settings']['concurrency']}", "success")
+
+        elif choice == "6":
+            folder = input("Enter playlist folder path: ").strip()
+            retry_failed_tracks(create_converter(engine, config, metrics=metrics), folder)
+
+        elif choice == "7":
             print("Goodbye!")
             break
         else:
@@ -196,18 +231,16 @@ def menu():
 
 
 if __name__ == "__main__":
-    try:
-        subprocess.run(["yt-dlp", "--version"], check=True, capture_output=True)
-    except (FileNotFoundError, subprocess.CalledProcessError):
+    startup_timing.mark("imports")
+    if not inprocess_available() and tool_version("yt-dlp") is None:
         print("[x] yt-dlp is not installed. Run:")
         print("    pkg install yt-dlp -y")
         sys.exit(1)
 
-    try:
-        import spotipy
-    except ImportError:
+    if importlib.util.find_spec("spotipy") is None:
         print("[x] spotipy is not installed. Run:")
         print("    pip install spotipy")
         sys.exit(1)
+    startup_timing.mark("tool probe")
 
     menu()
@@ -0,0 +1,180 @@
+import asyncio
+import queue
+import threading
+from typing import Any, AsyncIterator, Callable, Iterator, List, Optional, Tuple
+
+from process_group import group_kwargs, signal_group
+
+
+# Output lines longer than this fail the read. yt-dlp's JSON lines carry
+# whole info dicts, the asyncio default of 64 KiB is not enough for them.
+STREAM_LIMIT = 8 * 1024 * 1024
+
+# What stream_process yields: one EVENT_LINE per output line, then the exit
+# code as EVENT_EXIT.
+EVENT_LINE = "line"
+EVENT_EXIT = "exit"
+
+_DONE = object()
+
+
+class ProcessHandle:
+    """Thread-safe stand-in for a Popen object around an asyncio process.
+
+    TrackDownloadPool and process_group poll and signal the processes they
+    stop from their own threads, these calls are handed to the loop.
+    """
+
+    def __init__(self, process: asyncio.subprocess.Process, loop: Any):
+        self.process = process
+        self.pid = process.pid
+        self._loop = loop
+
+    @property
+    def returncode(self) -> Optional[int]:
+        return self.process.returncode
+
+    def poll(self) -> Optional[int]:
+        return self.process.returncode
+
+    def send_signal(self, sig: int):
+        self._call("send_signal", sig)
+
+    def terminate(self):
+        self._call("terminate")
+
+    def kill(self):
+        self._call("kill")
+
+    def _call(self, name: str, *args: Any):
+        def call():
+            if self.process.returncode is None:
+                try:
+                    getattr(self.process, name)(*args)
+                except ProcessLookupError:
+                    pass
+
+        self._loop.call_soon_threadsafe(call)
+
+
+class EngineLoop:
+    """The event loop all external processes of the app run on.
+
+    It runs in a thread of its own, started on first use. Reading the output
+    of every yt-dlp and ffmpeg process happens there, the worker threads only
+    wait for the result or take the events of their own process.
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(
+                    target=loop.run_forever, name="engine-loop", daemon=True
+                )
+                thread.start()
+                self._loop = loop
+            return self._loop
+
+    def run(self, coro: Any) -> Any:
+        """Run coro on the loop and wait for its result."""
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result()
+        except BaseException:
+            # Ctrl+C while waiting: the coroutine kills its process.
+            future.cancel()
+            raise
+
+    def iterate(self, events: Callable[[], AsyncIterator[Any]]) -> Iterator[Any]:
+        """Yield what the async generator events() yields, in this thread."""
+        items: "queue.Queue[Any]" = queue.Queue()
+
+        async def pump():
+            try:
+                async for item in events():
+                    items.put(item)
+            finally:
+                items.put(_DONE)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        try:
+            while True:
+                item = items.get()
+                if item is _DONE:
+                    break
+                yield item
+            future.result()
+        finally:
+            future.cancel()
+
+
+engine_loop = EngineLoop()
+
+
+async def _start(
+    command: List[str], pool: Any, stderr: int
+) -> Tuple[asyncio.subprocess.Process, ProcessHandle]:
+    # Processes a pool can stop get a group of their own, so stopping also
+    # reaches what they start. Without a pool they stay in the terminal's
+    # group and get its Ctrl+C.
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=stderr,
+        limit=STREAM_LIMIT,
+        **(group_kwargs() if pool else {}),
+    )
+    handle = ProcessHandle(process, asyncio.get_running_loop())
+    if pool:
+        pool.register_process(handle)
+    return process, handle
+
+
+async def _finish(
+    process: asyncio.subprocess.Process, handle: ProcessHandle, pool: Any
+):
+    if process.returncode is None:
+        # Cancelled before the process was done.
+        signal_group(handle, force=True)
+        await process.wait()
+    if pool:
+        pool.unregister_process(handle)
+
+
+async def stream_process(
+    command: List[str], pool: Any = None
+) -> AsyncIterator[Tuple[str, Any]]:
+    """Run command, yielding its output (stderr included) line by line."""
+    process, handle = await _start(command, pool, asyncio.subprocess.STDOUT)
+    try:
+        async for line in process.stdout:
+            yield EVENT_LINE, line.decode("utf-8", "replace").rstrip("\r\n")
+        yield EVENT_EXIT, await process.wait()
+    finally:
+        await _finish(process, handle, pool)
+
+
+async def communicate(command: List[str], pool: Any = None) -> Tuple[int, str, str]:
+    """Run command to the end, returning its exit code, stdout and stderr."""
+    process, handle = await _start(command, pool, asyncio.subprocess.PIPE)
+    try:
+        stdout, stderr = await process.communicate()
+    finally:
+        await _finish(process, handle, pool)
+    return (
+        process.returncode,
+        stdout.decode("utf-8", "replace"),
+        stderr.decode("utf-8", "replace"),
+    )
+
+
+def run_process(command: List[str], pool: Any = None) -> Tuple[int, str, str]:
+    """communicate for a worker thread."""
+    return engine_loop.run(communicate(command, pool))
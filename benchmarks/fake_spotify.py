@@ -0,0 +1,153 @@
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Sequence
+from urllib.parse import parse_qs, urlparse
+
+
+# The parts of the Spotify Web API the converter uses for playlists, served
+# from generated data: playlist "bench<N>" has N tracks.
+PLAYLIST_SIZES = (10, 1000, 10000)
+PAGE_LIMIT = 100
+TRACK_DURATION_MS = 200000
+ARTISTS = 97
+
+# Newer spotipy releases page through /items, older ones through /tracks.
+PLAYLIST_PATH = re.compile(r"^/v1/playlists/([A-Za-z0-9]+)(/tracks|/items)?$")
+
+
+def playlist_id(size: int) -> str:
+    return f"bench{size}"
+
+
+def playlist_url(size: int) -> str:
+    return f"https://open.spotify.com/playlist/{playlist_id(size)}"
+
+
+def fake_track(index: int) -> Dict[str, Any]:
+    return {
+        "id": f"benchtrack{index:07d}",
+        "name": f"Track {index}",
+        "type": "track",
+        "is_local": False,
+        "duration_ms": TRACK_DURATION_MS,
+        "artists": [{"name": f"Artist {index % ARTISTS}"}],
+        "album": {"name": f"Album {index % ARTISTS}"},
+        "external_ids": {"isrc": f"XXBEN{index:07d}"},
+    }
+
+
+class FakeSpotifyServer:
+    """Local stand-in for api.spotify.com, optionally with a per-request delay."""
+
+    def __init__(
+        self,
+        sizes: Sequence[int] = PLAYLIST_SIZES,
+        latency: float = 0.0,
+        port: int = 0,
+    ):
+        self.playlists = {playlist_id(size): size for size in sizes}
+        self.latency = latency
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                url = urlparse(self.path)
+                body = server.respond(url.path, parse_qs(url.query))
+                if body is None:
+                    self.send_json(
+                        404, {"error": {"status": 404, "message": "Not found"}}
+                    )
+                else:
+                    self.send_json(200, body)
+
+            def send_json(self, status: int, body: Dict[str, Any]):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(
+            target=self.httpd.serve_forever, name="fake-spotify", daemon=True
+        )
+        self.thread.start()
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def api_prefix(self) -> str:
+        """Value for spotipy.Spotify.prefix to send its requests here."""
+        return f"{self.url}/v1/"
+
+    def respond(self, path: str, query: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        match = PLAYLIST_PATH.match(path)
+        if not match or match.group(1) not in self.playlists:
+            return None
+        source_id = match.group(1)
+        size = self.playlists[source_id]
+
+        if not match.group(2):
+            return {
+                "id": source_id,
+                "name": f"Benchmark {size}",
+                "snapshot_id": f"{source_id}-1",
+                "owner": {"display_name": "benchmark"},
+                "tracks": {"total": size},
+            }
+
+        offset = int(query.get("offset", ["0"])[0])
+        limit = min(PAGE_LIMIT, int(query.get("limit", [str(PAGE_LIMIT)])[0]))
+        end = min(size, offset + limit)
+        next_url = None
+        if end < size:
+            next_url = f"{self.url}{path}?offset={end}&limit={limit}"
+        return {
+            "items": [{"track": fake_track(i)} for i in range(offset + 1, end + 1)],
+            "offset": offset,
+            "limit": limit,
+            "total": size,
+            "next": next_url,
+        }
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve fake Spotify playlists.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="seconds added to every request"
+    )
+    args = parser.parse_args()
+
+    server = FakeSpotifyServer(latency=args.latency, port=args.port)
+    print(f"Serving {server.api_prefix}")
+    for size in PLAYLIST_SIZES:
+        print(f"  {playlist_url(size)}")
+    try:
+        server.thread.join()
+    except KeyboardInterrupt:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
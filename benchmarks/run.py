@@ -0,0 +1,389 @@
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+
+import stub_ytdlp
+from fake_spotify import PLAYLIST_SIZES, FakeSpotifyServer, playlist_url
+
+
+SCENARIO_SINGLE = "single"
+SCENARIO_PLAYLIST = "playlist"
+FRONTEND_AUTO = "auto"
+FRONTEND_GUI = "gui"
+FRONTEND_HEADLESS = "headless"
+
+SINGLE_URL = "https://www.youtube.com/watch?v=benchsingle"
+UI_PROBE_MS = 10
+RESULT_FILE = "result.json"
+
+# Command line option and the stub setting it controls.
+STUB_OPTIONS = {
+    "search_seconds": stub_ytdlp.ENV_SEARCH,
+    "extract_seconds": stub_ytdlp.ENV_EXTRACT,
+    "download_seconds": stub_ytdlp.ENV_DOWNLOAD,
+    "postprocess_seconds": stub_ytdlp.ENV_POSTPROCESS,
+    "audio_seconds": stub_ytdlp.ENV_AUDIO,
+    "fail_rate": stub_ytdlp.ENV_FAIL_RATE,
+}
+
+
+class UiLatencyProbe:
+    """Schedules a callback on the Tk thread every few milliseconds and records
+    how late each one runs, i.e. how long the UI could not respond."""
+
+    def __init__(self, widget: Any, interval_ms: int = UI_PROBE_MS):
+        self.widget = widget
+        self.interval_ms = interval_ms
+        self.samples: List[float] = []
+        self.stopped = False
+        self._expected = time.perf_counter() + interval_ms / 1000
+        widget.after(interval_ms, self._tick)
+
+    def _tick(self):
+        now = time.perf_counter()
+        self.samples.append(max(0.0, now - self._expected) * 1000)
+        if not self.stopped:
+            self._expected = now + self.interval_ms / 1000
+            self.widget.after(self.interval_ms, self._tick)
+
+    def summary(self) -> Dict[str, Any]:
+        samples = sorted(self.samples)
+        return {
+            "samples": len(samples),
+            "p50_ms": round(percentile(samples, 0.5), 1),
+            "p95_ms": round(percentile(samples, 0.95), 1),
+            "p99_ms": round(percentile(samples, 0.99), 1),
+            "max_ms": round(samples[-1] if samples else 0.0, 1),
+        }
+
+
+def percentile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+def peak_rss_mb() -> Dict[str, Optional[float]]:
+    try:
+        import resource
+    except ImportError:
+        return {"peak_rss_mb": None, "peak_child_rss_mb": None}
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return {
+        "peak_rss_mb": round(own / scale, 1),
+        "peak_child_rss_mb": round(children / scale, 1),
+    }
+
+
+def gui_available() -> bool:
+    if importlib.util.find_spec("customtkinter") is None:
+        return False
+    if sys.platform.startswith(("win", "darwin")):
+        return True
+    return bool(os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+
+
+def spotify_client(api_prefix: str) -> Any:
+    import spotipy
+    from spotify_client import REQUEST_TIMEOUT, shared_session
+
+    # The fake API needs no OAuth, any bearer token is accepted.
+    client = spotipy.Spotify(
+        auth="benchmark",
+        requests_session=shared_session(),
+        requests_timeout=REQUEST_TIMEOUT,
+    )
+    client.prefix = api_prefix
+    return client
+
+
+def tracks_done(folder: str) -> int:
+    from stage_metrics import METRICS_FILE
+
+    try:
+        with open(os.path.join(folder, METRICS_FILE), encoding="utf-8") as f:
+            return json.load(f).get("tracks", {}).get("done", 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def run_headless(args: argparse.Namespace, output: str) -> Dict[str, Any]:
+    import headless
+    from track_pool import DONE
+    from ytdlp_engine import ENGINE_SUBPROCESS, create_engine
+
+    settings = headless.load_config(headless.CONFIG_FILE)["Settings"]
+    settings["output_path"] = output
+    settings["concurrency"] = str(args.concurrency)
+    settings["pipeline"] = str(args.pipeline).lower()
+    settings["sync_playlists"] = "false"
+    engine = create_engine(ENGINE_SUBPROCESS, args.audio_format)
+    spotify = spotify_client(args.api) if args.scenario == SCENARIO_PLAYLIST else None
+    runner = headless.HeadlessRunner(engine, settings, spotify=spotify)
+
+    start = time.perf_counter()
+    if args.scenario == SCENARIO_SINGLE:
+        job = headless.Job(1, headless.JOB_YOUTUBE, SINGLE_URL)
+        runner.run_youtube([job])
+    else:
+        job = headless.Job(1, headless.JOB_SPOTIFY, playlist_url(args.size))
+        runner.run_spotify(job)
+    return {"seconds": time.perf_counter() - start, "done": job.counts.get(DONE, 0)}
+
+
+def run_gui(args: argparse.Namespace, output: str) -> Dict[str, Any]:
+    import GuiForPc
+    from ytdlp_engine import ENGINE_SUBPROCESS, create_engine
+
+    app = GuiForPc.SpotifyToYouTubeConverter()
+    settings = app.config["Settings"]
+    settings["concurrency"] = str(args.concurrency)
+    settings["pipeline"] = str(args.pipeline).lower()
+    settings["audio_format"] = args.audio_format
+    settings["sync_playlists"] = "false"
+    app.engine = create_engine(ENGINE_SUBPROCESS, app.get_audio_format())
+    app.output_path.set(output)
+    app.download_type.set("music")
+
+    if args.scenario == SCENARIO_SINGLE:
+
+        def run(job):
+            return app.download_single(job, SINGLE_URL, "music", output)
+
+    else:
+        app.spotify = spotify_client(args.api)
+
+        def run(job):
+            return app.convert_spotify_urls(job, playlist_url(args.size))
+
+    timing: Dict[str, float] = {}
+    jobs = []
+    probe = UiLatencyProbe(app)
+
+    def start():
+        timing["start"] = time.perf_counter()
+        jobs.append(app.scheduler.submit("benchmark", run))
+        app.after(100, check)
+
+    def check():
+        if not jobs[0].finished:
+            app.after(100, check)
+            return
+        timing["end"] = time.perf_counter()
+        probe.stopped = True
+        # Let the log queue drain before the window goes away.
+        app.after(GuiForPc.LOG_FLUSH_MS * 4, app.quit)
+
+    app.after(0, start)
+    app.mainloop()
+    app.destroy()
+
+    if args.scenario == SCENARIO_SINGLE:
+        done = int(any(not name.startswith(".") for name in os.listdir(output)))
+    else:
+        done = tracks_done(os.path.join(output, f"Benchmark {args.size}"))
+    return {
+        "seconds": timing["end"] - timing["start"],
+        "done": done,
+        "ui_latency": probe.summary(),
+    }
+
+
+def run_child(args: argparse.Namespace) -> int:
+    output = os.path.abspath("downloads")
+    os.makedirs(output, exist_ok=True)
+    if args.frontend == FRONTEND_GUI:
+        result = run_gui(args, output)
+    else:
+        result = run_headless(args, output)
+
+    tracks = 1 if args.scenario == SCENARIO_SINGLE else args.size
+    result.update(
+        scenario=args.scenario,
+        frontend=args.frontend,
+        tracks=tracks,
+        tracks_per_minute=round(result["done"] * 60 / result["seconds"], 1),
+        seconds=round(result["seconds"], 2),
+        **peak_rss_mb(),
+    )
+    with open(args.result, "w", encoding="utf-8") as f:
+        json.dump(result, f)
+    return 0
+
+
+def write_stub(bin_dir: str):
+    # A tiny launcher named yt-dlp, so the app finds the stub on PATH.
+    path = os.path.join(bin_dir, "yt-dlp")
+    script = os.path.join(HERE, "stub_ytdlp.py")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f'#!/bin/sh\nexec "{sys.executable}" "{script}" "$@"\n')
+    os.chmod(path, 0o755)
+
+
+def child_command(
+    args: argparse.Namespace, scenario: str, size: int, api: str, result: str
+) -> List[str]:
+    command = [sys.executable, os.path.abspath(__file__), "--child"]
+    command += ["--scenario", scenario, "--size", str(size), "--api", api]
+    command += ["--result", result, "--frontend", args.frontend]
+    command += ["--concurrency", str(args.concurrency)]
+    command += ["--audio-format", args.audio_format]
+    if not args.pipeline:
+        command.append("--no-pipeline")
+    return command
+
+
+def format_row(result: Dict[str, Any]) -> str:
+    name = result["scenario"]
+    if name == SCENARIO_PLAYLIST:
+        name = f"{name} {result['tracks']}"
+    latency = result.get("ui_latency")
+    ui = f"{latency['p95_ms']:.0f}/{latency['max_ms']:.0f} ms" if latency else "-"
+    return (
+        f"{name:<16}{result['frontend']:<10}{result['done']:>6}/{result['tracks']:<6}"
+        f"{result['seconds']:>9.1f}s{result['tracks_per_minute']:>12.1f}"
+        f"{result['peak_rss_mb'] or 0:>9.1f} MB  {ui}"
+    )
+
+
+def run_suite(args: argparse.Namespace) -> int:
+    if args.frontend == FRONTEND_AUTO:
+        args.frontend = FRONTEND_GUI if gui_available() else FRONTEND_HEADLESS
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+
+    workdir = tempfile.mkdtemp(prefix="spotify-converter-bench-")
+    bin_dir = os.path.join(workdir, "bin")
+    os.makedirs(bin_dir)
+    write_stub(bin_dir)
+
+    env = dict(os.environ, PATH=bin_dir + os.pathsep + os.environ.get("PATH", ""))
+    for option, name in STUB_OPTIONS.items():
+        env[name] = str(getattr(args, option))
+
+    server = FakeSpotifyServer(sizes, latency=args.spotify_latency)
+    scenarios = [(SCENARIO_SINGLE, 1)] + [(SCENARIO_PLAYLIST, size) for size in sizes]
+    results = []
+    print(
+        f"{'scenario':<16}{'frontend':<10}{'done':>13}{'time':>10}"
+        f"{'tracks/min':>12}{'peak RSS':>12}  UI p95/max"
+    )
+    try:
+        for scenario, size in scenarios:
+            # Every scenario runs in its own process and folder, so peak RSS
+            # and the resolution cache start from scratch each time.
+            cwd = os.path.join(workdir, f"{scenario}-{size}")
+            os.makedirs(cwd)
+            result_path = os.path.join(cwd, RESULT_FILE)
+            with open(os.path.join(cwd, "output.log"), "w") as log:
+                code = subprocess.call(
+                    child_command(args, scenario, size, server.api_prefix, result_path),
+                    cwd=cwd,
+                    env=env,
+                    stdout=log,
+                    stderr=subprocess.STDOUT,
+                )
+            if code != 0 or not os.path.exists(result_path):
+                print(f"{scenario} {size}: failed, see {cwd}/output.log")
+                continue
+            with open(result_path, encoding="utf-8") as f:
+                results.append(json.load(f))
+            print(format_row(results[-1]))
+    finally:
+        server.close()
+
+    report = {
+        "time": round(time.time(), 3),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "settings": {
+            "concurrency": args.concurrency,
+            "audio_format": args.audio_format,
+            "pipeline": args.pipeline,
+            "spotify_latency": args.spotify_latency,
+            **{option: getattr(args, option) for option in STUB_OPTIONS},
+        },
+        "spotify_requests": server.requests,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+        print(f"Results written to {args.output}")
+    if args.keep:
+        print(f"Downloads and logs kept in {workdir}")
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 0 if len(results) == len(scenarios) else 1
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Offline throughput benchmark: a stub yt-dlp and a fake "
+        "Spotify API stand in for the network."
+    )
+    parser.add_argument(
+        "--sizes",
+        default=",".join(str(size) for size in PLAYLIST_SIZES),
+        help="playlist sizes to convert, comma separated",
+    )
+    parser.add_argument(
+        "--frontend",
+        choices=[FRONTEND_AUTO, FRONTEND_GUI, FRONTEND_HEADLESS],
+        default=FRONTEND_AUTO,
+        help="gui measures UI-thread latency too, needs a display",
+    )
+    parser.add_argument("-j", "--concurrency", type=int, default=3)
+    parser.add_argument("--audio-format", default="mp3")
+    parser.add_argument(
+        "--no-pipeline",
+        dest="pipeline",
+        action="store_false",
+        help="let the stub do the conversion instead of the ffmpeg pipeline",
+    )
+    parser.add_argument("--spotify-latency", type=float, default=0.05)
+    for option, name in STUB_OPTIONS.items():
+        parser.add_argument(
+            f"--{option.replace('_', '-')}",
+            type=float,
+            default=stub_ytdlp.DEFAULTS[name],
+        )
+    parser.add_argument("-o", "--output", help="write the results as JSON")
+    parser.add_argument(
+        "--keep", action="store_true", help="keep the downloads and logs"
+    )
+
+    # Used by the suite to run one scenario in a fresh process.
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--scenario", help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, default=1, help=argparse.SUPPRESS)
+    parser.add_argument("--api", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    if args.child:
+        return run_child(args)
+    return run_suite(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+import time
+import wave
+from typing import Any, Dict, List, Optional
+
+# Stands in for the yt-dlp binary during benchmarks: searches answer with a
+# single well matching result and downloads write a silent WAV file at a
+# steady rate, reporting progress the way --progress-template asks for.
+# Latencies come from the environment so every run is reproducible.
+ENV_SEARCH = "BENCH_SEARCH_SECONDS"
+ENV_EXTRACT = "BENCH_EXTRACT_SECONDS"
+ENV_DOWNLOAD = "BENCH_DOWNLOAD_SECONDS"
+ENV_POSTPROCESS = "BENCH_POSTPROCESS_SECONDS"
+ENV_AUDIO = "BENCH_AUDIO_SECONDS"
+ENV_FAIL_RATE = "BENCH_FAIL_RATE"
+
+DEFAULTS = {
+    ENV_SEARCH: 0.05,
+    ENV_EXTRACT: 0.05,
+    ENV_DOWNLOAD: 0.2,
+    ENV_POSTPROCESS: 0.02,
+    ENV_AUDIO: 10.0,
+    ENV_FAIL_RATE: 0.0,
+}
+
+VERSION = "2099.01.01-stub"
+TRACK_SECONDS = 200
+SAMPLE_RATE = 8000
+PROGRESS_TICKS = 10
+SEARCH_SUFFIX = " official audio"
+
+
+def setting(name: str) -> float:
+    try:
+        return float(os.environ.get(name, DEFAULTS[name]))
+    except ValueError:
+        return DEFAULTS[name]
+
+
+def video_id(text: str) -> str:
+    digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+    return digest[:11]
+
+
+def option(args: List[str], name: str) -> Optional[str]:
+    if name in args:
+        index = args.index(name)
+        if index + 1 < len(args):
+            return args[index + 1]
+    return None
+
+
+def print_json(data: Dict[str, Any]):
+    sys.stdout.write(json.dumps(data) + "\n")
+    sys.stdout.flush()
+
+
+def search(target: str):
+    time.sleep(setting(ENV_SEARCH))
+    query = target.split(":", 1)[1] if ":" in target else target
+    if query.endswith(SEARCH_SUFFIX):
+        query = query[: -len(SEARCH_SUFFIX)]
+    artist = query.split(" - ")[0] if " - " in query else "Stub"
+    entry = {
+        "id": video_id(query),
+        "title": query,
+        "duration": TRACK_SECONDS,
+        "channel": f"{artist} - Topic",
+        "description": "",
+    }
+    print_json({"_type": "playlist", "entries": [entry]})
+
+
+def silent_wav(seconds: float) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(b"\0\0" * int(SAMPLE_RATE * seconds))
+    return buffer.getvalue()
+
+
+def output_extension(args: List[str]) -> str:
+    if "--merge-output-format" in args:
+        return option(args, "--merge-output-format") or "mp4"
+    if "-x" in args:
+        audio_format = option(args, "--audio-format") or "best"
+        return "wav" if audio_format == "best" else audio_format
+    return "wav"
+
+
+def postprocess(status: str, name: str, vid: str, title: str, path: str):
+    print_json(
+        {
+            "postprocess": status,
+            "postprocessor": name,
+            "id": vid,
+            "title": title,
+            "filepath": path,
+        }
+    )
+
+
+def download(args: List[str], target: str) -> int:
+    match = re.search(r"[?&]v=([^&]+)", target)
+    vid = match.group(1) if match else video_id(target)
+    title = f"Stub video {vid}"
+
+    time.sleep(setting(ENV_EXTRACT))
+    fail_rate = setting(ENV_FAIL_RATE)
+    if fail_rate and int(video_id(vid), 16) % 1000 < fail_rate * 1000:
+        print(f"ERROR: [youtube] {vid}: Video unavailable", flush=True)
+        return 1
+
+    template = option(args, "-o") or "%(title)s.%(ext)s"
+    path = template.replace("%(id)s", vid).replace("%(title)s", title)
+    path = path.replace("%(ext)s", output_extension(args))
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    # Like yt-dlp the data goes to a .part file first, which --continue
+    # resumes after an interruption.
+    data = silent_wav(setting(ENV_AUDIO))
+    part_path = f"{path}.part"
+    written = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    tick = setting(ENV_DOWNLOAD) / PROGRESS_TICKS
+    chunk = max(1, len(data) // PROGRESS_TICKS)
+    with open(part_path, "ab") as f:
+        while written < len(data):
+            time.sleep(tick)
+            f.write(data[written : written + chunk])
+            written = min(len(data), written + chunk)
+            remaining = (len(data) - written) // chunk
+            print_json(
+                {
+                    "id": vid,
+                    "progress": {
+                        "status": "downloading",
+                        "filename": path,
+                        "downloaded_bytes": written,
+                        "total_bytes": len(data),
+                        "speed": chunk / tick if tick else None,
+                        "eta": round(remaining * tick),
+                    },
+                }
+            )
+    os.replace(part_path, path)
+
+    if "-x" in args:
+        postprocess("started", "ExtractAudio", vid, title, path)
+        time.sleep(setting(ENV_POSTPROCESS))
+        postprocess("finished", "ExtractAudio", vid, title, path)
+    postprocess("started", "MoveFiles", vid, title, path)
+    postprocess("finished", "MoveFiles", vid, title, path)
+    return 0
+
+
+def main(args: List[str]) -> int:
+    if "--version" in args:
+        print(VERSION)
+        return 0
+    if not args:
+        print("ERROR: no URL given", file=sys.stderr)
+        return 2
+
+    target = args[-1]
+    if "--flat-playlist" in args:
+        search(target)
+        return 0
+    return download(args, target)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,209 @@
+import re
+import threading
+import time
+import unicodedata
+from collections import deque
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from stage_metrics import STAGE_SEARCH
+from track_pool import TrackTask
+from ytdlp_engine import SearchError
+
+
+SEARCH_CANDIDATES = 5
+RESOLVE_WORKERS = 4
+
+# A candidate whose length is further off than this is a different recording
+# (extended mix, hour-long loop, live version) and is never downloaded.
+DURATION_SLACK = 30.0
+DURATION_RATIO = 0.25
+
+# Words marking another version of a track, penalised unless the Spotify
+# title itself contains them.
+VARIANT_PENALTIES = {
+    "live": 20,
+    "cover": 25,
+    "remix": 20,
+    "extended": 20,
+    "acoustic": 15,
+    "instrumental": 25,
+    "karaoke": 30,
+    "loop": 30,
+    "hour": 30,
+    "hours": 30,
+    "nightcore": 30,
+    "slowed": 25,
+    "sped": 25,
+    "reverb": 15,
+    "8d": 20,
+    "reaction": 30,
+    "lyrics": 5,
+    "lyric": 5,
+}
+
+Candidate = Dict[str, Any]
+
+
+def normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", text.lower()).split())
+
+
+def contains(text: str, phrase: str) -> bool:
+    return bool(phrase) and f" {phrase} " in f" {text} "
+
+
+def score_candidate(candidate: Candidate, task: TrackTask) -> Optional[float]:
+    """Match score of a search result for a track, None if it is ruled out."""
+    title = normalize(candidate.get("title", ""))
+    channel = normalize(candidate.get("channel", ""))
+    title_words = set(title.split())
+    score = 0.0
+
+    expected = task.duration_ms / 1000.0 if task.duration_ms else None
+    duration = candidate.get("duration")
+    if expected and duration:
+        limit = max(DURATION_SLACK, expected * DURATION_RATIO)
+        difference = abs(duration - expected)
+        if difference > limit:
+            return None
+        score += 40 * (1 - difference / limit)
+    elif expected:
+        # Live streams and premieres come without a length.
+        score -= 10
+
+    artists = [normalize(a) for a in task.tags.get("artist", "").split(", ")]
+    for position, artist in enumerate(a for a in artists if a):
+        weight = 1.0 if position == 0 else 0.4
+        if contains(channel, artist):
+            score += 25 * weight
+            # "Artist - Topic" channels carry the label's own audio upload.
+            if position == 0 and channel.endswith(" topic"):
+                score += 10
+        elif contains(title, artist):
+            score += 15 * weight
+
+    name_words = set(normalize(task.tags.get("title") or task.query).split())
+    if name_words:
+        score += 20 * len(name_words & title_words) / len(name_words)
+    for word, penalty in VARIANT_PENALTIES.items():
+        if word in title_words and word not in name_words:
+            score -= penalty
+
+    if task.isrc:
+        text = f"{candidate.get('title', '')} {candidate.get('description', '')}"
+        if task.isrc.lower() in re.sub(r"[^0-9a-z]", "", text.lower()):
+            score += 50
+
+    return score
+
+
+def best_candidate(
+    candidates: List[Candidate], task: TrackTask
+) -> Optional[Tuple[float, Candidate]]:
+    best = None
+    for candidate in candidates:
+        score = score_candidate(candidate, task)
+        # Ties go to the higher ranked search result.
+        if score is not None and (best is None or score > best[0]):
+            best = (score, candidate)
+    return best
+
+
+class CandidateResolver:
+    """Resolves tracks to a video ID from search metadata alone.
+
+    Searches run on their own threads a few tracks ahead of the download
+    workers, so by the time a worker picks up a track its video is known.
+    """
+
+    def __init__(
+        self,
+        engine: Any,
+        cache: Any = None,
+        store: Any = None,
+        pool: Any = None,
+        count: int = SEARCH_CANDIDATES,
+        workers: int = RESOLVE_WORKERS,
+    ):
+        self.engine = engine
+        self.cache = cache
+        self.store = store
+        self.pool = pool
+        self.count = count
+        self.lookahead = workers * 2
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="resolve"
+        )
+        self._futures: Dict[TrackTask, Future] = {}
+        self._lock = threading.Lock()
+
+    def prefetch(self, tasks: Iterable[TrackTask]) -> Iterator[TrackTask]:
+        source = iter(tasks)
+        pending: deque = deque()
+
+        def fill():
+            while len(pending) < self.lookahead:
+                task = next(source, None)
+                if task is None:
+                    return
+                if self._needs_search(task):
+                    future = self._executor.submit(self._search, task)
+                    with self._lock:
+                        self._futures[task] = future
+                pending.append(task)
+
+        fill()
+        while pending:
+            task = pending.popleft()
+            fill()
+            yield task
+
+    def resolve(self, task: TrackTask) -> Optional[Tuple[float, Candidate]]:
+        """Best match for the track; on failure task.error says why."""
+        with self._lock:
+            future = self._futures.pop(task, None)
+        try:
+            match, error = future.result() if future else self._search(task)
+        except CancelledError:
+            match, error = self._search(task)
+        task.error = error
+        return match
+
+    def close(self):
+        with self._lock:
+            futures, self._futures = list(self._futures.values()), {}
+        for future in futures:
+            future.cancel()
+        self._executor.shutdown(wait=True)
+
+    def _needs_search(self, task: TrackTask) -> bool:
+        if not task.track_id:
+            return True
+        if self.store and self.store.video_id(task.track_id):
+            return False
+        # download_track's get() refreshes last_used, a second write
+        # transaction per track here would only repeat it.
+        return not (self.cache and self.cache.peek(task.track_id, task.isrc))
+
+    def _search(
+        self, task: TrackTask
+    ) -> Tuple[Optional[Tuple[float, Candidate]], Optional[str]]:
+        if self.pool and self.pool.stopped:
+            return None, None
+        start = time.monotonic()
+        try:
+            candidates = self.engine.search(task.query, self.count, self.pool)
+        except SearchError as e:
+            return None, str(e)
+        finally:
+            if self.pool:
+                self.pool.record_stage(STAGE_SEARCH, time.monotonic() - start, task)
+
+        match = best_candidate(candidates, task)
+        if match is None:
+            # Worded to be classified as unavailable, so it is not retried.
+            return None, f"ERROR: No video results matching {task.query}"
+        return match, None
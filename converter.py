@@ -0,0 +1,523 @@
+import os
+import re
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+
+from candidate_match import CandidateResolver
+from job_store import JobStore
+from library_manifest import LibraryManifest, track_tag
+from pipeline import StagedTrack, TranscodePipeline, ffmpeg_available, staging_path
+from playlist_sync import PlaylistState, archive_removed
+from resolve_cache import ResolutionCache
+from retry_scheduler import FailureJournal, RetryScheduler
+from spotify_fetch import ARTIST_DISCOGRAPHY, fetch_source, iter_source_tracks
+from stage_metrics import STAGE_SPOTIFY, StageMetrics, TimedCalls
+from throttle import AdaptiveConcurrency
+from track_pool import (
+    DONE,
+    DOWNLOADING,
+    RESOLVING,
+    TrackDownloadPool,
+    TrackTask,
+    clamp_concurrency,
+)
+from track_store import SharedTrackStore
+from ytdlp_engine import DownloadResult, video_url
+
+
+LogCallback = Optional[Callable[[str, str], None]]
+LineCallback = Optional[Callable[[str], None]]
+ProgressCallback = Optional[Callable[[Dict[str, Any]], None]]
+EventCallback = Optional[Callable[[str, Dict[str, Any]], None]]
+PoolCallback = Optional[Callable[[TrackDownloadPool], None]]
+
+
+def sanitize_filename(name: str) -> str:
+    return re.sub(r'[\\/*?:"<>|]', "_", name)
+
+
+class ConversionResult:
+    """What converting a source, or retrying a folder's failures, came to."""
+
+    def __init__(self, folder: str, name: Optional[str] = None):
+        self.folder = folder
+        self.name = name
+        # States of the tracks that were run, see TrackDownloadPool.counts.
+        self.counts: Dict[str, int] = {}
+        self.tracks = 0
+        self.skipped = 0
+        self.linked = 0
+        self.unchanged = False
+        self.cancelled = False
+        self.failure_journal: Optional[str] = None
+        self.metrics: Optional[Dict[str, Any]] = None
+
+    @property
+    def downloaded(self) -> int:
+        return self.counts.get(DONE, 0)
+
+    @property
+    def complete(self) -> bool:
+        return self.downloaded == self.tracks and not self.cancelled
+
+
+class Converter:
+    """Downloads Spotify playlists, albums and artists into playlist folders.
+
+    This is the flow all front ends run: list the source's tracks, skip the
+    ones the folder or the shared store already has, then per track the
+    resolution cache, the search, the download and the transcode pipeline,
+    and finally the manifest and the shared store.
+
+    Front ends only pass callbacks: log(message, level) for messages,
+    on_line and on_progress for yt-dlp's output, on_event(name, fields) for
+    structured events ("source", "playlist_unchanged", "resume", "track",
+    "match", "linked", "concurrency") and on_pool(pool) when downloads start,
+    for cancelling them.
+    """
+
+    def __init__(
+        self,
+        engine: Any,
+        settings: Any,
+        spotify: Any = None,
+        log: LogCallback = None,
+        on_line: LineCallback = None,
+        on_progress: ProgressCallback = None,
+        on_event: EventCallback = None,
+        on_pool: PoolCallback = None,
+        metrics: Optional[StageMetrics] = None,
+        gate: Any = None,
+    ):
+        self.engine = engine
+        self.settings = settings
+        self.spotify = spotify
+        self.log = log
+        self.on_line = on_line
+        self.on_progress = on_progress
+        self.on_event = on_event
+        self.on_pool = on_pool
+        self.metrics = metrics
+        # Download slots shared with other conversions, see job_scheduler.
+        self.gate = gate
+        self.current_pool: Optional[TrackDownloadPool] = None
+
+    def convert_source(
+        self, kind: str, source_id: str, output_dir: Optional[str] = None
+    ) -> ConversionResult:
+        """Download a playlist, album or artist into a folder of its own."""
+        output_dir = output_dir or self.settings["output_path"]
+        metrics = StageMetrics(parent=self.metrics)
+        spotify = TimedCalls(self.spotify, metrics, STAGE_SPOTIFY)
+        source = fetch_source(
+            spotify,
+            kind,
+            source_id,
+            self.settings.get("artist_tracks", ARTIST_DISCOGRAPHY),
+        )
+        name = sanitize_filename(source.name)
+        folder = os.path.join(output_dir, name)
+        os.makedirs(folder, exist_ok=True)
+        result = ConversionResult(folder, name)
+
+        self._event(
+            "source",
+            kind=kind,
+            name=source.name,
+            owner=source.owner,
+            total=source.total,
+            folder=folder,
+        )
+        self._log(f"{kind.capitalize()}: {source.name} by {source.owner}")
+        self._log(f"Tracks: {source.total}")
+
+        sync = self.settings.getboolean("sync_playlists", fallback=True)
+        state = PlaylistState.load(folder)
+        if sync and state.is_unchanged(source.id, source.snapshot_id):
+            self._log("Playlist unchanged since last sync, nothing to do", "success")
+            self._event("playlist_unchanged")
+            result.unchanged = True
+            return result
+
+        manifest = LibraryManifest.load(folder, log=self.log)
+        shared = self.open_shared_store(output_dir)
+        track_ids: List[str] = []
+        listing = {"complete": False}
+
+        def pending_tasks():
+            for i, track in iter_source_tracks(spotify, source):
+                query = f"{track.artist} - {track.name}"
+                if track.id:
+                    track_ids.append(track.id)
+
+                if manifest.has(track.id):
+                    self._log(f"[{i}] Skipping (already exists): {query}")
+                    result.skipped += 1
+                    continue
+
+                # Already downloaded for another playlist.
+                linked = shared.link_track(track.id, folder) if shared else None
+                if linked:
+                    manifest.add(track.id, linked)
+                    self._log(f"[{i}] Linked from another playlist: {query}")
+                    result.linked += 1
+                    continue
+
+                yield TrackTask(
+                    i,
+                    query,
+                    folder,
+                    label=f"{i}/{source.total}: {query}",
+                    track_id=track.id,
+                    isrc=track.isrc,
+                    tags=track.tags,
+                    duration_ms=track.duration_ms,
+                )
+            listing["complete"] = True
+
+        self.run_tasks(folder, manifest, pending_tasks(), shared, metrics, result)
+
+        if listing["complete"]:
+            if sync and state.track_ids:
+                removed = state.removed_since(track_ids)
+                added = len(set(track_ids) - set(state.track_ids))
+                self._log(
+                    f"Playlist changed: {added} track(s) added, {len(removed)} removed"
+                )
+                if removed and self.settings.getboolean(
+                    "archive_removed", fallback=False
+                ):
+                    archive_removed(manifest, removed, log=self.log)
+
+            # Only remember the snapshot once every track made it to disk,
+            # so failed tracks are retried by the next sync.
+            snapshot_id = source.snapshot_id if result.complete else None
+            state.save(source.id, snapshot_id, track_ids)
+
+        self._log(
+            f"Finished: {result.downloaded} of {result.tracks} track(s) downloaded, "
+            f"{result.skipped} already present, {result.linked} linked from "
+            "other playlists",
+            "success" if result.complete else "warning",
+        )
+        return result
+
+    def retry_failed(self, folder: str) -> ConversionResult:
+        """Run the tracks listed in a playlist folder's failure journal again."""
+        result = ConversionResult(folder, os.path.basename(folder))
+        tasks = FailureJournal.load(folder).tasks()
+        if not tasks:
+            self._log("No failed tracks recorded in that folder")
+            return result
+
+        self._log(f"Retrying {len(tasks)} failed track(s)")
+        manifest = LibraryManifest.load(folder, log=self.log)
+        # Playlist folders sit directly in the output directory holding the store.
+        shared = self.open_shared_store(os.path.dirname(os.path.abspath(folder)))
+        self.run_tasks(
+            folder, manifest, tasks, shared, StageMetrics(parent=self.metrics), result
+        )
+        self._log(
+            f"Finished: {result.downloaded} of {result.tracks} track(s) downloaded",
+            "success" if result.complete else "warning",
+        )
+        return result
+
+    def run_tasks(
+        self,
+        folder: str,
+        manifest: LibraryManifest,
+        tasks: Iterable[TrackTask],
+        shared: Optional[SharedTrackStore],
+        metrics: StageMetrics,
+        result: ConversionResult,
+    ):
+        store = JobStore(folder)
+        failures = FailureJournal.load(folder)
+        resumed = store.unfinished()
+        if resumed:
+            self._log(f"Resuming {resumed} interrupted track(s)")
+            self._event("resume", tracks=resumed)
+
+        cache = self.open_resolution_cache()
+        pipeline: Optional[TranscodePipeline] = None
+
+        def on_state(task: TrackTask):
+            store.record(task)
+            self._event(
+                "track",
+                index=task.index,
+                label=task.label,
+                state=task.state,
+                error=task.error,
+            )
+
+        pool = TrackDownloadPool(
+            lambda task, pool: self.download_track(
+                task, pool, manifest, resolver, cache, pipeline, store, shared
+            ),
+            concurrency=clamp_concurrency(self.settings.get("concurrency")),
+            on_state=on_state,
+            retry=RetryScheduler(journal=failures),
+            controller=self.create_controller(),
+            metrics=metrics,
+            gate=self.gate,
+            keep_partial=True,
+        )
+        self.current_pool = pool
+        if self.on_pool:
+            self.on_pool(pool)
+        resolver = CandidateResolver(self.engine, cache, store, pool)
+        self._log(f"Downloading with {pool.concurrency} parallel worker(s)")
+        if self.settings.getboolean("pipeline", fallback=True) and ffmpeg_available():
+            pipeline = TranscodePipeline(
+                pool,
+                on_finished=lambda staged, ok: self.finish_staged_track(
+                    staged, ok, manifest, shared, pool
+                ),
+                audio_format=self.engine.audio_format,
+            )
+            self._log(f"Transcoding on {pipeline.workers} separate worker(s)")
+
+        try:
+            results = pool.run(resolver.prefetch(tasks))
+        finally:
+            resolver.close()
+            if pipeline:
+                pipeline.close()
+            manifest.compact()
+            store.close()
+            failures.save()
+            if cache:
+                cache.close()
+            self.report_metrics(metrics, folder)
+            result.metrics = metrics.summary()
+
+        result.counts = pool.counts(results)
+        result.tracks = len(results)
+        result.cancelled = pool.stopped
+        if len(failures):
+            result.failure_journal = failures.path
+            self._log(
+                f"{len(failures)} track(s) failed permanently, listed in "
+                f"{failures.path}",
+                "warning",
+            )
+
+    def download_track(
+        self,
+        task: TrackTask,
+        pool: TrackDownloadPool,
+        manifest: LibraryManifest,
+        resolver: CandidateResolver,
+        cache: Optional[ResolutionCache] = None,
+        pipeline: Optional[TranscodePipeline] = None,
+        store: Optional[JobStore] = None,
+        shared: Optional[SharedTrackStore] = None,
+    ) -> Union[bool, str]:
+        """Whether the track made it, or HANDED_OFF once the pipeline has it."""
+        self._log(f"[{task.index}] Downloading: {task.query}")
+        on_progress = self.on_progress
+        if store:
+            on_progress = store.watch(task, pool, on_progress)
+        result: Optional[DownloadResult] = None
+
+        # An interrupted earlier attempt is continued from its partial file.
+        video_id = store.video_id(task.track_id) if store and task.track_id else None
+        if video_id:
+            self._log(f"[{task.index}] Resuming interrupted download: {video_id}")
+        elif cache and task.track_id:
+            video_id = cache.get(task.track_id, task.isrc)
+            if video_id:
+                self._log(f"[{task.index}] Using cached match: {video_id}")
+        if video_id and self.link_shared(shared, manifest, task, video_id):
+            return True
+
+        if video_id:
+            pool.set_state(task, DOWNLOADING)
+            result = self.download(task, video_id, pool, pipeline, on_progress)
+            if not result and not pool.stopped:
+                self._log(f"[{task.index}] Cached match failed, searching again")
+                if cache:
+                    cache.invalidate(task.track_id)
+                video_id = None
+
+        if not video_id:
+            pool.set_state(task, RESOLVING)
+            match = resolver.resolve(task)
+            if match is None:
+                if not pool.stopped:
+                    self._log(f"Failed: {task.query} ({task.error})", "warning")
+                return False
+
+            score, candidate = match
+            video_id = candidate["id"]
+            self._log(
+                f"[{task.index}] Matched: {candidate['title']} "
+                f"({video_id}, score {score:.0f})"
+            )
+            self._event(
+                "match",
+                track=task.track_id,
+                video_id=video_id,
+                title=candidate["title"],
+                score=round(score, 1),
+            )
+            if self.link_shared(shared, manifest, task, video_id):
+                if cache and task.track_id:
+                    cache.put(task.track_id, video_id, task.isrc)
+                return True
+            pool.set_state(task, DOWNLOADING)
+            result = self.download(task, video_id, pool, pipeline, on_progress)
+            if result and cache and task.track_id:
+                cache.put(task.track_id, video_id, task.isrc)
+
+        if not result:
+            if not pool.stopped:
+                task.error = result.error or "yt-dlp reported a failure"
+                self._log(f"Failed: {task.query}", "warning")
+            return False
+
+        if pipeline and result.filepath:
+            # Named after the track, not the video: two tracks matched to
+            # videos with the same title would overwrite each other.
+            final_stem = os.path.join(task.output_path, sanitize_filename(task.query))
+            tags = dict(task.tags, **self.metadata(task))
+            return pipeline.submit(
+                StagedTrack(task, result.filepath, final_stem, tags, result.video_id)
+            )
+
+        if result.filepath:
+            self.add_track(manifest, shared, task, result.filepath, result.video_id)
+            self._log(
+                f"[{task.index}] Ready: {os.path.basename(result.filepath)}", "success"
+            )
+        return True
+
+    def download(
+        self,
+        task: TrackTask,
+        video_id: str,
+        pool: TrackDownloadPool,
+        pipeline: Optional[TranscodePipeline] = None,
+        on_progress: ProgressCallback = None,
+    ) -> DownloadResult:
+        # With a pipeline yt-dlp only fetches the audio, ffmpeg converts it.
+        output_path = staging_path(task.output_path) if pipeline else task.output_path
+        return self.engine.download(
+            video_url(video_id),
+            output_path,
+            on_line=self.on_line,
+            on_progress=on_progress,
+            pool=pool,
+            metadata=self.metadata(task),
+            fetch_only=pipeline is not None,
+        )
+
+    def metadata(self, task: TrackTask) -> Dict[str, str]:
+        """Tags written to the file, the comment lets a manifest be rebuilt."""
+        return {"comment": track_tag(task.track_id)} if task.track_id else {}
+
+    def link_shared(
+        self,
+        shared: Optional[SharedTrackStore],
+        manifest: LibraryManifest,
+        task: TrackTask,
+        video_id: str,
+    ) -> bool:
+        """Link the video into the playlist folder if another playlist has it."""
+        if not shared:
+            return False
+        linked = shared.link_video(video_id, task.output_path, task.track_id)
+        if not linked:
+            return False
+        if task.track_id:
+            manifest.add(task.track_id, linked, video_id)
+        self._log(
+            f"[{task.index}] Linked from another playlist: {os.path.basename(linked)}",
+            "success",
+        )
+        self._event("linked", track=task.track_id, video_id=video_id, file=linked)
+        return True
+
+    def finish_staged_track(
+        self,
+        staged: StagedTrack,
+        ok: bool,
+        manifest: LibraryManifest,
+        shared: Optional[SharedTrackStore],
+        pool: TrackDownloadPool,
+    ):
+        if not ok:
+            if not pool.stopped:
+                self._log(
+                    f"Transcoding failed for {staged.task.query}: {staged.task.error}",
+                    "warning",
+                )
+            return
+        self.add_track(
+            manifest, shared, staged.task, staged.final_path, staged.video_id
+        )
+        self._log(
+            f"[{staged.task.index}] Ready: {os.path.basename(staged.final_path)}",
+            "success",
+        )
+
+    def add_track(
+        self,
+        manifest: LibraryManifest,
+        shared: Optional[SharedTrackStore],
+        task: TrackTask,
+        path: str,
+        video_id: Optional[str],
+    ):
+        if not task.track_id:
+            return
+        manifest.add(task.track_id, path, video_id)
+        if shared:
+            shared.add(path, task.track_id, video_id)
+
+    def open_shared_store(self, root: str) -> Optional[SharedTrackStore]:
+        if not self.settings.getboolean("shared_store", fallback=True):
+            return None
+        return SharedTrackStore(root, self.engine.audio_format)
+
+    def open_resolution_cache(self) -> Optional[ResolutionCache]:
+        try:
+            return ResolutionCache()
+        except Exception as e:
+            self._log(f"Resolution cache unavailable: {e}", "warning")
+            return None
+
+    def create_controller(self) -> Optional[AdaptiveConcurrency]:
+        if not self.settings.getboolean("adaptive_concurrency", fallback=False):
+            return None
+
+        def report(limit: int, reason: str):
+            self._log(f"Parallel downloads set to {limit} ({reason})")
+            self._event("concurrency", limit=limit, reason=reason)
+
+        limiter = self.engine.limiter
+        return AdaptiveConcurrency(
+            rate_limit=limiter.rate if limiter else 0.0, on_change=report
+        )
+
+    def report_metrics(self, metrics: StageMetrics, folder: str):
+        self._log("Time per stage:")
+        for line in metrics.report_lines():
+            self._log(f"  {line}")
+        try:
+            metrics.save(folder)
+        except OSError as e:
+            self._log(f"Cannot write metrics: {e}", "warning")
+
+    def stop(self, wait: bool = False):
+        if self.current_pool:
+            self.current_pool.stop(wait)
+
+    def _log(self, message: str, level: str = "info"):
+        if self.log:
+            self.log(message, level)
+
+    def _event(self, event: str, **fields: Any):
+        if self.on_event:
+            self.on_event(event, fields)
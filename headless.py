@@ -0,0 +1,514 @@
+import startup_timing
+import argparse
+import configparser
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from track_pool import (
+    DEFAULT_CONCURRENCY,
+    DONE,
+    DOWNLOADING,
+    TrackDownloadPool,
+    TrackTask,
+    clamp_concurrency,
+)
+from ytdlp_engine import (
+    AUDIO_FORMATS,
+    AUDIO_MP3,
+    DEFAULT_FRAGMENTS,
+    ENGINE_AUTO,
+    ENGINE_CHOICES,
+    VideoOptions,
+    create_engine,
+    parse_fragments,
+)
+from spotify_fetch import ARTIST_DISCOGRAPHY, SOURCE_PATTERN, parse_source_urls
+from retry_scheduler import RetryScheduler
+from throttle import AdaptiveConcurrency, parse_rate
+from stage_metrics import MetricsServer, StageMetrics, parse_port
+from converter import ConversionResult, Converter
+
+CONFIG_FILE = "spotify_converter.cfg"
+DEFAULT_CONFIG = {
+    "Spotify": {"client_id": "", "client_secret": ""},
+    "Settings": {
+        "output_path": str(Path.home() / "downloads"),
+        "concurrency": str(DEFAULT_CONCURRENCY),
+        "engine": ENGINE_AUTO,
+        "sync_playlists": "true",
+        "archive_removed": "false",
+        "pipeline": "true",
+        "audio_format": AUDIO_MP3,
+        "bandwidth_limit": "0",
+        "adaptive_concurrency": "false",
+        "artist_tracks": ARTIST_DISCOGRAPHY,
+        "metrics_port": "0",
+        "shared_store": "true",
+        "fragments": str(DEFAULT_FRAGMENTS),
+        "external_downloader": "",
+        "external_downloader_args": "",
+        "parallel_streams": "true",
+    },
+}
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_INTERRUPTED = 130
+
+JOB_YOUTUBE = "youtube"
+JOB_SPOTIFY = "spotify"
+JOB_FAILURES = "failures"
+PROGRESS_INTERVAL = 1.0
+
+_output_lock = threading.Lock()
+
+
+def emit(event: str, **fields: Any):
+    line = json.dumps(dict(event=event, time=round(time.time(), 3), **fields))
+    with _output_lock:
+        sys.stdout.write(line + "\n")
+        sys.stdout.flush()
+
+
+def load_config(path: str) -> configparser.ConfigParser:
+    config = configparser.ConfigParser()
+    config.read_dict(DEFAULT_CONFIG)
+    config.read(path)
+    return config
+
+
+class Job:
+    def __init__(self, number: int, kind: str, url: str, is_video: bool = False):
+        self.number = number
+        self.kind = kind
+        self.url = url
+        self.is_video = is_video
+        self.counts: Dict[str, int] = {}
+        self.skipped = 0
+        self.linked = 0
+        self.error: Optional[str] = None
+        self.failure_journal: Optional[str] = None
+        self.metrics: Optional[Dict[str, Any]] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and set(self.counts) <= {DONE}
+
+
+def parse_job_file(path: str, is_video: bool = False) -> Tuple[List[Job], List[str]]:
+    """One URL per line, optionally prefixed with "music" or "video".
+
+    Blank lines and lines starting with "#" are ignored.
+    """
+    jobs: List[Job] = []
+    errors: List[str] = []
+
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            parts = line.split()
+            if not parts or parts[0].startswith("#"):
+                continue
+
+            video = is_video
+            if len(parts) == 2 and parts[0].lower() in ("music", "video"):
+                video = parts[0].lower() == "video"
+                parts = parts[1:]
+            if len(parts) != 1:
+                errors.append(f"line {line_number}: expected a single URL")
+                continue
+
+            url = parts[0]
+            if "spotify" in url:
+                if SOURCE_PATTERN.search(url):
+                    jobs.append(Job(len(jobs) + 1, JOB_SPOTIFY, url))
+                else:
+                    errors.append(
+                        f"line {line_number}: not a Spotify playlist, album "
+                        "or artist URL"
+                    )
+            elif url.startswith(("http://", "https://")):
+                jobs.append(Job(len(jobs) + 1, JOB_YOUTUBE, url, video))
+            else:
+                errors.append(f"line {line_number}: not a URL: {url}")
+
+    return jobs, errors
+
+
+class HeadlessRunner:
+    def __init__(
+        self,
+        engine: Any,
+        settings: configparser.SectionProxy,
+        spotify: Any = None,
+        verbose: bool = False,
+        progress: bool = True,
+    ):
+        self.engine = engine
+        self.settings = settings
+        self.spotify = spotify
+        self.verbose = verbose
+        self.progress = progress
+        self.output_path = settings["output_path"]
+        self.concurrency = clamp_concurrency(settings.get("concurrency"))
+        self.current_pool: Optional[TrackDownloadPool] = None
+        self._last_progress: Dict[str, float] = {}
+        # Covers every job of the run, it is what the metrics endpoint serves.
+        self.metrics = StageMetrics(keep_tracks=False)
+
+    def log(self, message: str, level: str = "info"):
+        if level in ("warning", "error"):
+            emit(level, message=message)
+        elif self.verbose:
+            with _output_lock:
+                print(message, file=sys.stderr)
+
+    def on_line(self, line: str):
+        if self.verbose:
+            with _output_lock:
+                print(line, file=sys.stderr)
+
+    def on_progress(self, data: Dict[str, Any]):
+        if not self.progress or data.get("status") != "downloading":
+            return
+
+        # Progress ticks arrive many times per second per download, so each
+        # file reports at most once per PROGRESS_INTERVAL.
+        filename = data.get("filename") or ""
+        now = time.monotonic()
+        if now - self._last_progress.get(filename, 0) < PROGRESS_INTERVAL:
+            return
+        self._last_progress[filename] = now
+
+        progress = data.get("progress", {})
+        emit(
+            "progress",
+            file=os.path.basename(filename),
+            percent=round(progress.get("percent", 0), 1),
+            speed=progress.get("speed"),
+            eta=progress.get("eta"),
+        )
+
+    def on_event(self, job: Job, name: str, fields: Dict[str, Any]):
+        if name == "source":
+            name = os.path.basename(fields["folder"])
+            emit("job", job=job.number, kind=fields["kind"], url=job.url, name=name)
+        else:
+            emit(name, job=job.number, **fields)
+
+    def attach(self, pool: TrackDownloadPool):
+        self.current_pool = pool
+
+    def converter(self, job: Job) -> Converter:
+        return Converter(
+            self.engine,
+            self.settings,
+            self.spotify,
+            log=self.log,
+            on_line=self.on_line,
+            on_progress=self.on_progress,
+            on_event=lambda name, fields: self.on_event(job, name, fields),
+            on_pool=self.attach,
+            metrics=self.metrics,
+        )
+
+    def create_controller(self) -> Optional[AdaptiveConcurrency]:
+        if not self.settings.getboolean("adaptive_concurrency", fallback=False):
+            return None
+
+        def report(limit: int, reason: str):
+            emit("concurrency", job=None, limit=limit, reason=reason)
+
+        limiter = self.engine.limiter
+        return AdaptiveConcurrency(
+            rate_limit=limiter.rate if limiter else 0.0, on_change=report
+        )
+
+    def run_youtube(self, jobs: List[Job]):
+        os.makedirs(self.output_path, exist_ok=True)
+        by_index = {job.number: job for job in jobs}
+
+        def download_job(task: TrackTask, pool: TrackDownloadPool) -> bool:
+            job = by_index[task.index]
+            pool.set_state(task, DOWNLOADING)
+            result = self.engine.download(
+                task.query,
+                task.output_path,
+                job.is_video,
+                on_line=self.on_line,
+                on_progress=self.on_progress,
+                pool=pool,
+            )
+            if result.streams:
+                emit("streams", job=job.number, streams=result.streams)
+            if not result and not pool.stopped:
+                task.error = result.error or "yt-dlp reported a failure"
+            return bool(result)
+
+        def report(task: TrackTask):
+            emit(
+                "job",
+                job=task.index,
+                kind=JOB_YOUTUBE,
+                url=task.query,
+                state=task.state,
+                error=task.error,
+            )
+
+        tasks = [TrackTask(job.number, job.url, self.output_path) for job in jobs]
+        self.current_pool = TrackDownloadPool(
+            download_job,
+            concurrency=self.concurrency,
+            on_state=report,
+            retry=RetryScheduler(),
+            controller=self.create_controller(),
+            metrics=self.metrics,
+        )
+        for task in self.current_pool.run(tasks):
+            job = by_index[task.index]
+            job.counts = {task.state: 1}
+            job.error = task.error
+
+    def run_spotify(self, job: Job):
+        if self.spotify is None:
+            job.error = "Spotify client is not configured"
+            return
+
+        kind, source_id = parse_source_urls(job.url)[0]
+        self.record(job, self.converter(job).convert_source(kind, source_id))
+
+    def run_failures(self, job: Job):
+        emit("job", job=job.number, kind=JOB_FAILURES, url=job.url)
+        self.record(job, self.converter(job).retry_failed(job.url))
+
+    def record(self, job: Job, result: ConversionResult):
+        job.counts = result.counts
+        job.skipped = result.skipped
+        job.linked = result.linked
+        job.failure_journal = result.failure_journal
+        job.metrics = result.metrics
+
+    def stop(self):
+        if self.current_pool:
+            # Waits for the watcher, the process groups outlive this one.
+            self.current_pool.stop(wait=True)
+
+
+def initialize_spotify_client(
+    config: configparser.ConfigParser, config_path: Optional[str] = None
+) -> Any:
+    from spotify_client import create_spotify_client
+
+    # Empty credentials fall back to the SPOTIPY_CLIENT_ID and
+    # SPOTIPY_CLIENT_SECRET environment variables.
+    return create_spotify_client(
+        config["Spotify"]["client_id"] or None,
+        config["Spotify"]["client_secret"] or None,
+        config_path,
+    )
+
+
+def interrupt(signum: int, frame: Any):
+    # cron and systemd stop the runner with SIGTERM. yt-dlp and ffmpeg run in
+    # sessions of their own, so they need the same cleanup as Ctrl+C.
+    raise KeyboardInterrupt
+
+
+def emit_job_done(job: Job):
+    emit(
+        "job_done",
+        job=job.number,
+        ok=job.ok,
+        counts=job.counts,
+        skipped=job.skipped,
+        linked=job.linked,
+        error=job.error,
+        failure_journal=job.failure_journal,
+        metrics=job.metrics,
+    )
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Download YouTube URLs and Spotify playlists, albums and "
+        "artists listed in a job file, reporting progress as JSON lines on stdout."
+    )
+    parser.add_argument(
+        "job_file", nargs="?", help="file with one URL per line, or - for stdin"
+    )
+    parser.add_argument(
+        "--retry-failed",
+        action="append",
+        default=[],
+        metavar="DIR",
+        help="re-run only the tracks that failed for good in a playlist folder",
+    )
+    parser.add_argument("-o", "--output", help="output directory")
+    parser.add_argument("-j", "--concurrency", type=int, help="parallel downloads")
+    parser.add_argument("--engine", choices=ENGINE_CHOICES)
+    parser.add_argument("--audio-format", choices=AUDIO_FORMATS)
+    parser.add_argument(
+        "--limit-rate", help="total bandwidth cap, e.g. 2M or 500K (0 = unlimited)"
+    )
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="adjust parallel downloads to measured throughput and throttling",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="serve Prometheus metrics on this localhost port while running",
+    )
+    parser.add_argument(
+        "--video", action="store_true", help="download YouTube URLs as video"
+    )
+    parser.add_argument(
+        "--fragments",
+        type=int,
+        help="fragments of a video fetched at the same time (1-16)",
+    )
+    parser.add_argument(
+        "--downloader", help="external downloader for videos, e.g. aria2c"
+    )
+    parser.add_argument("--config", default=CONFIG_FILE, help="settings file")
+    parser.add_argument(
+        "--no-progress", action="store_true", help="omit download progress events"
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="echo yt-dlp output to stderr"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    startup_timing.mark("imports")
+    args = parse_args(argv)
+    config = load_config(args.config)
+    settings = config["Settings"]
+    if args.output:
+        settings["output_path"] = args.output
+    if args.concurrency is not None:
+        settings["concurrency"] = str(args.concurrency)
+    if args.engine:
+        settings["engine"] = args.engine
+    if args.audio_format:
+        settings["audio_format"] = args.audio_format
+    if args.limit_rate:
+        settings["bandwidth_limit"] = args.limit_rate
+    if args.adaptive:
+        settings["adaptive_concurrency"] = "true"
+    if args.metrics_port is not None:
+        settings["metrics_port"] = str(args.metrics_port)
+    if args.fragments is not None:
+        settings["fragments"] = str(args.fragments)
+    if args.downloader is not None:
+        settings["external_downloader"] = args.downloader
+
+    jobs: List[Job] = []
+    errors: List[str] = []
+    if args.job_file:
+        try:
+            job_file = "/dev/stdin" if args.job_file == "-" else args.job_file
+            jobs, errors = parse_job_file(job_file, args.video)
+        except OSError as e:
+            emit("error", message=f"Cannot read job file: {e}")
+            return EXIT_USAGE
+    for folder in args.retry_failed:
+        if os.path.isdir(folder):
+            jobs.append(Job(len(jobs) + 1, JOB_FAILURES, folder))
+        else:
+            errors.append(f"not a directory: {folder}")
+
+    for message in errors:
+        emit("error", message=message)
+    if errors or not jobs:
+        if not jobs:
+            emit("error", message="No jobs to run")
+        return EXIT_USAGE
+
+    spotify = None
+    if any(job.kind == JOB_SPOTIFY for job in jobs):
+        try:
+            spotify = initialize_spotify_client(config, args.config)
+        except Exception as e:
+            emit("error", message=f"Spotify client error: {e}")
+            return EXIT_USAGE
+
+    engine = create_engine(
+        settings.get("engine"),
+        settings.get("audio_format"),
+        parse_rate(settings.get("bandwidth_limit")),
+        VideoOptions(
+            parse_fragments(settings.get("fragments")),
+            settings.get("external_downloader", ""),
+            settings.get("external_downloader_args", ""),
+            settings.getboolean("parallel_streams", fallback=True),
+        ),
+    )
+    startup_timing.report("headless")
+    runner = HeadlessRunner(
+        engine,
+        settings,
+        spotify=spotify,
+        verbose=args.verbose,
+        progress=not args.no_progress,
+    )
+    emit(
+        "start",
+        jobs=len(jobs),
+        engine=engine.name,
+        audio_format=engine.audio_format,
+        concurrency=runner.concurrency,
+        output=runner.output_path,
+    )
+
+    server = None
+    port = parse_port(settings.get("metrics_port"))
+    if port:
+        try:
+            server = MetricsServer(runner.metrics, port)
+            emit("metrics_endpoint", url=server.url)
+        except OSError as e:
+            emit("warning", message=f"Metrics endpoint unavailable: {e}")
+
+    signal.signal(signal.SIGTERM, interrupt)
+    try:
+        youtube_jobs = [job for job in jobs if job.kind == JOB_YOUTUBE]
+        if youtube_jobs:
+            runner.run_youtube(youtube_jobs)
+            for job in youtube_jobs:
+                emit_job_done(job)
+
+        for job in jobs:
+            if job.kind == JOB_YOUTUBE:
+                continue
+            try:
+                if job.kind == JOB_SPOTIFY:
+                    runner.run_spotify(job)
+                else:
+                    runner.run_failures(job)
+            except Exception as e:
+                job.error = str(e)
+            emit_job_done(job)
+    except KeyboardInterrupt:
+        runner.stop()
+        emit("interrupted")
+        return EXIT_INTERRUPTED
+    finally:
+        if server:
+            server.close()
+
+    failed = [job.number for job in jobs if not job.ok]
+    emit("summary", jobs=len(jobs), failed=failed, metrics=runner.metrics.summary())
+    return EXIT_FAILED if failed else EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
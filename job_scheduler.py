@@ -0,0 +1,174 @@
+import heapq
+import itertools
+import threading
+from typing import Any, Callable, List, Optional
+
+from track_pool import CANCELLED, DONE, FAILED, clamp_concurrency
+
+
+QUEUED = "queued"
+ACTIVE = "active"
+
+# Lower runs first. Single downloads are started by hand and expected to
+# finish while the user waits, playlist tracks are bulk work.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+
+class Job:
+    """A single download or playlist conversion in the job list.
+
+    Its TrackDownloadPool uses the job as gate: every track takes one of the
+    scheduler's download slots first and frees it again when it is done.
+    """
+
+    def __init__(self, number: int, label: str, priority: int, scheduler: Any):
+        self.number = number
+        self.label = label
+        self.priority = priority
+        self.state = QUEUED
+        self.error: Optional[str] = None
+        self.active = 0
+        self.pool: Any = None
+        self.cancel_event = threading.Event()
+        self.finished_event = threading.Event()
+        self._scheduler = scheduler
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_event.is_set()
+
+    def attach(self, pool: Any):
+        """Make pool the one cancel() stops, stopping it at once if cancelled."""
+        self.pool = pool
+        if self.cancelled:
+            pool.stop_event.set()
+
+    def acquire(self, stop_event: threading.Event) -> bool:
+        return self._scheduler.acquire(self, stop_event)
+
+    def release(self):
+        self._scheduler.release(self)
+
+
+class JobScheduler:
+    """Runs jobs side by side on one shared budget of download slots.
+
+    Each job runs in its own thread with its own pool. A freed slot goes to
+    the waiting job with the best priority, oldest request first, so a single
+    download starts with the next free slot even behind a playlist with
+    thousands of queued tracks.
+    """
+
+    def __init__(self, slots: int, on_change: Optional[Callable[[], None]] = None):
+        self.slots = clamp_concurrency(slots)
+        self.on_change = on_change
+        # Bumped on every change so a UI can poll for redraws.
+        self.version = 0
+        self._jobs: List[Job] = []
+        self._waiting: List[Any] = []
+        self._used = 0
+        self._numbers = itertools.count(1)
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+
+    def jobs(self) -> List[Job]:
+        with self._cond:
+            return list(self._jobs)
+
+    def submit(
+        self,
+        label: str,
+        run: Callable[[Job], Any],
+        priority: int = PRIORITY_BULK,
+    ) -> Job:
+        """Start run(job) in a new thread. A False result marks the job failed."""
+        with self._cond:
+            job = Job(next(self._numbers), label, priority, self)
+            self._jobs.append(job)
+        self._changed()
+        thread = threading.Thread(
+            target=self._run, args=(job, run), name=f"job-{job.number}", daemon=True
+        )
+        thread.start()
+        return job
+
+    def rename(self, job: Job, label: str):
+        job.label = label
+        self._changed()
+
+    def set_slots(self, slots: int):
+        with self._cond:
+            self.slots = clamp_concurrency(slots)
+            self._cond.notify_all()
+        self._changed()
+
+    def acquire(self, job: Job, stop_event: threading.Event) -> bool:
+        """Wait for a download slot for one of job's tracks.
+
+        False if stop_event is set first.
+        """
+        entry = (job.priority, next(self._sequence))
+        with self._cond:
+            heapq.heappush(self._waiting, entry)
+            try:
+                while not stop_event.is_set():
+                    if self._used < self.slots and self._waiting[0] == entry:
+                        heapq.heappop(self._waiting)
+                        self._used += 1
+                        job.active += 1
+                        job.state = ACTIVE
+                        break
+                    self._cond.wait(0.2)
+                else:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+                    return False
+            finally:
+                # The next waiter may be able to go now.
+                self._cond.notify_all()
+        self._changed()
+        return True
+
+    def release(self, job: Job):
+        with self._cond:
+            self._used -= 1
+            job.active -= 1
+            self._cond.notify_all()
+        self._changed()
+
+    def cancel(self, job: Job):
+        """Stop job's downloads without waiting for its processes to exit."""
+        job.cancel_event.set()
+        self._changed()
+        if job.pool is not None:
+            job.pool.stop()
+
+    def cancel_all(self):
+        for job in self.jobs():
+            self.cancel(job)
+
+    def _run(self, job: Job, run: Callable[[Job], Any]):
+        try:
+            ok = run(job) is not False
+        except Exception as e:
+            job.error = str(e)
+            ok = False
+
+        if job.cancelled:
+            job.state = CANCELLED
+        else:
+            job.state = DONE if ok else FAILED
+        with self._cond:
+            self._jobs.remove(job)
+        job.finished_event.set()
+        self._changed()
+
+    def _changed(self):
+        self.version += 1
+        if self.on_change:
+            self.on_change()
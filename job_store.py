@@ -0,0 +1,111 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from track_pool import (
+    CANCELLED,
+    DOWNLOADING,
+    PENDING,
+    RESOLVING,
+    TRANSCODING,
+    TrackTask,
+)
+
+
+JOB_FILE = ".jobs.db"
+UNFINISHED_STATES = (PENDING, RESOLVING, DOWNLOADING, TRANSCODING)
+
+ProgressCallback = Optional[Callable[[Dict[str, Any]], None]]
+
+
+class JobStore:
+    def __init__(self, directory: str):
+        self.path = os.path.join(directory, JOB_FILE)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        # WAL keeps every state change durable without rewriting the database
+        # file, and a crash at any point leaves the last committed state.
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS tracks (
+                track_id TEXT PRIMARY KEY,
+                position INTEGER,
+                query TEXT,
+                state TEXT NOT NULL,
+                video_id TEXT,
+                error TEXT,
+                updated_at REAL NOT NULL
+            );
+            """)
+        self._conn.commit()
+
+    def record(self, task: TrackTask):
+        if not task.track_id:
+            return
+
+        # A cancelled track is still owed a download, so it goes back to
+        # pending and keeps the video ID its partial file belongs to.
+        state = PENDING if task.state == CANCELLED else task.state
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO tracks "
+                "(track_id, position, query, state, error, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (track_id) DO UPDATE SET position = excluded.position, "
+                "query = excluded.query, state = excluded.state, "
+                "error = excluded.error, updated_at = excluded.updated_at",
+                (task.track_id, task.index, task.query, state, task.error, time.time()),
+            )
+            self._conn.commit()
+
+    def set_video_id(self, track_id: str, video_id: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE tracks SET video_id = ?, updated_at = ? WHERE track_id = ?",
+                (video_id, time.time(), track_id),
+            )
+            self._conn.commit()
+
+    def video_id(self, track_id: str) -> Optional[str]:
+        """Video an unfinished earlier attempt at this track was fetching."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT video_id FROM tracks WHERE track_id = ? AND state IN "
+                f"({', '.join('?' * len(UNFINISHED_STATES))})",
+                (track_id,) + UNFINISHED_STATES,
+            ).fetchone()
+        return row[0] if row else None
+
+    def unfinished(self) -> int:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) FROM tracks WHERE video_id IS NOT NULL AND state IN "
+                f"({', '.join('?' * len(UNFINISHED_STATES))})",
+                UNFINISHED_STATES,
+            ).fetchone()
+        return row[0]
+
+    def watch(
+        self, task: TrackTask, pool: Any, on_progress: ProgressCallback = None
+    ) -> Callable[[Dict[str, Any]], None]:
+        """Wrap a progress callback to record the video a track resolved to."""
+        known = {"video_id": None}
+
+        def hook(data: Dict[str, Any]):
+            video_id = data.get("video_id")
+            if video_id and video_id != known["video_id"] and task.track_id:
+                known["video_id"] = video_id
+                self.set_video_id(task.track_id, video_id)
+                if task.state == RESOLVING:
+                    pool.set_state(task, DOWNLOADING)
+            if on_progress:
+                on_progress(data)
+
+        return hook
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,177 @@
+import json
+import os
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+
+MANIFEST_FILE = ".library.json"
+JOURNAL_FILE = ".library.journal"
+AUDIO_EXTENSIONS = (".mp3", ".m4a", ".opus", ".ogg", ".webm", ".flac")
+TAG_PREFIX = "spotify:track:"
+
+LogCallback = Optional[Callable[[str, str], None]]
+
+
+def track_tag(track_id: str) -> str:
+    return f"{TAG_PREFIX}{track_id}"
+
+
+class LibraryManifest:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path = os.path.join(directory, MANIFEST_FILE)
+        self.journal_path = os.path.join(directory, JOURNAL_FILE)
+        self.tracks: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, directory: str, log: LogCallback = None) -> "LibraryManifest":
+        manifest = cls(directory)
+        snapshot = manifest._read_snapshot()
+        journal = list(manifest._read_journal())
+
+        rebuilt = False
+        if snapshot is None and not journal:
+            rebuilt = manifest.rebuild(log)
+            if rebuilt and log:
+                log(f"Rebuilt library manifest with {len(manifest)} track(s)", "info")
+        else:
+            manifest.tracks = snapshot or {}
+            for entry in journal:
+                manifest.tracks[entry.pop("track_id")] = entry
+
+        # A failed rebuild (no ffprobe yet) writes nothing, an empty snapshot
+        # would keep every later load from trying again.
+        if journal or rebuilt:
+            manifest.compact()
+        return manifest
+
+    def __len__(self) -> int:
+        return len(self.tracks)
+
+    def has(self, track_id: Optional[str]) -> bool:
+        entry = self.tracks.get(track_id) if track_id else None
+        if not entry:
+            return False
+        return os.path.exists(os.path.join(self.directory, entry["file"]))
+
+    def get_path(self, track_id: str) -> Optional[str]:
+        entry = self.tracks.get(track_id)
+        return os.path.join(self.directory, entry["file"]) if entry else None
+
+    def add(self, track_id: str, filepath: str, video_id: Optional[str] = None):
+        entry = {"file": os.path.relpath(filepath, self.directory), "video_id": video_id}
+        line = json.dumps(dict(entry, track_id=track_id)) + "\n"
+
+        with self._lock:
+            self.tracks[track_id] = entry
+            # A single appended line is the unit of durability, a torn final
+            # line is simply dropped when the journal is read back.
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def remove(self, track_ids: Iterable[str]):
+        with self._lock:
+            for track_id in track_ids:
+                self.tracks.pop(track_id, None)
+            self._write_snapshot()
+
+    def compact(self):
+        with self._lock:
+            self._write_snapshot()
+
+    def rebuild(self, log: LogCallback = None) -> bool:
+        ffprobe = shutil.which("ffprobe")
+        if not ffprobe:
+            if log:
+                log("ffprobe not found, cannot rebuild library manifest", "warning")
+            return False
+
+        files = [
+            name
+            for name in os.listdir(self.directory)
+            if name.lower().endswith(AUDIO_EXTENSIONS)
+        ]
+        if not files:
+            return False
+
+        with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1)) as executor:
+            tags = executor.map(lambda name: read_track_tag(ffprobe, self._abs(name)), files)
+            for name, track_id in zip(files, tags):
+                if track_id:
+                    self.tracks[track_id] = {"file": name, "video_id": None}
+
+        return bool(self.tracks)
+
+    def _abs(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _read_snapshot(self) -> Optional[Dict[str, Dict[str, Any]]]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f).get("tracks", {})
+        except (OSError, ValueError):
+            return None
+
+    def _read_journal(self) -> Iterator[Dict[str, Any]]:
+        try:
+            with open(self.journal_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if entry.get("track_id") and entry.get("file"):
+                        yield entry
+        except OSError:
+            return
+
+    def _write_snapshot(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "tracks": self.tracks}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+        try:
+            os.remove(self.journal_path)
+        except FileNotFoundError:
+            pass
+
+
+def read_track_tag(ffprobe: str, path: str) -> Optional[str]:
+    try:
+        output = subprocess.run(
+            [
+                ffprobe,
+                "-v",
+                "quiet",
+                "-print_format",
+                "json",
+                "-show_format",
+                "-show_streams",
+                path,
+            ],
+            capture_output=True,
+            text=True,
+            timeout=30,
+        ).stdout
+        probe = json.loads(output or "{}")
+    except (OSError, ValueError, subprocess.SubprocessError):
+        return None
+
+    # Ogg/Opus files carry their tags on the audio stream, not the container.
+    tags = dict(probe.get("format", {}).get("tags", {}))
+    for stream in probe.get("streams", []):
+        tags.update(stream.get("tags", {}))
+
+    for key, value in tags.items():
+        if key.lower() == "comment" and value.startswith(TAG_PREFIX):
+            return value[len(TAG_PREFIX) :]
+    return None
@@ -0,0 +1,200 @@
+import glob
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from async_engine import run_process
+from stage_metrics import STAGE_TRANSCODE, STAGE_TRANSCODE_QUEUE
+from tool_probe import tool_version
+from track_pool import CANCELLED, DONE, FAILED, HANDED_OFF, TRANSCODING, TrackTask
+from ytdlp_engine import AUDIO_M4A, AUDIO_MP3, AUDIO_ORIGINAL
+
+
+STAGING_DIR = ".staging"
+MP4_AUDIO_EXTENSIONS = (".m4a", ".mp4")
+OPUS_AUDIO_EXTENSIONS = (".webm", ".opus", ".ogg")
+
+
+class StagedTrack:
+    def __init__(
+        self,
+        task: TrackTask,
+        audio_path: str,
+        final_stem: str,
+        metadata: Dict[str, str],
+        video_id: Optional[str] = None,
+    ):
+        self.task = task
+        self.audio_path = audio_path
+        self.final_stem = final_stem
+        self.final_path: Optional[str] = None
+        self.metadata = metadata
+        self.video_id = video_id
+        self.queued_at: Optional[float] = None
+
+    @property
+    def thumbnail_path(self) -> Optional[str]:
+        path = os.path.splitext(self.audio_path)[0] + ".jpg"
+        return path if os.path.exists(path) else None
+
+    def cleanup(self):
+        stem = os.path.splitext(self.audio_path)[0]
+        for path in glob.glob(glob.escape(stem) + ".*"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def ffmpeg_available() -> bool:
+    return tool_version("ffmpeg", ("-version",)) is not None
+
+
+def staging_path(output_path: str) -> str:
+    return os.path.join(output_path, STAGING_DIR)
+
+
+def output_format(audio_format: str, source_path: str) -> Tuple[str, List[str]]:
+    source_ext = os.path.splitext(source_path)[1].lower()
+
+    if audio_format == AUDIO_MP3:
+        return ".mp3", ["-c:a", "libmp3lame", "-b:a", "192k", "-id3v2_version", "3"]
+
+    # Remux when the source already has the requested codec, otherwise fall
+    # back to a transcode into it.
+    if audio_format == AUDIO_M4A or (
+        audio_format == AUDIO_ORIGINAL and source_ext not in OPUS_AUDIO_EXTENSIONS
+    ):
+        if source_ext in MP4_AUDIO_EXTENSIONS:
+            return ".m4a", ["-c:a", "copy"]
+        return ".m4a", ["-c:a", "aac", "-b:a", "192k"]
+
+    if source_ext in OPUS_AUDIO_EXTENSIONS:
+        return ".opus", ["-c:a", "copy"]
+    return ".opus", ["-c:a", "libopus", "-b:a", "160k"]
+
+
+def transcode_command(
+    staged: StagedTrack, output_file: str, codec_args: List[str]
+) -> List[str]:
+    command = ["ffmpeg", "-y", "-nostdin", "-v", "error", "-i", staged.audio_path]
+
+    # ffmpeg cannot write cover art into Ogg containers.
+    thumbnail = staged.thumbnail_path
+    if thumbnail and not output_file.endswith(".opus"):
+        cover_codec = "mjpeg" if output_file.endswith(".mp3") else "copy"
+        command += ["-i", thumbnail, "-map", "0:a", "-map", "1:0"]
+        command += ["-c:v", cover_codec, "-disposition:v", "attached_pic"]
+        command += ["-metadata:s:v", "title=Album cover"]
+    else:
+        command += ["-map", "0:a"]
+
+    command += codec_args
+    for key, value in staged.metadata.items():
+        command += ["-metadata", f"{key}={value}"]
+
+    return command + [output_file]
+
+
+class TranscodePipeline:
+    def __init__(
+        self,
+        pool: Any,
+        on_finished: Optional[Callable[[StagedTrack, bool], None]] = None,
+        workers: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        audio_format: str = AUDIO_MP3,
+    ):
+        self.pool = pool
+        self.audio_format = audio_format
+        self.on_finished = on_finished
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        # The bounded queue is what keeps download workers from filling the
+        # staging area faster than the transcoders can empty it.
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size or self.workers * 2)
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"transcode-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, staged: StagedTrack) -> str:
+        """Queue the track, download_fn returns what this returns."""
+        self.pool.set_state(staged.task, TRANSCODING)
+        staged.queued_at = time.monotonic()
+        while True:
+            try:
+                self.queue.put(staged, timeout=0.2)
+                return HANDED_OFF
+            except queue.Full:
+                if self.pool.stopped:
+                    self._finish(staged, False)
+                    return HANDED_OFF
+
+    def close(self):
+        for _ in self._threads:
+            self.queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def _worker(self):
+        while True:
+            staged = self.queue.get()
+            if staged is None:
+                return
+
+            task = staged.task
+            start = time.monotonic()
+            self.pool.record_stage(
+                STAGE_TRANSCODE_QUEUE, start - staged.queued_at, task
+            )
+
+            # Cover art and tags are written by the same ffmpeg run, so their
+            # time is part of the transcode stage.
+            ok = False
+            if not self.pool.stopped:
+                try:
+                    ok = self._transcode(staged)
+                except Exception as e:
+                    task.error = str(e)
+                self.pool.record_stage(STAGE_TRANSCODE, time.monotonic() - start, task)
+            self._finish(staged, ok)
+
+    def _transcode(self, staged: StagedTrack) -> bool:
+        ext, codec_args = output_format(self.audio_format, staged.audio_path)
+        tmp_path = f"{staged.final_stem}.part{ext}"
+
+        returncode, _, stderr = run_process(
+            transcode_command(staged, tmp_path, codec_args), self.pool
+        )
+        if returncode != 0:
+            lines = stderr.strip().splitlines()
+            staged.task.error = (
+                lines[-1] if lines else f"ffmpeg exited with {returncode}"
+            )
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+
+        staged.final_path = staged.final_stem + ext
+        os.replace(tmp_path, staged.final_path)
+        return True
+
+    def _finish(self, staged: StagedTrack, ok: bool):
+        staged.cleanup()
+        if ok:
+            state, staged.task.error = DONE, None
+        elif self.pool.stopped:
+            state = CANCELLED
+        else:
+            state = FAILED
+
+        if self.on_finished:
+            try:
+                self.on_finished(staged, ok)
+            except Exception as e:
+                state, staged.task.error = FAILED, str(e)
+        self.pool.set_state(staged.task, state, staged.task.error)
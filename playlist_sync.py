@@ -0,0 +1,94 @@
+import json
+import os
+import shutil
+from typing import Callable, Iterable, List, Optional
+
+from library_manifest import LibraryManifest
+
+
+STATE_FILE = ".playlist.json"
+ARCHIVE_DIR = "_archive"
+
+LogCallback = Optional[Callable[[str, str], None]]
+
+
+class PlaylistState:
+    def __init__(
+        self,
+        directory: str,
+        playlist_id: Optional[str] = None,
+        snapshot_id: Optional[str] = None,
+        track_ids: Optional[List[str]] = None,
+    ):
+        self.directory = directory
+        self.path = os.path.join(directory, STATE_FILE)
+        self.playlist_id = playlist_id
+        self.snapshot_id = snapshot_id
+        self.track_ids = track_ids or []
+
+    @classmethod
+    def load(cls, directory: str) -> "PlaylistState":
+        try:
+            with open(os.path.join(directory, STATE_FILE), encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return cls(directory)
+
+        return cls(
+            directory,
+            data.get("playlist_id"),
+            data.get("snapshot_id"),
+            data.get("track_ids", []),
+        )
+
+    def is_unchanged(self, playlist_id: str, snapshot_id: Optional[str]) -> bool:
+        return bool(
+            snapshot_id
+            and self.playlist_id == playlist_id
+            and self.snapshot_id == snapshot_id
+        )
+
+    def removed_since(self, track_ids: Iterable[str]) -> List[str]:
+        current = set(track_ids)
+        return [track_id for track_id in self.track_ids if track_id not in current]
+
+    def save(
+        self, playlist_id: str, snapshot_id: Optional[str], track_ids: List[str]
+    ):
+        self.playlist_id = playlist_id
+        self.snapshot_id = snapshot_id
+        self.track_ids = track_ids
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "playlist_id": playlist_id,
+                    "snapshot_id": snapshot_id,
+                    "track_ids": track_ids,
+                },
+                f,
+            )
+        os.replace(tmp_path, self.path)
+
+
+def archive_removed(
+    manifest: LibraryManifest, track_ids: Iterable[str], log: LogCallback = None
+) -> int:
+    archive_path = os.path.join(manifest.directory, ARCHIVE_DIR)
+    archived = []
+
+    for track_id in track_ids:
+        path = manifest.get_path(track_id)
+        if not path:
+            continue
+
+        if os.path.exists(path):
+            os.makedirs(archive_path, exist_ok=True)
+            shutil.move(path, os.path.join(archive_path, os.path.basename(path)))
+            if log:
+                log(f"Archived removed track: {os.path.basename(path)}", "info")
+        archived.append(track_id)
+
+    manifest.remove(archived)
+    return len(archived)
@@ -0,0 +1,99 @@
+import glob
+import os
+import signal
+import subprocess
+import threading
+import time
+from typing import Any, Dict, Iterable, List
+
+
+# Time stopped processes get to exit on their own before they are killed.
+STOP_TIMEOUT = 3.0
+POLL_INTERVAL = 0.1
+
+# Left next to an output file by an interrupted yt-dlp download.
+PARTIAL_SUFFIXES = (".part", ".ytdl")
+PARTIAL_PATTERNS = (".part-Frag*", ".temp.*")
+
+
+def group_kwargs() -> Dict[str, Any]:
+    """Popen arguments that start a process in a process group of its own.
+
+    Signalling the group reaches the ffmpeg or downloader a yt-dlp process
+    started too. The group also no longer gets the terminal's Ctrl+C, so
+    only use it for processes that something will stop.
+    """
+    if os.name == "nt":
+        return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {"start_new_session": True}
+
+
+def signal_group(process: Any, force: bool = False):
+    """Ask the process and its children to exit, or kill them if force."""
+    if process.poll() is not None:
+        return
+    try:
+        if os.name == "nt":
+            if force:
+                subprocess.run(
+                    ["taskkill", "/F", "/T", "/PID", str(process.pid)],
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                )
+            else:
+                process.send_signal(signal.CTRL_BREAK_EVENT)
+        else:
+            os.killpg(process.pid, signal.SIGKILL if force else signal.SIGTERM)
+    except (OSError, ValueError):
+        # Already gone, or not started in a group of its own.
+        try:
+            if force:
+                process.kill()
+            else:
+                process.terminate()
+        except OSError:
+            pass
+
+
+def stop_processes(
+    processes: Iterable[Any], timeout: float = STOP_TIMEOUT
+) -> threading.Thread:
+    """Signal every process group now, kill what is left after timeout.
+
+    The waiting happens on the returned background thread, so the caller is
+    never blocked. Reading the processes' output stays with the threads that
+    started them.
+    """
+    processes = list(processes)
+    for process in processes:
+        signal_group(process)
+
+    def watch():
+        deadline = time.monotonic() + timeout
+        pending = processes
+        while pending and time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            pending = [p for p in pending if p.poll() is None]
+        for process in pending:
+            signal_group(process, force=True)
+
+    watcher = threading.Thread(target=watch, name="stop-watcher", daemon=True)
+    watcher.start()
+    return watcher
+
+
+def remove_partial_files(filenames: Iterable[str]) -> List[str]:
+    """Delete what interrupted downloads of these output files left behind."""
+    removed = []
+    for filename in filenames:
+        stem = os.path.splitext(filename)[0]
+        paths = [filename + suffix for suffix in PARTIAL_SUFFIXES]
+        paths += glob.glob(glob.escape(filename) + PARTIAL_PATTERNS[0])
+        paths += glob.glob(glob.escape(stem) + PARTIAL_PATTERNS[1])
+        for path in paths:
+            try:
+                os.remove(path)
+                removed.append(path)
+            except OSError:
+                pass
+    return removed
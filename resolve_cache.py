@@ -0,0 +1,120 @@
+import sqlite3
+import threading
+import time
+from typing import Optional, Tuple
+
+
+CACHE_FILE = "spotify_converter_cache.db"
+DEFAULT_TTL_DAYS = 90
+DEFAULT_MAX_ENTRIES = 50000
+
+
+class ResolutionCache:
+    def __init__(
+        self,
+        path: str = CACHE_FILE,
+        ttl_days: float = DEFAULT_TTL_DAYS,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ):
+        self.path = path
+        self.ttl = ttl_days * 86400
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS resolutions (
+                track_id TEXT PRIMARY KEY,
+                isrc TEXT,
+                video_id TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS resolutions_isrc ON resolutions (isrc);
+            CREATE INDEX IF NOT EXISTS resolutions_last_used
+                ON resolutions (last_used);
+            """)
+        self._evict()
+        self._conn.commit()
+
+    def get(self, track_id: str, isrc: Optional[str] = None) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._find(track_id, isrc)
+            if row is None:
+                return None
+
+            key, video_id, created_at = row
+            if self.ttl and now - created_at > self.ttl:
+                self._conn.execute("DELETE FROM resolutions WHERE track_id = ?", (key,))
+                self._conn.commit()
+                return None
+
+            self._conn.execute(
+                "UPDATE resolutions SET last_used = ? WHERE track_id = ?", (now, key)
+            )
+            self._conn.commit()
+            return video_id
+
+    def peek(self, track_id: str, isrc: Optional[str] = None) -> Optional[str]:
+        """Like get, but read-only: no last_used update, no commit."""
+        with self._lock:
+            row = self._find(track_id, isrc)
+        if row is None or (self.ttl and time.time() - row[2] > self.ttl):
+            return None
+        return row[1]
+
+    def _find(
+        self, track_id: str, isrc: Optional[str]
+    ) -> Optional[Tuple[str, str, float]]:
+        row = self._conn.execute(
+            "SELECT track_id, video_id, created_at FROM resolutions "
+            "WHERE track_id = ?",
+            (track_id,),
+        ).fetchone()
+        if row is None and isrc:
+            row = self._conn.execute(
+                "SELECT track_id, video_id, created_at FROM resolutions "
+                "WHERE isrc = ? ORDER BY last_used DESC LIMIT 1",
+                (isrc,),
+            ).fetchone()
+        return row
+
+    def put(self, track_id: str, video_id: str, isrc: Optional[str] = None):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO resolutions "
+                "(track_id, isrc, video_id, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (track_id, isrc, video_id, now, now),
+            )
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._evict()
+            self._conn.commit()
+
+    def invalidate(self, track_id: str):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM resolutions WHERE track_id = ?", (track_id,)
+            )
+            self._conn.commit()
+
+    def _evict(self):
+        if self.ttl:
+            self._conn.execute(
+                "DELETE FROM resolutions WHERE created_at < ?",
+                (time.time() - self.ttl,),
+            )
+        if self.max_entries:
+            self._conn.execute(
+                "DELETE FROM resolutions WHERE track_id IN ("
+                "SELECT track_id FROM resolutions ORDER BY last_used DESC "
+                "LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
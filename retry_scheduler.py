@@ -0,0 +1,177 @@
+import json
+import os
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from track_pool import TrackTask
+
+
+FAILURE_FILE = ".failures.json"
+
+THROTTLED = "throttled"
+NETWORK = "network"
+UNAVAILABLE = "unavailable"
+UNKNOWN = "unknown"
+
+# Checked in order, the first matching class wins.
+ERROR_PATTERNS = [
+    (
+        THROTTLED,
+        re.compile(
+            r"HTTP Error 429|Too Many Requests|rate.?limit|"
+            r"confirm you.re not a bot",
+            re.IGNORECASE,
+        ),
+    ),
+    (
+        UNAVAILABLE,
+        re.compile(
+            r"Video unavailable|Private video|has been removed|copyright|"
+            r"not available in your country|members.only|account .*terminated|"
+            r"No video results|Unsupported URL|Requested format is not available",
+            re.IGNORECASE,
+        ),
+    ),
+    (
+        NETWORK,
+        re.compile(
+            r"timed? ?out|Connection|Temporary failure|Network is unreachable|"
+            r"HTTP Error 5\d\d|IncompleteRead|Unable to download|Errno",
+            re.IGNORECASE,
+        ),
+    ),
+]
+
+
+def classify_error(error: Optional[str]) -> str:
+    for error_class, pattern in ERROR_PATTERNS:
+        if error and pattern.search(error):
+            return error_class
+    return UNKNOWN
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts: int, base_delay: float, max_delay: float):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int) -> float:
+        # Full jitter keeps tracks that failed together from retrying together.
+        ceiling = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return random.uniform(0, ceiling)
+
+
+DEFAULT_POLICIES: Dict[str, Optional[RetryPolicy]] = {
+    THROTTLED: RetryPolicy(6, 30.0, 900.0),
+    NETWORK: RetryPolicy(4, 5.0, 120.0),
+    UNKNOWN: RetryPolicy(2, 10.0, 60.0),
+    UNAVAILABLE: None,
+}
+
+
+class FailureJournal:
+    """Tracks that failed for good, stored so they can be re-run on their own."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path = os.path.join(directory, FAILURE_FILE)
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+
+    @classmethod
+    def load(cls, directory: str) -> "FailureJournal":
+        journal = cls(directory)
+        try:
+            with open(journal.path, encoding="utf-8") as f:
+                journal.entries = json.load(f).get("failures", {})
+        except (OSError, ValueError):
+            pass
+        return journal
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def add(self, task: TrackTask, error_class: str):
+        key = task.track_id or task.query
+        with self._lock:
+            self.entries[key] = {
+                "index": task.index,
+                "query": task.query,
+                "label": task.label,
+                "track_id": task.track_id,
+                "isrc": task.isrc,
+                "tags": task.tags,
+                "duration_ms": task.duration_ms,
+                "error": task.error,
+                "error_class": error_class,
+                "attempts": task.attempts,
+                "failed_at": time.time(),
+            }
+            self._dirty = True
+
+    def discard(self, task: TrackTask):
+        with self._lock:
+            if self.entries.pop(task.track_id or task.query, None) is not None:
+                self._dirty = True
+
+    def tasks(self) -> List[TrackTask]:
+        with self._lock:
+            entries = sorted(self.entries.values(), key=lambda entry: entry["index"])
+
+        return [
+            TrackTask(
+                entry["index"],
+                entry["query"],
+                self.directory,
+                label=entry.get("label", ""),
+                track_id=entry.get("track_id"),
+                isrc=entry.get("isrc"),
+                tags=entry.get("tags"),
+                duration_ms=entry.get("duration_ms"),
+            )
+            for entry in entries
+        ]
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            if not self.entries:
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+            else:
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump({"version": 1, "failures": self.entries}, f, indent=1)
+                os.replace(tmp_path, self.path)
+            self._dirty = False
+
+
+class RetryScheduler:
+    def __init__(
+        self,
+        policies: Optional[Dict[str, Optional[RetryPolicy]]] = None,
+        journal: Optional[FailureJournal] = None,
+    ):
+        self.policies = DEFAULT_POLICIES if policies is None else policies
+        self.journal = journal
+
+    def next_delay(self, task: TrackTask) -> Optional[float]:
+        """Seconds to wait before retrying the task, or None to give up."""
+        policy = self.policies.get(classify_error(task.error))
+        if policy is None or task.attempts >= policy.max_attempts:
+            return None
+        return policy.delay(task.attempts)
+
+    def succeeded(self, task: TrackTask):
+        if self.journal is not None:
+            self.journal.discard(task)
+
+    def failed(self, task: TrackTask):
+        if self.journal is not None:
+            self.journal.add(task, classify_error(task.error))
@@ -0,0 +1,113 @@
+import json
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+import requests
+import spotipy
+from requests.adapters import HTTPAdapter
+from spotipy.cache_handler import CacheFileHandler
+from spotipy.oauth2 import SpotifyClientCredentials
+from urllib3.util.retry import Retry
+
+
+TOKEN_CACHE_FILE = ".spotify_token-{client_id}"
+REQUEST_TIMEOUT = 15
+HTTP_RETRIES = 5
+BACKOFF_FACTOR = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+MAX_RETRY_AFTER = 60
+POOL_SIZE = 16
+
+_lock = threading.Lock()
+_session: Optional[requests.Session] = None
+_clients: Dict[Tuple[Optional[str], Optional[str]], spotipy.Spotify] = {}
+
+
+class _CappedRetry(Retry):
+    # A long Retry-After (Spotify sends hours when an app is banned for a
+    # while) would freeze the app, so waits are capped and the request fails
+    # once the retries are used up.
+    def get_retry_after(self, response) -> Optional[float]:
+        retry_after = super().get_retry_after(response)
+        return None if retry_after is None else min(retry_after, MAX_RETRY_AFTER)
+
+
+def shared_session() -> requests.Session:
+    """The one pooled HTTP session every Spotify request goes through."""
+    global _session
+    with _lock:
+        if _session is None:
+            retry = _CappedRetry(
+                total=HTTP_RETRIES,
+                backoff_factor=BACKOFF_FACTOR,
+                status_forcelist=RETRY_STATUSES,
+                allowed_methods=frozenset(["GET", "POST"]),
+                respect_retry_after_header=True,
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(pool_maxsize=POOL_SIZE, max_retries=retry)
+            _session = requests.Session()
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+class _PrivateTokenCache(CacheFileHandler):
+    # The token grants API access until it expires. Older spotipy releases
+    # write it world-readable, newer ones only chmod it after writing.
+    def save_token_to_cache(self, token_info):
+        try:
+            fd = os.open(self.cache_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                # Older releases have no encoder_cls.
+                encoder = getattr(self, "encoder_cls", None)
+                f.write(json.dumps(token_info, cls=encoder))
+            # Created by an earlier version with the default mode.
+            os.chmod(self.cache_path, 0o600)
+        except OSError:
+            pass
+
+
+def token_cache_path(
+    client_id: Optional[str], config_path: Optional[str] = None
+) -> str:
+    """Token file for client_id, in the directory of the config file."""
+    client_id = client_id or os.getenv("SPOTIPY_CLIENT_ID") or "default"
+    directory = os.path.dirname(os.path.abspath(config_path)) if config_path else ""
+    return os.path.join(directory, TOKEN_CACHE_FILE.format(client_id=client_id))
+
+
+def create_spotify_client(
+    client_id: Optional[str],
+    client_secret: Optional[str],
+    config_path: Optional[str] = None,
+) -> spotipy.Spotify:
+    """Client for the credentials, reused for as long as the process runs.
+
+    The access token is kept on disk next to config_path until it expires,
+    so a new session does not start with an OAuth round trip.
+    """
+    key = (client_id, client_secret)
+    with _lock:
+        client = _clients.get(key)
+    if client is not None:
+        return client
+
+    session = shared_session()
+    auth = SpotifyClientCredentials(
+        client_id=client_id,
+        client_secret=client_secret,
+        requests_session=session,
+        requests_timeout=REQUEST_TIMEOUT,
+        cache_handler=_PrivateTokenCache(
+            cache_path=token_cache_path(client_id, config_path)
+        ),
+    )
+    client = spotipy.Spotify(
+        auth_manager=auth,
+        requests_session=session,
+        requests_timeout=REQUEST_TIMEOUT,
+    )
+    with _lock:
+        return _clients.setdefault(key, client)
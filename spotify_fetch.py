@@ -0,0 +1,324 @@
+import itertools
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+PAGE_SIZE = 100
+FETCH_WORKERS = 4
+
+# Most IDs Spotify accepts in one request to the batch endpoints.
+ALBUM_BATCH = 20
+TRACK_BATCH = 50
+ARTIST_ALBUM_PAGE = 50
+ARTIST_ALBUM_GROUPS = "album,single"
+
+SOURCE_PLAYLIST = "playlist"
+SOURCE_ALBUM = "album"
+SOURCE_ARTIST = "artist"
+SOURCE_PATTERN = re.compile(
+    r"(?:open\.spotify\.com/(?:intl-[a-z]+/)?|spotify:)(playlist|album|artist)[/:]"
+    r"([a-zA-Z0-9]+)"
+)
+
+ARTIST_DISCOGRAPHY = "discography"
+ARTIST_TOP_TRACKS = "top"
+
+PLAYLIST_FIELDS = "id,name,snapshot_id,owner(display_name),tracks(total)"
+TRACK_FIELDS = (
+    "items(track(id,name,duration_ms,is_local,type,"
+    "external_ids(isrc),artists(name),album(name)))"
+)
+
+
+class SpotifySource:
+    """A playlist, album or artist whose tracks are downloaded into one folder."""
+
+    def __init__(
+        self,
+        kind: str,
+        source_id: str,
+        name: str,
+        owner: str,
+        total: int,
+        snapshot_id: Optional[str] = None,
+        album_ids: Optional[List[str]] = None,
+        tracks: Optional[List[Dict[str, Any]]] = None,
+        albums: Optional[List[Dict[str, Any]]] = None,
+    ):
+        self.kind = kind
+        self.id = source_id
+        self.name = name
+        self.owner = owner
+        self.total = total
+        self.snapshot_id = snapshot_id
+        self.album_ids = album_ids or []
+        self.tracks = tracks
+        # Album objects fetched already, their track IDs are not requested
+        # again.
+        self.albums = albums or []
+
+
+class SpotifyTrack:
+    """The fields of a track the converter uses, nothing else.
+
+    Raw track objects carry album art, markets and more. Tracks are reduced
+    to this record as each page arrives, so a listing costs the same memory
+    per track however large the playlist is.
+    """
+
+    __slots__ = ("id", "name", "artists", "duration_ms", "isrc", "album")
+
+    def __init__(
+        self,
+        track_id: Optional[str],
+        name: str,
+        artists: Tuple[str, ...],
+        duration_ms: Optional[int] = None,
+        isrc: Optional[str] = None,
+        album: Optional[str] = None,
+    ):
+        self.id = track_id
+        self.name = name
+        self.artists = artists
+        self.duration_ms = duration_ms
+        self.isrc = isrc
+        self.album = album
+
+    @property
+    def artist(self) -> str:
+        return ", ".join(self.artists)
+
+    @property
+    def tags(self) -> Dict[str, str]:
+        tags = {"title": self.name, "artist": self.artist}
+        if self.album:
+            tags["album"] = self.album
+        return tags
+
+
+def parse_source_urls(text: str) -> List[Tuple[str, str]]:
+    """(kind, id) of every Spotify playlist, album or artist URL in the text."""
+    sources: List[Tuple[str, str]] = []
+    for match in SOURCE_PATTERN.finditer(text):
+        if match.groups() not in sources:
+            sources.append(match.groups())
+    return sources
+
+
+def fetch_playlist(spotify: Any, playlist_id: str) -> Dict[str, Any]:
+    return spotify.playlist(playlist_id, fields=PLAYLIST_FIELDS)
+
+
+def fetch_source(
+    spotify: Any,
+    kind: str,
+    source_id: str,
+    artist_tracks: str = ARTIST_DISCOGRAPHY,
+) -> SpotifySource:
+    if kind == SOURCE_PLAYLIST:
+        playlist = fetch_playlist(spotify, source_id)
+        return SpotifySource(
+            kind,
+            source_id,
+            playlist.get("name", "Unknown Playlist"),
+            (playlist.get("owner") or {}).get("display_name", "Unknown"),
+            (playlist.get("tracks") or {}).get("total", 0),
+            playlist.get("snapshot_id"),
+        )
+
+    if kind == SOURCE_ALBUM:
+        album = spotify.album(source_id)
+        artists = ", ".join(artist["name"] for artist in album.get("artists", []))
+        return SpotifySource(
+            kind,
+            source_id,
+            f"{artists} - {album.get('name', 'Unknown Album')}",
+            artists,
+            album.get("total_tracks", 0),
+            albums=[album],
+        )
+
+    artist = spotify.artist(source_id)
+    name = artist.get("name", "Unknown Artist")
+    if artist_tracks == ARTIST_TOP_TRACKS:
+        tracks = spotify.artist_top_tracks(source_id).get("tracks", [])
+        return SpotifySource(
+            kind, source_id, f"{name} - Top Tracks", name, len(tracks), tracks=tracks
+        )
+
+    albums = list(_iter_artist_albums(spotify, source_id))
+    return SpotifySource(
+        kind,
+        source_id,
+        name,
+        name,
+        sum(album.get("total_tracks", 0) for album in albums),
+        album_ids=[album["id"] for album in albums],
+    )
+
+
+def _iter_artist_albums(spotify: Any, artist_id: str) -> Iterator[Dict[str, Any]]:
+    offset = 0
+    while True:
+        page = spotify.artist_albums(
+            artist_id,
+            include_groups=ARTIST_ALBUM_GROUPS,
+            limit=ARTIST_ALBUM_PAGE,
+            offset=offset,
+        )
+        items = page.get("items", [])
+        yield from (album for album in items if album and album.get("id"))
+        offset += len(items)
+        if not items or not page.get("next"):
+            return
+
+
+def normalize_track(track: Optional[Dict[str, Any]]) -> Optional[SpotifyTrack]:
+    if not track or track.get("is_local") or track.get("type", "track") != "track":
+        return None
+
+    return SpotifyTrack(
+        track.get("id"),
+        track.get("name", "Unknown Track"),
+        tuple(artist["name"] for artist in track.get("artists", [])),
+        track.get("duration_ms"),
+        (track.get("external_ids") or {}).get("isrc"),
+        (track.get("album") or {}).get("name"),
+    )
+
+
+def _fetch_page(spotify: Any, playlist_id: str, offset: int) -> List[Dict[str, Any]]:
+    page = spotify.playlist_items(
+        playlist_id,
+        fields=TRACK_FIELDS,
+        limit=PAGE_SIZE,
+        offset=offset,
+        additional_types=("track",),
+    )
+    return page.get("items", [])
+
+
+def _chunks(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    iterator = iter(items)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _ordered(
+    executor: ThreadPoolExecutor,
+    fetch: Callable[[Any], Any],
+    requests: Iterable[Any],
+    depth: int,
+) -> Iterator[Any]:
+    """Results of fetch for every request, run concurrently, yielded in order.
+
+    At most depth requests are in flight, so memory stays bounded.
+    """
+    requests = iter(requests)
+    pending: deque = deque()
+
+    def fill():
+        while len(pending) < depth:
+            request = next(requests, None)
+            if request is None:
+                return
+            pending.append(executor.submit(fetch, request))
+
+    fill()
+    while pending:
+        result = pending.popleft().result()
+        fill()
+        yield result
+
+
+def _album_track_ids(spotify: Any, album: Dict[str, Any]) -> Iterator[str]:
+    # Album objects embed their first page of tracks, only longer albums
+    # need further requests.
+    page = album.get("tracks") or {}
+    offset = 0
+    while True:
+        items = page.get("items", [])
+        yield from (track["id"] for track in items if track and track.get("id"))
+        offset += len(items)
+        if not items or not page.get("next"):
+            return
+        page = spotify.album_tracks(album["id"], limit=TRACK_BATCH, offset=offset)
+
+
+def iter_album_tracks(
+    spotify: Any,
+    album_ids: List[str],
+    workers: int = FETCH_WORKERS,
+    albums: Optional[List[Dict[str, Any]]] = None,
+) -> Iterator[Tuple[int, SpotifyTrack]]:
+    """Tracks of the albums in order, with full metadata from batch requests.
+
+    Simplified album tracks lack the ISRC, so track IDs are collected from
+    up to 20 albums per request and then looked up 50 at a time. albums are
+    album objects fetched already, their tracks come first.
+    """
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="spotify") as ex:
+
+        def fetch_albums(ids: List[str]) -> List[Dict[str, Any]]:
+            return [album for album in spotify.albums(ids)["albums"] if album]
+
+        def fetch_tracks(ids: List[str]) -> List[Dict[str, Any]]:
+            return spotify.tracks(ids)["tracks"]
+
+        def track_ids() -> Iterator[str]:
+            for album in albums or []:
+                yield from _album_track_ids(spotify, album)
+            batches = _chunks(album_ids, ALBUM_BATCH)
+            for fetched in _ordered(ex, fetch_albums, batches, workers * 2):
+                for album in fetched:
+                    yield from _album_track_ids(spotify, album)
+
+        # Discographies repeat tracks across albums, singles and reissues.
+        seen = set()
+        position = 0
+        batches = _chunks(track_ids(), TRACK_BATCH)
+        for tracks in _ordered(ex, fetch_tracks, batches, workers * 2):
+            for item in tracks:
+                track = normalize_track(item)
+                if not track or (track.isrc or track.id) in seen:
+                    continue
+                seen.add(track.isrc or track.id)
+                position += 1
+                yield position, track
+
+
+def iter_source_tracks(
+    spotify: Any, source: SpotifySource, workers: int = FETCH_WORKERS
+) -> Iterator[Tuple[int, SpotifyTrack]]:
+    if source.kind == SOURCE_PLAYLIST:
+        yield from iter_playlist_tracks(spotify, source.id, source.total, workers)
+    elif source.tracks is not None:
+        tracks = (normalize_track(track) for track in source.tracks)
+        yield from enumerate((track for track in tracks if track), 1)
+    else:
+        yield from iter_album_tracks(spotify, source.album_ids, workers, source.albums)
+
+
+def iter_playlist_tracks(
+    spotify: Any,
+    playlist_id: str,
+    total: int,
+    workers: int = FETCH_WORKERS,
+) -> Iterator[Tuple[int, SpotifyTrack]]:
+    # Pages are requested concurrently but yielded in playlist order.
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="spotify") as ex:
+
+        def fetch(offset: int) -> Tuple[int, List[Dict[str, Any]]]:
+            return offset, _fetch_page(spotify, playlist_id, offset)
+
+        offsets = range(0, total, PAGE_SIZE)
+        for offset, items in _ordered(ex, fetch, offsets, workers * 2):
+            for position, item in enumerate(items, offset + 1):
+                track = normalize_track(item.get("track"))
+                if track:
+                    yield position, track
@@ -0,0 +1,307 @@
+import heapq
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+STAGE_SPOTIFY = "spotify"
+STAGE_QUEUE = "queue"
+STAGE_SEARCH = "search"
+STAGE_EXTRACT = "extract"
+STAGE_DOWNLOAD = "download"
+STAGE_TRANSCODE_QUEUE = "transcode_queue"
+STAGE_TRANSCODE = "transcode"
+STAGE_THUMBNAIL = "thumbnail"
+STAGE_POSTPROCESS = "postprocess"
+STAGES = [
+    STAGE_SPOTIFY,
+    STAGE_QUEUE,
+    STAGE_SEARCH,
+    STAGE_EXTRACT,
+    STAGE_DOWNLOAD,
+    STAGE_TRANSCODE_QUEUE,
+    STAGE_TRANSCODE,
+    STAGE_THUMBNAIL,
+    STAGE_POSTPROCESS,
+]
+
+# yt-dlp postprocessors, by the name their progress hook reports, and the
+# stage they count towards. Any other postprocessor counts as postprocess.
+POSTPROCESSOR_STAGES = {
+    "ExtractAudio": STAGE_TRANSCODE,
+    "Merger": STAGE_TRANSCODE,
+    "EmbedThumbnail": STAGE_THUMBNAIL,
+    "ThumbnailsConvertor": STAGE_THUMBNAIL,
+}
+
+BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+SLOWEST_TRACKS = 5
+METRICS_FILE = ".metrics.json"
+METRIC_PREFIX = "spotify_converter"
+
+
+class Histogram:
+    def __init__(self, bounds: Tuple[float, ...] = BUCKETS):
+        self.bounds = bounds
+        # One count per bucket plus the +Inf bucket, not cumulative.
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def observe(self, seconds: float):
+        index = len(self.bounds)
+        for i, bound in enumerate(self.bounds):
+            if seconds <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        self.maximum = max(self.maximum, seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate interpolated within the bucket, as Prometheus does."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        lower, cumulative = 0.0, 0
+        for bound, count in zip(self.bounds, self.counts):
+            if count and cumulative + count >= rank:
+                estimate = lower + (bound - lower) * (rank - cumulative) / count
+                return min(estimate, self.maximum)
+            cumulative += count
+            lower = bound
+        return self.maximum
+
+
+class StageMetrics:
+    """Time spent per track in each stage of a job.
+
+    Spans are kept per track and folded into one histogram per stage. A
+    parent (the process-wide metrics behind the Prometheus endpoint) receives
+    every span as well.
+    """
+
+    def __init__(
+        self, parent: Optional["StageMetrics"] = None, keep_tracks: bool = True
+    ):
+        self.parent = parent
+        self.keep_tracks = keep_tracks
+        self.started = time.time()
+        self._clock = time.monotonic()
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Histogram] = {}
+        self._slowest: Dict[str, List[Tuple[float, str]]] = {}
+        self._tracks: Dict[Any, Dict[str, float]] = {}
+        self._states: Dict[str, int] = {}
+
+    def record(self, stage: str, seconds: float, task: Any = None):
+        seconds = max(0.0, seconds)
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+            if task is not None:
+                slowest = self._slowest.setdefault(stage, [])
+                entry = (seconds, task.label)
+                if len(slowest) < SLOWEST_TRACKS:
+                    heapq.heappush(slowest, entry)
+                elif entry > slowest[0]:
+                    heapq.heapreplace(slowest, entry)
+                if self.keep_tracks:
+                    stages = self._tracks.setdefault(task, {})
+                    stages[stage] = stages.get(stage, 0.0) + seconds
+
+        if self.parent:
+            self.parent.record(stage, seconds, task)
+
+    @contextmanager
+    def span(self, stage: str, task: Any = None) -> Iterator[None]:
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(stage, time.monotonic() - start, task)
+
+    def record_state(self, state: str):
+        with self._lock:
+            self._states[state] = self._states.get(state, 0) + 1
+        if self.parent:
+            self.parent.record_state(state)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {}
+            for stage in sorted(self._histograms, key=_stage_order):
+                histogram = self._histograms[stage]
+                slowest = sorted(self._slowest.get(stage, []), reverse=True)
+                stages[stage] = {
+                    "count": histogram.count,
+                    "total": round(histogram.total, 3),
+                    "mean": round(histogram.total / histogram.count, 3),
+                    "p50": _round(histogram.quantile(0.5)),
+                    "p90": _round(histogram.quantile(0.9)),
+                    "p99": _round(histogram.quantile(0.99)),
+                    "max": round(histogram.maximum, 3),
+                    "slowest": [
+                        {"track": label, "seconds": round(seconds, 3)}
+                        for seconds, label in slowest
+                    ],
+                }
+            return {
+                "wall_time": round(time.monotonic() - self._clock, 3),
+                "tracks": dict(self._states),
+                "stages": stages,
+            }
+
+    def track_spans(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            tracks = sorted(self._tracks.items(), key=lambda item: item[0].index)
+            return [
+                {
+                    "index": task.index,
+                    "label": task.label,
+                    "stages": {
+                        stage: round(seconds, 3)
+                        for stage, seconds in sorted(
+                            stages.items(), key=lambda item: _stage_order(item[0])
+                        )
+                    },
+                }
+                for task, stages in tracks
+            ]
+
+    def report_lines(self) -> List[str]:
+        lines = []
+        for stage, values in self.summary()["stages"].items():
+            lines.append(
+                f"{stage}: {values['count']}x, total {values['total']:.1f}s, "
+                f"mean {values['mean']:.2f}s, p90 {values['p90']:.2f}s, "
+                f"max {values['max']:.2f}s"
+            )
+        return lines
+
+    def save(self, directory: str) -> str:
+        """Write the summary and every track's spans to the job folder."""
+        path = os.path.join(directory, METRICS_FILE)
+        data = dict(self.summary(), started=round(self.started, 3))
+        data["per_track"] = self.track_spans()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1)
+        os.replace(tmp_path, path)
+        return path
+
+    def prometheus_text(self) -> str:
+        name = f"{METRIC_PREFIX}_stage_seconds"
+        lines = [
+            f"# HELP {name} Time spent per track in each stage.",
+            f"# TYPE {name} histogram",
+        ]
+        with self._lock:
+            for stage in sorted(self._histograms, key=_stage_order):
+                histogram = self._histograms[stage]
+                cumulative = 0
+                for bound, count in zip(histogram.bounds, histogram.counts):
+                    cumulative += count
+                    lines.append(
+                        f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}'
+                    )
+                lines.append(
+                    f'{name}_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}'
+                )
+                lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.total:.6f}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+
+            tracks = f"{METRIC_PREFIX}_tracks_total"
+            lines.append(f"# HELP {tracks} Tracks that reached a final state.")
+            lines.append(f"# TYPE {tracks} counter")
+            for state, count in sorted(self._states.items()):
+                lines.append(f'{tracks}{{state="{state}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+class TimedCalls:
+    """Proxy that records every method call on the wrapped object as a span.
+
+    Wrapped around the Spotify client, it times each API page without
+    spotify_fetch knowing about metrics.
+    """
+
+    def __init__(self, target: Any, metrics: StageMetrics, stage: str):
+        self._target = target
+        self._metrics = metrics
+        self._stage = stage
+
+    def __getattr__(self, name: str) -> Any:
+        value = getattr(self._target, name)
+        if not callable(value):
+            return value
+
+        def timed(*args, **kwargs):
+            with self._metrics.span(self._stage):
+                return value(*args, **kwargs)
+
+        return timed
+
+
+class MetricsServer:
+    """Serves the metrics in Prometheus text format on localhost."""
+
+    def __init__(self, metrics: StageMetrics, port: int, host: str = "127.0.0.1"):
+        # Loaded on first use, http.server is slow to import and only needed
+        # when a metrics port is set.
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(
+            target=self.httpd.serve_forever, name="metrics", daemon=True
+        )
+        self.thread.start()
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def parse_port(value: Any) -> int:
+    try:
+        port = int(value)
+    except (TypeError, ValueError):
+        return 0
+    return port if 0 < port < 65536 else 0
+
+
+def _stage_order(stage: str) -> Tuple[int, str]:
+    return (STAGES.index(stage) if stage in STAGES else len(STAGES), stage)
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value, 3)
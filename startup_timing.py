@@ -0,0 +1,96 @@
+import builtins
+import json
+import os
+import sys
+import time
+from typing import Any, List, Tuple
+
+
+# Entry points import this module before anything else, so the import timer
+# sees every module they load.
+TIMING_ENV = "SPOTIFY_CONVERTER_TIMING"
+TIMING_LOG = "startup_times.jsonl"
+REPORT_IMPORTS = 10
+
+enabled = os.environ.get(TIMING_ENV, "").lower() in ("1", "true", "yes")
+
+_started = time.perf_counter()
+_marks: List[Tuple[str, float]] = []
+_imports: List[Tuple[str, float]] = []
+_depth = 0
+_reported = False
+
+
+def _install_import_timer():
+    original_import = builtins.__import__
+
+    def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+        global _depth
+        if level or name in sys.modules:
+            return original_import(name, globals, locals, fromlist, level)
+
+        # Only imports made directly by the app are recorded, their time
+        # includes everything they import in turn (the cumulative column of
+        # -X importtime).
+        start = time.perf_counter()
+        _depth += 1
+        try:
+            return original_import(name, globals, locals, fromlist, level)
+        finally:
+            _depth -= 1
+            if _depth == 0:
+                _imports.append((name, time.perf_counter() - start))
+
+    builtins.__import__ = timed_import
+
+
+def mark(phase: str):
+    """Record the end of a startup phase when SPOTIFY_CONVERTER_TIMING is set."""
+    if enabled:
+        _marks.append((phase, time.perf_counter()))
+
+
+def report(entry_point: str):
+    """Print the time spent in each phase and the slowest imports to stderr.
+
+    Every report is also appended to startup_times.jsonl so launches can be
+    compared over time.
+    """
+    global _reported
+    if not enabled or _reported:
+        return
+    _reported = True
+    mark("ready")
+
+    phases = {}
+    previous = _started
+    for phase, timestamp in _marks:
+        phases[phase] = round(timestamp - previous, 4)
+        previous = timestamp
+    imports = sorted(_imports, key=lambda item: item[1], reverse=True)
+
+    lines = [f"Startup of {entry_point}: {previous - _started:.3f}s"]
+    lines += [f"  {phase:<24}{seconds:8.3f}s" for phase, seconds in phases.items()]
+    lines.append("  slowest imports:")
+    lines += [
+        f"    {name:<22}{seconds:8.3f}s" for name, seconds in imports[:REPORT_IMPORTS]
+    ]
+    print("\n".join(lines), file=sys.stderr)
+
+    record: Any = {
+        "time": round(time.time(), 3),
+        "entry_point": entry_point,
+        "python": sys.version.split()[0],
+        "total": round(previous - _started, 4),
+        "phases": phases,
+        "imports": {name: round(seconds, 4) for name, seconds in imports},
+    }
+    try:
+        with open(TIMING_LOG, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+    except OSError:
+        pass
+
+
+if enabled:
+    _install_import_timer()
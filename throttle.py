@@ -0,0 +1,180 @@
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from retry_scheduler import NETWORK, THROTTLED, classify_error
+from track_pool import MAX_CONCURRENCY
+
+
+RATE_PATTERN = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([kmg]?)(?:i?b)?(?:/s)?\s*$", re.I)
+RATE_UNITS = {"": 1, "k": 1024, "m": 1024**2, "g": 1024**3}
+
+ADJUST_INTERVAL = 10.0
+SPEED_TTL = 3.0
+MIN_GAIN = 1.05
+PROBE_AFTER = 6
+
+
+def parse_rate(value: Any) -> float:
+    """Bytes per second from values like "2M", "500K" or "1048576"; 0 if unset."""
+    match = RATE_PATTERN.match(str(value or ""))
+    if not match:
+        return 0.0
+    return float(match.group(1)) * RATE_UNITS[match.group(2).lower()]
+
+
+def format_rate(rate: float) -> str:
+    for unit in ("G", "M", "K"):
+        if rate >= RATE_UNITS[unit.lower()]:
+            return f"{rate / RATE_UNITS[unit.lower()]:.1f}{unit}B/s"
+    return f"{rate:.0f}B/s"
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, amount: float, stop_event: Optional[threading.Event] = None):
+        # Callers may overdraw the bucket and then sleep off the debt, so a
+        # single large chunk never has to be split up.
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= amount
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+        if wait > 0:
+            if stop_event:
+                stop_event.wait(wait)
+            else:
+                time.sleep(wait)
+
+    def share(self, downloads: int) -> float:
+        return self.rate / max(1, downloads)
+
+
+class AdaptiveConcurrency:
+    """AIMD controller for the number of parallel downloads of a pool.
+
+    Adds a worker while throughput keeps growing, steps back when another
+    worker stopped paying off, and halves the workers on throttling.
+    """
+
+    def __init__(
+        self,
+        minimum: int = 1,
+        maximum: int = MAX_CONCURRENCY,
+        interval: float = ADJUST_INTERVAL,
+        rate_limit: float = 0.0,
+        on_change: Optional[Callable[[int, str], None]] = None,
+    ):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.interval = interval
+        self.rate_limit = rate_limit
+        self.on_change = on_change
+        self.pool: Any = None
+        self._lock = threading.Lock()
+        self._speeds: Dict[str, Tuple[float, float]] = {}
+        self._window_start = time.monotonic()
+        self._samples = 0
+        self._throughput_sum = 0.0
+        self._throttled = 0
+        self._network_errors = 0
+        self._last_throughput: Optional[float] = None
+        self._increased = False
+        self._ceiling = maximum
+        self._steady_windows = 0
+
+    def attach(self, pool: Any):
+        self.pool = pool
+
+    def observe(self, event: Dict[str, Any]):
+        filename = event.get("filename") or ""
+        if event.get("status") == "finished":
+            with self._lock:
+                self._speeds.pop(filename, None)
+            return
+
+        speed = event.get("progress", {}).get("speed")
+        if event.get("status") != "downloading" or not isinstance(speed, (int, float)):
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            self._speeds[filename] = (speed, now)
+            self._speeds = {
+                name: sample
+                for name, sample in self._speeds.items()
+                if now - sample[1] < SPEED_TTL
+            }
+            self._samples += 1
+            self._throughput_sum += sum(sample[0] for sample in self._speeds.values())
+        self._maybe_adjust(now)
+
+    def record_error(self, error: Optional[str]):
+        error_class = classify_error(error)
+        with self._lock:
+            if error_class == THROTTLED:
+                self._throttled += 1
+            elif error_class == NETWORK:
+                self._network_errors += 1
+        self._maybe_adjust(time.monotonic())
+
+    def _maybe_adjust(self, now: float):
+        with self._lock:
+            if self.pool is None or now - self._window_start < self.interval:
+                return
+            limit, reason = self._next_limit()
+            self._window_start = now
+            self._samples = 0
+            self._throughput_sum = 0.0
+            self._throttled = 0
+            self._network_errors = 0
+
+        if limit != self.pool.limit:
+            self.pool.set_limit(limit)
+            if self.on_change:
+                self.on_change(limit, reason)
+
+    def _next_limit(self) -> Tuple[int, str]:
+        limit = self.pool.limit
+        throughput = self._throughput_sum / self._samples if self._samples else 0.0
+
+        if self._throttled or self._network_errors > 1:
+            self._ceiling = max(self.minimum, limit - 1)
+            self._increased = False
+            self._last_throughput = None
+            return max(self.minimum, limit // 2), "throttled by the server"
+
+        if not self._samples:
+            return limit, "idle"
+
+        last, self._last_throughput = self._last_throughput, throughput
+        if self._increased and last is not None and throughput < last * MIN_GAIN:
+            self._increased = False
+            self._ceiling = max(self.minimum, limit - 1)
+            return self._ceiling, "no throughput gain"
+        self._increased = False
+
+        # Every so often probe above a ceiling learnt earlier, the network
+        # conditions that set it may have changed since.
+        self._steady_windows += 1
+        if self._steady_windows >= PROBE_AFTER:
+            self._steady_windows = 0
+            self._ceiling = self.maximum
+
+        if self.rate_limit and throughput >= self.rate_limit * 0.9:
+            return limit, "bandwidth limit reached"
+        if limit < min(self._ceiling, self.maximum):
+            self._increased = True
+            return limit + 1, f"throughput {format_rate(throughput)}"
+        return limit, "steady"
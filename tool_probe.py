@@ -0,0 +1,82 @@
+import json
+import os
+import shutil
+import subprocess
+import threading
+from typing import Any, Dict, Optional, Sequence
+
+
+TOOL_CACHE_FILE = ".tool_versions.json"
+PROBE_TIMEOUT = 30
+
+_lock = threading.Lock()
+_versions: Dict[str, Optional[str]] = {}
+
+
+def _load_cache() -> Dict[str, Any]:
+    try:
+        with open(TOOL_CACHE_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(cache: Dict[str, Any]):
+    tmp_path = f"{TOOL_CACHE_FILE}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(cache, f, indent=1)
+        os.replace(tmp_path, TOOL_CACHE_FILE)
+    except OSError:
+        pass
+
+
+def tool_version(name: str, args: Sequence[str] = ("--version",)) -> Optional[str]:
+    """First line the tool prints for its version, None if it does not run.
+
+    Running the binary takes seconds on slow devices, so the answer is kept
+    on disk for as long as the binary's path, size and mtime stay the same.
+    """
+    with _lock:
+        if name in _versions:
+            return _versions[name]
+
+        version = None
+        path = shutil.which(name)
+        if path:
+            path = os.path.realpath(path)
+            stat = os.stat(path)
+            cache = _load_cache()
+            entry = cache.get(path) or {}
+            stamp = (stat.st_mtime, stat.st_size)
+            if (entry.get("mtime"), entry.get("size")) == stamp:
+                version = entry.get("version")
+            else:
+                version = _run_probe(path, args)
+                if version is not None:
+                    cache[path] = {
+                        "mtime": stat.st_mtime,
+                        "size": stat.st_size,
+                        "version": version,
+                    }
+                    _save_cache(cache)
+
+        _versions[name] = version
+        return version
+
+
+def _run_probe(path: str, args: Sequence[str]) -> Optional[str]:
+    try:
+        result = subprocess.run(
+            [path, *args],
+            capture_output=True,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+            timeout=PROBE_TIMEOUT,
+            check=True,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    lines = result.stdout.strip().splitlines()
+    return lines[0] if lines else ""
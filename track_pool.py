@@ -0,0 +1,317 @@
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from process_group import stop_processes
+from stage_metrics import STAGE_QUEUE
+
+
+PENDING = "pending"
+RESOLVING = "resolving"
+DOWNLOADING = "downloading"
+TRANSCODING = "transcoding"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# What download_fn returns once a later stage owns the task, that stage
+# sets its final state. See TranscodePipeline.submit.
+HANDED_OFF = "handed_off"
+
+DEFAULT_CONCURRENCY = 3
+MAX_CONCURRENCY = 16
+
+
+class TrackTask:
+    # Playlists can hold thousands of tasks, slots keep each one small.
+    __slots__ = (
+        "index",
+        "query",
+        "output_path",
+        "label",
+        "track_id",
+        "isrc",
+        "tags",
+        "duration_ms",
+        "state",
+        "error",
+        "attempts",
+        "queued_at",
+    )
+
+    def __init__(
+        self,
+        index: int,
+        query: str,
+        output_path: str,
+        label: str = "",
+        track_id: Optional[str] = None,
+        isrc: Optional[str] = None,
+        tags: Optional[Dict[str, str]] = None,
+        duration_ms: Optional[int] = None,
+    ):
+        self.index = index
+        self.query = query
+        self.output_path = output_path
+        self.label = label or query
+        self.track_id = track_id
+        self.isrc = isrc
+        self.tags = tags or {}
+        self.duration_ms = duration_ms
+        self.state = PENDING
+        self.error: Optional[str] = None
+        self.attempts = 0
+        self.queued_at: Optional[float] = None
+
+
+class TrackDownloadPool:
+    def __init__(
+        self,
+        download_fn: Callable[[TrackTask, "TrackDownloadPool"], Any],
+        concurrency: int = DEFAULT_CONCURRENCY,
+        on_state: Optional[Callable[[TrackTask], None]] = None,
+        retry: Any = None,
+        controller: Any = None,
+        metrics: Any = None,
+        gate: Any = None,
+        keep_partial: bool = False,
+    ):
+        self.download_fn = download_fn
+        self.concurrency = clamp_concurrency(concurrency)
+        self.limit = self.concurrency
+        self.on_state = on_state
+        self.retry = retry
+        self.controller = controller
+        self.metrics = metrics
+        # Download slots shared with other pools, see job_scheduler.
+        self.gate = gate
+        # Playlists resume cancelled tracks from their .part files, single
+        # downloads have them removed.
+        self.keep_partial = keep_partial
+        self.stop_event = threading.Event()
+        self._processes: set = set()
+        self._lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._retries: List[Any] = []
+        self._sequence = itertools.count()
+        self._active = 0
+        self._local = threading.local()
+
+    @property
+    def stopped(self) -> bool:
+        return self.stop_event.is_set()
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    def set_limit(self, limit: int):
+        with self._cond:
+            self.limit = clamp_concurrency(limit)
+            self._cond.notify_all()
+
+    def observe_progress(self, event: Dict[str, Any]):
+        if self.controller:
+            self.controller.observe(event)
+
+    def current_task(self) -> Optional[TrackTask]:
+        """The track the calling worker thread is downloading, if any."""
+        return getattr(self._local, "task", None)
+
+    def record_stage(self, stage: str, seconds: float, task: Any = None):
+        """Add a span to the metrics, by default for the worker thread's track."""
+        if self.metrics:
+            task = task or self.current_task()
+            self.metrics.record(stage, seconds, task)
+
+    def register_process(self, process: Any):
+        with self._lock:
+            self._processes.add(process)
+            stopped = self.stopped
+        if stopped:
+            stop_processes([process])
+
+    def unregister_process(self, process: Any):
+        with self._lock:
+            self._processes.discard(process)
+
+    def set_state(self, task: TrackTask, state: str, error: Optional[str] = None):
+        task.state = state
+        task.error = error
+        if self.retry and state == DONE:
+            self.retry.succeeded(task)
+        elif self.retry and state == FAILED:
+            self.retry.failed(task)
+        if self.controller and error and state in (PENDING, FAILED):
+            self.controller.record_error(error)
+        if self.metrics and state in (DONE, FAILED, CANCELLED):
+            self.metrics.record_state(state)
+        if self.on_state:
+            self.on_state(task)
+
+    def run(self, tasks: Iterable[TrackTask]) -> List[TrackTask]:
+        results: List[TrackTask] = []
+        source = iter(tasks)
+        max_workers = self.concurrency
+        if self.controller:
+            self.controller.attach(self)
+            max_workers = max(max_workers, self.controller.maximum)
+
+        with ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="track"
+        ) as executor:
+            try:
+                while True:
+                    task = self._next_task(source, results)
+                    if task is None:
+                        break
+
+                    # Only pull the next task once a worker is free so that
+                    # generators are consumed lazily. The limit may change
+                    # while waiting when a controller is attached.
+                    started = False
+                    with self._cond:
+                        while self._active >= self.limit and not self.stopped:
+                            self._cond.wait(0.2)
+                        if not self.stopped:
+                            self._active += 1
+                            started = True
+                    # The shared slot is taken last, so a pool never holds
+                    # one while it waits for a worker of its own.
+                    if started and self.gate:
+                        if not self.gate.acquire(self.stop_event):
+                            self._release_worker()
+                            started = False
+                    if not started:
+                        self.set_state(task, CANCELLED)
+                        continue
+
+                    future = executor.submit(self._run_task, task)
+                    future.add_done_callback(self._task_done)
+            except KeyboardInterrupt:
+                # The process groups do not get the terminal's Ctrl+C, they
+                # have to be gone before the app exits.
+                self.stop(wait=True)
+                raise
+
+        return results
+
+    def _next_task(self, source: Any, results: List[TrackTask]) -> Optional[TrackTask]:
+        # New tasks always come first, failed ones are retried at the back of
+        # the queue once their backoff has expired. After a stop nothing more
+        # is pulled from the source, tracks never listed get no state at all.
+        task = None if self.stopped else next(source, None)
+        if task is not None:
+            results.append(task)
+            if not self.stopped:
+                task.queued_at = time.monotonic()
+                return task
+            self.set_state(task, CANCELLED)
+
+        with self._cond:
+            while self._retries or self._active:
+                if self.stopped:
+                    break
+                if self._retries and self._retries[0][0] <= time.monotonic():
+                    due, _, task = heapq.heappop(self._retries)
+                    # Backoff is not queueing, the wait starts once it is due.
+                    task.queued_at = due
+                    return task
+                timeout = 0.2
+                if self._retries:
+                    timeout = min(timeout, self._retries[0][0] - time.monotonic())
+                self._cond.wait(max(0.0, timeout))
+
+            retries, self._retries = self._retries, []
+        for _, _, task in retries:
+            self.set_state(task, CANCELLED)
+        return None
+
+    def _task_done(self, _):
+        if self.gate:
+            self.gate.release()
+        self._release_worker()
+
+    def _release_worker(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    def _run_task(self, task: TrackTask):
+        if self.stopped:
+            self.set_state(task, CANCELLED)
+            return
+
+        if task.queued_at is not None:
+            self.record_stage(STAGE_QUEUE, time.monotonic() - task.queued_at, task)
+            task.queued_at = None
+
+        task.attempts += 1
+        # download_fn sets RESOLVING or DOWNLOADING itself, only it knows
+        # whether the track needs a search first.
+        self._local.task = task
+        try:
+            ok = self.download_fn(task, self)
+        except Exception as e:
+            task.error = str(e)
+            ok = False
+        finally:
+            self._local.task = None
+
+        # The state is not checked here, the later stage may already have
+        # set the final one.
+        if ok == HANDED_OFF:
+            return
+
+        if ok:
+            self.set_state(task, DONE)
+        elif self.stopped:
+            self.set_state(task, CANCELLED)
+        else:
+            delay = self.retry.next_delay(task) if self.retry else None
+            if delay is None:
+                self.set_state(task, FAILED, task.error)
+            else:
+                self._schedule_retry(task, delay)
+
+    def _schedule_retry(self, task: TrackTask, delay: float):
+        self.set_state(task, PENDING, task.error)
+        with self._cond:
+            heapq.heappush(
+                self._retries,
+                (time.monotonic() + delay, next(self._sequence), task),
+            )
+            self._cond.notify_all()
+
+    def stop(self, wait: bool = False):
+        """Cancel every track and signal the running processes.
+
+        Returns at once: processes that have not exited after STOP_TIMEOUT
+        are killed by a background watcher, which wait joins.
+        """
+        self.stop_event.set()
+        with self._cond:
+            self._cond.notify_all()
+        with self._lock:
+            processes = list(self._processes)
+
+        watcher = stop_processes(processes)
+        if wait:
+            watcher.join()
+
+    def counts(self, tasks: Iterable[TrackTask]) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for task in tasks:
+            counts[task.state] = counts.get(task.state, 0) + 1
+        return counts
+
+
+def clamp_concurrency(value: Any) -> int:
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_CONCURRENCY
+    return max(1, min(MAX_CONCURRENCY, value))
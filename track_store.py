@@ -0,0 +1,163 @@
+import os
+import shutil
+import threading
+from typing import List, Optional, Tuple
+
+
+STORE_DIR = ".tracks"
+KIND_SPOTIFY = "spotify"
+KIND_YOUTUBE = "youtube"
+PARTIAL_SUFFIX = ".tmp"
+
+
+def place_link(source: str, target: str) -> str:
+    """Hardlink source at target, else symlink it.
+
+    Raises OSError where neither works, a copy would store the track twice.
+    """
+    try:
+        os.link(source, target)
+        return target
+    except OSError:
+        pass
+    try:
+        # Absolute, so the link survives being moved to _archive.
+        os.symlink(os.path.abspath(source), target)
+    except NotImplementedError as e:
+        raise OSError(str(e)) from e
+    return target
+
+
+class SharedTrackStore:
+    """One copy of every downloaded track, shared by all playlist folders.
+
+    Files live in <output>/.tracks/<format>/<spotify|youtube>/<id>/ under
+    their display name, and playlist folders get links to them. Both the
+    Spotify track ID and the YouTube video ID lead to the same file, so a
+    track is reused even when another playlist has it under a different
+    Spotify ID (album and single releases) that matched the same video.
+
+    Where the filesystem has neither hardlinks nor symlinks the store turns
+    itself off and downloads stay in their playlist folders.
+    """
+
+    def __init__(self, root: str, audio_format: str):
+        self.directory = os.path.join(root, STORE_DIR, audio_format)
+        self.enabled = True
+        self._lock = threading.Lock()
+
+    def link_track(self, track_id: Optional[str], folder: str) -> Optional[str]:
+        """Link the stored file for a Spotify track into folder, if there is one."""
+        if not self.enabled:
+            return None
+        stored = self._find(KIND_SPOTIFY, track_id)
+        return self._link_into(stored, folder) if stored else None
+
+    def link_video(
+        self, video_id: Optional[str], folder: str, track_id: Optional[str] = None
+    ) -> Optional[str]:
+        """Link the stored file for a YouTube video into folder, if there is one.
+
+        The Spotify track is recorded as another key for the file, so the
+        next playlist holding it needs no search either.
+        """
+        stored = self._find(KIND_YOUTUBE, video_id) if self.enabled else None
+        if not stored:
+            return None
+        path = self._link_into(stored, folder)
+        if path and track_id:
+            self._add_keys(stored, [(KIND_SPOTIFY, track_id)])
+        return path
+
+    def add(
+        self,
+        path: str,
+        track_id: Optional[str] = None,
+        video_id: Optional[str] = None,
+    ):
+        """Take a finished download into the store, leaving a link in its place."""
+        keys = [(KIND_SPOTIFY, track_id), (KIND_YOUTUBE, video_id)]
+        keys = [(kind, key) for kind, key in keys if key]
+        if not keys or not os.path.isfile(path) or os.path.islink(path):
+            return
+
+        with self._lock:
+            if not self.enabled:
+                return
+            primary = None
+            for kind, key in keys:
+                primary = primary or self._find(kind, key)
+            try:
+                if primary is None:
+                    primary = self._adopt(path, *keys[0])
+                self._add_keys(primary, keys)
+            except OSError:
+                pass
+
+    def _adopt(self, path: str, kind: str, key: str) -> str:
+        directory = self._entry_dir(kind, key)
+        os.makedirs(directory, exist_ok=True)
+        target = os.path.join(directory, os.path.basename(path))
+        try:
+            os.link(path, target)
+            return target
+        except OSError:
+            pass
+
+        # No hardlinks on this filesystem: the store keeps the file and the
+        # playlist folder gets a symlink back to it.
+        shutil.move(path, target)
+        try:
+            os.symlink(os.path.abspath(target), path)
+        except (OSError, NotImplementedError) as e:
+            # No symlinks either (FAT/exFAT, Android's /sdcard): the file
+            # goes back, a store of copies would only double the space used.
+            shutil.move(target, path)
+            self.enabled = False
+            try:
+                os.rmdir(directory)
+            except OSError:
+                pass
+            raise OSError(f"no links on this filesystem: {e}") from e
+        return target
+
+    def _add_keys(self, stored: str, keys: List[Tuple[str, str]]):
+        for kind, key in keys:
+            if self._find(kind, key):
+                continue
+            directory = self._entry_dir(kind, key)
+            os.makedirs(directory, exist_ok=True)
+            place_link(stored, os.path.join(directory, os.path.basename(stored)))
+
+    def _link_into(self, stored: str, folder: str) -> Optional[str]:
+        name, ext = os.path.splitext(os.path.basename(stored))
+        target = os.path.join(folder, name + ext)
+        try:
+            if os.path.exists(target):
+                if os.path.samefile(stored, target):
+                    return target
+                # Another track with the same title already has the name.
+                key = os.path.basename(os.path.dirname(stored))
+                target = os.path.join(folder, f"{name} ({key}){ext}")
+                if os.path.exists(target):
+                    return target
+            return place_link(stored, target)
+        except OSError:
+            return None
+
+    def _entry_dir(self, kind: str, key: str) -> str:
+        return os.path.join(self.directory, kind, key)
+
+    def _find(self, kind: str, key: Optional[str]) -> Optional[str]:
+        if not key:
+            return None
+        directory = self._entry_dir(kind, key)
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return None
+        for name in names:
+            path = os.path.join(directory, name)
+            if not name.endswith(PARTIAL_SUFFIX) and os.path.exists(path):
+                return path
+        return None
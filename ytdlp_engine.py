@@ -0,0 +1,914 @@
+import importlib.util
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from async_engine import (
+    EVENT_EXIT,
+    EVENT_LINE,
+    engine_loop,
+    run_process,
+    stream_process,
+)
+from process_group import remove_partial_files
+from stage_metrics import (
+    POSTPROCESSOR_STAGES,
+    STAGE_DOWNLOAD,
+    STAGE_EXTRACT,
+    STAGE_POSTPROCESS,
+    STAGE_TRANSCODE,
+)
+from throttle import TokenBucket
+from tool_probe import tool_version
+from track_pool import MAX_CONCURRENCY
+
+
+# Imported on first in-process download, loading it takes about as long as
+# the rest of the app's startup.
+yt_dlp: Any = None
+
+# Fetch the audio stream of parallel video downloads. The threads live on,
+# so the in-process engine's per-thread sessions are reused.
+_stream_helpers: Optional[ThreadPoolExecutor] = None
+_stream_helpers_lock = threading.Lock()
+
+
+ENGINE_AUTO = "auto"
+ENGINE_INPROCESS = "inprocess"
+ENGINE_SUBPROCESS = "subprocess"
+ENGINE_CHOICES = [ENGINE_AUTO, ENGINE_INPROCESS, ENGINE_SUBPROCESS]
+
+AUDIO_MP3 = "mp3"
+AUDIO_M4A = "m4a"
+AUDIO_OPUS = "opus"
+AUDIO_ORIGINAL = "original"
+AUDIO_FORMATS = [AUDIO_MP3, AUDIO_M4A, AUDIO_OPUS, AUDIO_ORIGINAL]
+
+# Stream selection per output format. For everything except mp3 the chosen
+# stream is only remuxed, so the selector prefers a source in that codec.
+AUDIO_SELECTORS = {
+    AUDIO_MP3: "bestaudio/best",
+    AUDIO_M4A: "bestaudio[ext=m4a]/bestaudio/best",
+    AUDIO_OPUS: "bestaudio[acodec=opus]/bestaudio/best",
+    AUDIO_ORIGINAL: "bestaudio/best",
+}
+
+VIDEO_SELECTOR = "bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best"
+
+# Video downloads fetch the two halves of VIDEO_SELECTOR as separate
+# downloads side by side and merge them afterwards. STREAM_MERGED leaves
+# fetching and merging to yt-dlp, which downloads the formats one by one.
+STREAM_VIDEO = "video"
+STREAM_AUDIO = "audio"
+STREAM_MERGED = "merged"
+STREAM_SELECTORS = {
+    STREAM_VIDEO: "bestvideo[ext=mp4]",
+    STREAM_AUDIO: "bestaudio[ext=m4a]",
+}
+STREAM_FILE = re.compile(r"\.(video|audio)\.[^.]+$")
+
+DEFAULT_FRAGMENTS = 4
+MAX_FRAGMENTS = 16
+# Connections per file for external downloaders when none are configured.
+DOWNLOADER_ARGS = {"aria2c": "-x 16 -s 16 -k 1M"}
+MIB = 1024 * 1024
+
+PROGRESS_TEMPLATE = 'download:{"id":%(info.id)j,"progress":%(progress)j}'
+POSTPROCESS_TEMPLATE = (
+    'postprocess:{"postprocess":%(progress.status)j,'
+    '"postprocessor":%(progress.postprocessor)j,'
+    '"id":%(info.id)j,"title":%(info.title)j,"filepath":%(info.filepath)j}'
+)
+
+# Events of ytdlp_events besides async_engine's EVENT_LINE and EVENT_EXIT.
+EVENT_PROGRESS = "progress"
+EVENT_POSTPROCESS = "postprocess"
+
+LineCallback = Optional[Callable[[str], None]]
+ProgressCallback = Optional[Callable[[Dict[str, Any]], None]]
+
+
+class DownloadCancelled(Exception):
+    pass
+
+
+class SearchError(Exception):
+    pass
+
+
+class DownloadResult:
+    def __init__(self, ok: bool = False):
+        self.ok = ok
+        self.video_id: Optional[str] = None
+        self.title: Optional[str] = None
+        self.filepath: Optional[str] = None
+        self.error: Optional[str] = None
+        self.timings: Dict[str, float] = {}
+        # Throughput of each stream when video and audio were fetched apart.
+        self.streams: Dict[str, Dict[str, float]] = {}
+        # Every file the download wrote to, for cleaning up after a cancel.
+        self.files: Set[str] = set()
+        self._started = time.monotonic()
+        self._first_progress: Optional[float] = None
+        self._postprocessing: Dict[str, float] = {}
+
+    def __bool__(self) -> bool:
+        return self.ok
+
+    def progressed(self, filename: Optional[str] = None):
+        if filename:
+            self.files.add(filename)
+        if self._first_progress is None:
+            self._first_progress = time.monotonic()
+
+    def finish(self) -> Dict[str, float]:
+        """Time spent per stage: page extraction until the first progress
+        report, then the transfer, then each postprocessor."""
+        now = time.monotonic()
+        extract = (self._first_progress or now) - self._started
+        postprocess = sum(self.timings.values())
+        self.timings[STAGE_EXTRACT] = extract
+        self.timings[STAGE_DOWNLOAD] = max(
+            0.0, now - self._started - extract - postprocess
+        )
+        return self.timings
+
+    def record(self, event: Dict[str, Any]):
+        name = event.get("postprocessor")
+        if event.get("postprocess") == "started":
+            self._postprocessing[name] = time.monotonic()
+        elif event.get("postprocess") == "finished" and name in self._postprocessing:
+            stage = POSTPROCESSOR_STAGES.get(name, STAGE_POSTPROCESS)
+            elapsed = time.monotonic() - self._postprocessing.pop(name)
+            self.timings[stage] = self.timings.get(stage, 0.0) + elapsed
+
+        # MoveFiles is the last postprocessor to run and reports the final path.
+        if event.get("postprocess") == "finished" and event.get("id"):
+            self.video_id = event["id"]
+            self.title = event.get("title") or self.title
+            if event.get("postprocessor") == "MoveFiles" or not self.filepath:
+                self.filepath = event.get("filepath")
+
+
+class VideoOptions:
+    """How video downloads move their data."""
+
+    def __init__(
+        self,
+        fragments: int = DEFAULT_FRAGMENTS,
+        downloader: str = "",
+        downloader_args: str = "",
+        parallel_streams: bool = True,
+    ):
+        self.fragments = parse_fragments(fragments)
+        self.downloader = downloader.strip()
+        self.downloader_args = downloader_args.strip() or DOWNLOADER_ARGS.get(
+            self.downloader, ""
+        )
+        self.parallel_streams = parallel_streams
+
+    def args(self) -> List[str]:
+        # DASH and HLS formats come in fragments, fetched N at a time.
+        args = ["--concurrent-fragments", str(self.fragments)]
+        # An external downloader that is not installed is skipped rather
+        # than failing every download.
+        if self.downloader and tool_version(self.downloader) is not None:
+            args.extend(["--downloader", self.downloader])
+            if self.downloader_args:
+                args.extend(
+                    ["--downloader-args", f"{self.downloader}:{self.downloader_args}"]
+                )
+        return args
+
+
+def parse_fragments(value: Any) -> int:
+    try:
+        fragments = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_FRAGMENTS
+    return max(1, min(MAX_FRAGMENTS, fragments))
+
+
+def build_args(
+    output_path: str,
+    is_video: bool = False,
+    fetch_only: bool = False,
+    audio_format: str = AUDIO_MP3,
+    video: Optional[VideoOptions] = None,
+    stream: Optional[str] = None,
+) -> List[str]:
+    # Fetch-only downloads land in a staging area under the video ID and are
+    # converted and tagged afterwards by the transcode pipeline.
+    name = "%(id)s.%(ext)s" if fetch_only else "%(title)s.%(ext)s"
+    if is_video and stream in STREAM_SELECTORS:
+        # Kept apart until merged, like yt-dlp's own .f<format> files.
+        name = f"%(title)s.{stream}.%(ext)s"
+    output_template = os.path.join(output_path, name)
+    selector = AUDIO_SELECTORS.get(audio_format, AUDIO_SELECTORS[AUDIO_MP3])
+
+    # Interrupted downloads keep their .part file, which the next attempt at
+    # the same video continues instead of starting over.
+    args = [
+        "--newline",
+        "--continue",
+        "--part",
+        "--progress-template",
+        PROGRESS_TEMPLATE,
+        "--progress-template",
+        POSTPROCESS_TEMPLATE,
+        "--no-playlist",
+        "-o",
+        output_template,
+    ]
+
+    if fetch_only:
+        args.extend(
+            [
+                "-f",
+                selector,
+                "--write-thumbnail",
+                "--convert-thumbnails",
+                "jpg",
+            ]
+        )
+    elif is_video:
+        if stream in STREAM_SELECTORS:
+            args.extend(["-f", STREAM_SELECTORS[stream]])
+        else:
+            args.extend(["-f", VIDEO_SELECTOR, "--merge-output-format", "mp4"])
+        args.extend((video or VideoOptions()).args())
+    else:
+        args.extend(["-f", selector, "-x"])
+        if audio_format == AUDIO_MP3:
+            args.extend(["--audio-format", "mp3", "--audio-quality", "192K"])
+        elif audio_format in (AUDIO_M4A, AUDIO_OPUS):
+            args.extend(["--audio-format", audio_format])
+        else:
+            args.extend(["--audio-format", "best"])
+
+        # Ogg/Opus cover art needs mutagen, so only embed it where ffmpeg can.
+        if audio_format in (AUDIO_MP3, AUDIO_M4A):
+            args.append("--embed-thumbnail")
+
+        args.extend(
+            [
+                "--add-metadata",
+                "--embed-metadata",
+                "--parse-metadata",
+                "title:%(artist)s - %(title)s",
+                "--prefer-ffmpeg",
+            ]
+        )
+
+    return args
+
+
+def metadata_args(metadata: Optional[Dict[str, str]]) -> List[str]:
+    args: List[str] = []
+    for key, value in (metadata or {}).items():
+        value = value.replace("%", "%%").replace(":", "\\:")
+        args.extend(["--parse-metadata", f"{value}:(?P<meta_{key}>.+)"])
+    return args
+
+
+def search_target(query: str, count: int = 1) -> str:
+    return f"ytsearch{count}:{query} official audio"
+
+
+def search_entry(entry: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": entry.get("id"),
+        "title": entry.get("title") or "",
+        "duration": entry.get("duration"),
+        "channel": entry.get("channel") or entry.get("uploader") or "",
+        "description": entry.get("description") or "",
+    }
+
+
+def record_timings(result: DownloadResult, pool: Any, task: Any = None):
+    for stage, seconds in result.finish().items():
+        pool.record_stage(stage, seconds, task)
+
+
+def stream_helpers() -> ThreadPoolExecutor:
+    global _stream_helpers
+    with _stream_helpers_lock:
+        if _stream_helpers is None:
+            _stream_helpers = ThreadPoolExecutor(
+                max_workers=MAX_CONCURRENCY, thread_name_prefix="audio-stream"
+            )
+        return _stream_helpers
+
+
+class StreamMeter:
+    """Bytes and transfer time of one stream of a video download."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.bytes = 0
+        self._started: Optional[float] = None
+        self._last: Optional[float] = None
+
+    def wrap(self, on_progress: ProgressCallback) -> ProgressCallback:
+        def observe(event: Dict[str, Any]):
+            event["stream"] = self.name
+            if event.get("status") == "downloading":
+                now = time.monotonic()
+                self._started = self._started or now
+                self._last = now
+                downloaded = event["progress"].get("downloaded_bytes") or 0
+                self.bytes = max(self.bytes, downloaded)
+            if on_progress:
+                on_progress(event)
+
+        return observe
+
+    def summary(self) -> Dict[str, float]:
+        seconds = self._last - self._started if self._started else 0.0
+        rate = self.bytes / seconds if seconds else 0.0
+        return {
+            "bytes": self.bytes,
+            "seconds": round(seconds, 3),
+            "bytes_per_second": round(rate),
+        }
+
+    def describe(self) -> str:
+        summary = self.summary()
+        return (
+            f"{self.name.capitalize()} stream: {self.bytes / MIB:.1f} MiB in "
+            f"{summary['seconds']:.1f}s ({summary['bytes_per_second'] / MIB:.2f} MiB/s)"
+        )
+
+
+def download_streams(
+    engine: Any,
+    target: str,
+    output_path: str,
+    on_line: LineCallback = None,
+    on_progress: ProgressCallback = None,
+    pool: Any = None,
+) -> DownloadResult:
+    """Download the video and audio streams side by side, then merge them.
+
+    Falls back to yt-dlp's own download and merge when the site does not
+    offer the two as separate mp4/m4a streams or ffmpeg is missing.
+    """
+
+    def merged() -> DownloadResult:
+        return engine.download(
+            target, output_path, True, on_line, on_progress, pool, stream=STREAM_MERGED
+        )
+
+    if tool_version("ffmpeg", ("-version",)) is None:
+        return merged()
+
+    meters = {name: StreamMeter(name) for name in STREAM_SELECTORS}
+    # The helper thread is not the pool worker, its timings need the track.
+    task = pool.current_task() if pool else None
+
+    def fetch(name: str) -> DownloadResult:
+        return engine.download(
+            target,
+            output_path,
+            True,
+            on_line,
+            meters[name].wrap(on_progress),
+            pool,
+            stream=name,
+            task=task,
+        )
+
+    audio = stream_helpers().submit(fetch, STREAM_AUDIO)
+    try:
+        video = fetch(STREAM_VIDEO)
+    finally:
+        # Never leave the audio download running unattended.
+        audio_result = audio.result()
+
+    parts = [video, audio_result]
+    if pool and pool.stopped:
+        result = DownloadResult()
+        for part in parts:
+            if part:
+                result.files |= part.files
+                if part.filepath:
+                    result.files.add(part.filepath)
+        # One stream may have finished before the other was cancelled.
+        discard_partial(result, pool, completed=True)
+        return result
+    if not all(part and part.filepath for part in parts):
+        for part in parts:
+            if part and part.filepath:
+                _remove(part.filepath)
+        if on_line:
+            on_line("No separate video and audio streams, downloading them together")
+        return merged()
+
+    result = merge_streams(parts[0], parts[1], on_line, pool)
+    result.streams = {name: meter.summary() for name, meter in meters.items()}
+    if on_line:
+        for meter in meters.values():
+            on_line(meter.describe())
+    return result
+
+
+def merge_streams(
+    video: DownloadResult,
+    audio: DownloadResult,
+    on_line: LineCallback = None,
+    pool: Any = None,
+) -> DownloadResult:
+    result = DownloadResult()
+    result.video_id = video.video_id
+    result.title = video.title
+    result.filepath = STREAM_FILE.sub("", video.filepath) + ".mp4"
+    partial = STREAM_FILE.sub("", video.filepath) + ".temp.mp4"
+    if on_line:
+        on_line(f'[Merger] Merging formats into "{result.filepath}"')
+
+    command = ["ffmpeg", "-y", "-loglevel", "error", "-i", video.filepath]
+    command += ["-i", audio.filepath, "-map", "0:v:0", "-map", "1:a:0"]
+    command += ["-c", "copy", "-movflags", "+faststart", partial]
+    started = time.monotonic()
+    try:
+        returncode, _, stderr = run_process(command, pool)
+    finally:
+        if pool:
+            pool.record_stage(STAGE_TRANSCODE, time.monotonic() - started)
+
+    if returncode == 0:
+        os.replace(partial, result.filepath)
+        _remove(video.filepath)
+        _remove(audio.filepath)
+        result.ok = True
+    else:
+        lines = stderr.strip().splitlines()
+        result.error = (
+            f"ERROR: Merging the streams failed: {lines[-1] if lines else returncode}"
+        )
+        # A retry fetches the streams again, left here they would only
+        # clutter the output folder.
+        for path in (partial, video.filepath, audio.filepath):
+            _remove(path)
+    return result
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def discard_partial(result: DownloadResult, pool: Any, completed: bool = False):
+    """Delete what a cancelled download left behind.
+
+    Pools that resume their tracks later (keep_partial) keep the .part files.
+    completed also removes finished files, for a download that was cut off
+    halfway through its steps.
+    """
+    if result.ok or not (pool and pool.stopped):
+        return
+    if getattr(pool, "keep_partial", False):
+        return
+    remove_partial_files(result.files)
+    if completed:
+        for path in result.files:
+            _remove(path)
+
+
+async def ytdlp_events(
+    command: List[str], pool: Any = None
+) -> AsyncIterator[Tuple[str, Any]]:
+    """The output of a yt-dlp command run with build_args, as events.
+
+    (EVENT_PROGRESS, progress_event), (EVENT_POSTPROCESS, data) for the
+    JSON lines, (EVENT_LINE, text) for everything else and finally
+    (EVENT_EXIT, exit code).
+    """
+    async for kind, value in stream_process(command, pool):
+        if kind == EVENT_LINE:
+            value = value.strip()
+            if not value:
+                continue
+            if value.startswith("{") and value.endswith("}"):
+                try:
+                    data = json.loads(value)
+                except json.JSONDecodeError:
+                    data = None
+
+                if data is not None:
+                    if "postprocess" in data:
+                        yield EVENT_POSTPROCESS, data
+                    else:
+                        event = progress_event(data.get("progress", {}), data.get("id"))
+                        yield EVENT_PROGRESS, event
+                    continue
+        yield kind, value
+
+
+def download_events(command: List[str], pool: Any = None) -> Iterator[Tuple[str, Any]]:
+    """ytdlp_events for a worker thread, the output is read on the engine loop."""
+    return engine_loop.iterate(lambda: ytdlp_events(command, pool))
+
+
+def video_url(video_id: str) -> str:
+    return f"https://www.youtube.com/watch?v={video_id}"
+
+
+def progress_event(
+    status: Dict[str, Any], video_id: Optional[str] = None
+) -> Dict[str, Any]:
+    total = status.get("total_bytes") or status.get("total_bytes_estimate")
+    downloaded = status.get("downloaded_bytes") or 0
+    percent = downloaded * 100.0 / total if total else 0.0
+    eta = status.get("eta")
+    speed = status.get("speed")
+
+    return {
+        "status": status.get("status"),
+        "filename": status.get("filename"),
+        "video_id": video_id or (status.get("info_dict") or {}).get("id"),
+        "progress": {
+            "percent": percent,
+            "speed": speed if speed is not None else "N/A",
+            "eta": eta if eta is not None else "N/A",
+            "downloaded_bytes": downloaded,
+            "total_bytes": total,
+        },
+    }
+
+
+class SubprocessEngine:
+    name = ENGINE_SUBPROCESS
+
+    def __init__(
+        self,
+        audio_format: str = AUDIO_MP3,
+        rate_limit: float = 0.0,
+        video: Optional[VideoOptions] = None,
+    ):
+        self.audio_format = audio_format
+        self.limiter = TokenBucket(rate_limit) if rate_limit else None
+        self.video = video or VideoOptions()
+
+    def download(
+        self,
+        target: str,
+        output_path: str,
+        is_video: bool = False,
+        on_line: LineCallback = None,
+        on_progress: ProgressCallback = None,
+        pool: Any = None,
+        metadata: Optional[Dict[str, str]] = None,
+        fetch_only: bool = False,
+        stream: Optional[str] = None,
+        task: Any = None,
+    ) -> DownloadResult:
+
+        if is_video and stream is None and self.video.parallel_streams:
+            return download_streams(
+                self, target, output_path, on_line, on_progress, pool
+            )
+
+        result = DownloadResult()
+        command = ["yt-dlp"]
+        command += build_args(
+            output_path, is_video, fetch_only, self.audio_format, self.video, stream
+        )
+        if self.limiter:
+            # A separate process cannot draw from the shared bucket, so each
+            # one is capped at its share of the limit when it starts.
+            share = self.limiter.share(pool.active if pool else 1)
+            if stream in STREAM_SELECTORS:
+                share /= len(STREAM_SELECTORS)
+            command += ["--limit-rate", str(int(share))]
+        command += metadata_args(metadata) + [target]
+        if on_line:
+            on_line(f"Executing command: {' '.join(command)}")
+
+        try:
+            for kind, value in download_events(command, pool):
+                if kind == EVENT_PROGRESS:
+                    result.progressed(value["filename"])
+                    if pool:
+                        pool.observe_progress(value)
+                    if on_progress:
+                        on_progress(value)
+                elif kind == EVENT_POSTPROCESS:
+                    result.record(value)
+                elif kind == EVENT_EXIT:
+                    result.ok = value == 0
+                else:
+                    if value.startswith("ERROR"):
+                        result.error = value
+                    if on_line:
+                        on_line(value)
+            return result
+        finally:
+            if pool:
+                record_timings(result, pool, task)
+                discard_partial(result, pool)
+
+    def search(self, query: str, count: int, pool: Any = None) -> List[Dict[str, Any]]:
+        """Metadata of the top search results, nothing is downloaded."""
+        command = ["yt-dlp", "--flat-playlist", "-J", "--no-warnings"]
+        command.append(search_target(query, count))
+
+        returncode, stdout, stderr = run_process(command, pool)
+        if returncode != 0:
+            lines = stderr.strip().splitlines()
+            raise SearchError(
+                lines[-1] if lines else f"yt-dlp exited with {returncode}"
+            )
+        try:
+            info = json.loads(stdout)
+        except ValueError:
+            raise SearchError("ERROR: yt-dlp returned no search results")
+        return [search_entry(e) for e in info.get("entries") or [] if e and e.get("id")]
+
+
+class _EngineLogger:
+    def __init__(self):
+        self.on_line: LineCallback = None
+        self.last_error: Optional[str] = None
+
+    def debug(self, message: str):
+        if self.on_line and not message.startswith("[debug] "):
+            self.on_line(message)
+
+    def info(self, message: str):
+        self.debug(message)
+
+    def warning(self, message: str):
+        if self.on_line:
+            if not message.startswith("WARNING"):
+                message = f"WARNING: {message}"
+            self.on_line(message)
+
+    def error(self, message: str):
+        if not message.startswith("ERROR"):
+            message = f"ERROR: {message}"
+        self.last_error = message
+        if self.on_line:
+            self.on_line(message)
+
+
+def _load_yt_dlp() -> Any:
+    global yt_dlp
+    if yt_dlp is None:
+        import yt_dlp as module
+
+        yt_dlp = module
+    return yt_dlp
+
+
+_metadata_pp_class: Any = None
+
+
+def _metadata_postprocessor(session: "_Session") -> Any:
+    # The base class lives in yt_dlp, so the class is only defined once the
+    # module has been loaded.
+    global _metadata_pp_class
+    if _metadata_pp_class is None:
+
+        class MetadataPP(yt_dlp.postprocessor.PostProcessor):
+            def __init__(self, session: "_Session"):
+                super().__init__()
+                self.session = session
+
+            def run(self, info: Dict[str, Any]):
+                for key, value in self.session.metadata.items():
+                    info[f"meta_{key}"] = value
+                return [], info
+
+        _metadata_pp_class = MetadataPP
+    return _metadata_pp_class(session)
+
+
+class _Session:
+    def __init__(
+        self,
+        output_path: str,
+        is_video: bool,
+        fetch_only: bool,
+        audio_format: str,
+        video: Optional[VideoOptions] = None,
+        stream: Optional[str] = None,
+    ):
+        self.logger = _EngineLogger()
+        self.on_progress: ProgressCallback = None
+        self.pool: Any = None
+        self.result: Optional[DownloadResult] = None
+        self.metadata: Dict[str, str] = {}
+        self.limiter: Optional[TokenBucket] = None
+        self.downloaded: Dict[str, int] = {}
+
+        _load_yt_dlp()
+        args = build_args(
+            output_path, is_video, fetch_only, audio_format, video, stream
+        )
+        options = yt_dlp.parse_options(args).ydl_opts
+        options.update({"quiet": True, "noprogress": True, "logger": self.logger})
+
+        self.ydl = yt_dlp.YoutubeDL(options)
+        self.ydl.add_progress_hook(self._progress_hook)
+        self.ydl.add_postprocessor_hook(self._postprocessor_hook)
+        self.ydl.add_post_processor(_metadata_postprocessor(self), when="pre_process")
+
+    def _check_cancelled(self):
+        if self.pool and self.pool.stopped:
+            raise DownloadCancelled("Download cancelled")
+
+    def _progress_hook(self, status: Dict[str, Any]):
+        self._check_cancelled()
+        if self.limiter and status.get("status") == "downloading":
+            self._throttle(status)
+
+        event = progress_event(status)
+        if self.result is not None:
+            self.result.progressed(event["filename"])
+        if self.pool:
+            self.pool.observe_progress(event)
+        if self.on_progress:
+            self.on_progress(event)
+
+    def _throttle(self, status: Dict[str, Any]):
+        # Sleeping in the hook holds up the download loop that called it, so
+        # every in-process download draws from the one shared bucket.
+        filename = status.get("filename") or ""
+        downloaded = status.get("downloaded_bytes") or 0
+        delta = downloaded - self.downloaded.get(filename, 0)
+        self.downloaded[filename] = downloaded
+        if delta > 0:
+            self.limiter.consume(delta, self.pool.stop_event if self.pool else None)
+            self._check_cancelled()
+
+    def _postprocessor_hook(self, status: Dict[str, Any]):
+        self._check_cancelled()
+        if self.result is not None:
+            info = status.get("info_dict") or {}
+            self.result.record(
+                {
+                    "postprocess": status.get("status"),
+                    "postprocessor": status.get("postprocessor"),
+                    "id": info.get("id"),
+                    "title": info.get("title"),
+                    "filepath": info.get("filepath"),
+                }
+            )
+
+
+class InProcessEngine:
+    name = ENGINE_INPROCESS
+
+    def __init__(
+        self,
+        audio_format: str = AUDIO_MP3,
+        rate_limit: float = 0.0,
+        video: Optional[VideoOptions] = None,
+    ):
+        if not inprocess_available():
+            raise RuntimeError("The yt_dlp module is not installed")
+
+        self.audio_format = audio_format
+        self.limiter = TokenBucket(rate_limit) if rate_limit else None
+        self.video = video or VideoOptions()
+
+        # YoutubeDL instances are not safe to share between concurrent
+        # downloads, so every worker thread keeps its own and reuses it (with
+        # its HTTP session and extractor caches) for every track it handles.
+        self._local = threading.local()
+
+    def _get_session(
+        self,
+        output_path: str,
+        is_video: bool,
+        fetch_only: bool,
+        stream: Optional[str] = None,
+    ) -> _Session:
+        sessions = getattr(self._local, "sessions", None)
+        if sessions is None:
+            sessions = self._local.sessions = {}
+
+        key = (output_path, is_video, fetch_only, stream)
+        if key not in sessions:
+            sessions[key] = _Session(
+                output_path,
+                is_video,
+                fetch_only,
+                self.audio_format,
+                self.video,
+                stream,
+            )
+        return sessions[key]
+
+    def search(self, query: str, count: int, pool: Any = None) -> List[Dict[str, Any]]:
+        """Metadata of the top search results, nothing is downloaded."""
+        ydl = getattr(self._local, "search_ydl", None)
+        if ydl is None:
+            _load_yt_dlp()
+            options = {
+                "quiet": True,
+                "no_warnings": True,
+                "extract_flat": "in_playlist",
+                "logger": _EngineLogger(),
+            }
+            ydl = self._local.search_ydl = yt_dlp.YoutubeDL(options)
+
+        try:
+            info = ydl.extract_info(search_target(query, count), download=False)
+        except yt_dlp.utils.DownloadError as e:
+            raise SearchError(str(e))
+        entries = (info or {}).get("entries") or []
+        return [search_entry(e) for e in entries if e and e.get("id")]
+
+    def download(
+        self,
+        target: str,
+        output_path: str,
+        is_video: bool = False,
+        on_line: LineCallback = None,
+        on_progress: ProgressCallback = None,
+        pool: Any = None,
+        metadata: Optional[Dict[str, str]] = None,
+        fetch_only: bool = False,
+        stream: Optional[str] = None,
+        task: Any = None,
+    ) -> DownloadResult:
+
+        if is_video and stream is None and self.video.parallel_streams:
+            return download_streams(
+                self, target, output_path, on_line, on_progress, pool
+            )
+
+        result = DownloadResult()
+        session = self._get_session(output_path, is_video, fetch_only, stream)
+        session.logger.on_line = on_line
+        session.logger.last_error = None
+        session.on_progress = on_progress
+        session.pool = pool
+        session.result = result
+        session.metadata = metadata or {}
+        session.limiter = self.limiter
+        session.downloaded = {}
+
+        try:
+            result.ok = session.ydl.download([target]) == 0
+        except DownloadCancelled:
+            pass
+        except yt_dlp.utils.DownloadError as e:
+            result.error = session.logger.last_error or f"ERROR: {e}"
+            if on_line and not session.logger.last_error:
+                on_line(result.error)
+        finally:
+            if not result.ok and not result.error:
+                result.error = session.logger.last_error
+            if pool:
+                record_timings(result, pool, task)
+                discard_partial(result, pool)
+            session.logger.on_line = None
+            session.on_progress = None
+            session.pool = None
+            session.result = None
+            session.metadata = {}
+            session.limiter = None
+
+        return result
+
+
+def inprocess_available() -> bool:
+    return yt_dlp is not None or importlib.util.find_spec("yt_dlp") is not None
+
+
+def create_engine(
+    name: str = ENGINE_AUTO,
+    audio_format: str = AUDIO_MP3,
+    rate_limit: float = 0.0,
+    video: Optional[VideoOptions] = None,
+) -> Any:
+    if audio_format not in AUDIO_FORMATS:
+        audio_format = AUDIO_MP3
+
+    if name == ENGINE_SUBPROCESS:
+        return SubprocessEngine(audio_format, rate_limit, video)
+    if name == ENGINE_INPROCESS or (name == ENGINE_AUTO and inprocess_available()):
+        try:
+            return InProcessEngine(audio_format, rate_limit, video)
+        except RuntimeError:
+            pass
+    return SubprocessEngine(audio_format, rate_limit, video)